@@ -7,6 +7,7 @@
 #include <iostream>
 #include <time.h>
 #include <signal.h>
+#include <errno.h>
 
 const char *SEM_READY = "/sem_ready";
 const char *SEM_START = "/sem_start";
@@ -32,6 +33,9 @@ static void timeout_handler(int sig, siginfo_t *si, void *uc)
 
 void init_semaphores()
 {
+    // Close handles from a previous barrier before opening the current semaphores
+    close_semaphores();
+
     // Initialize semaphores with total_processes
     ready = sem_open(SEM_READY, O_CREAT, 0644, 0); // Initial value: 0
     start = sem_open(SEM_START, O_CREAT, 0644, 0); // Initial value: 0
@@ -43,7 +47,7 @@ void init_semaphores()
     }
 
 #ifdef BARRIER_TIMEOUT
-    timer_t timeoutid;
+    passed_barrier = false;
     struct sigevent sevt;
     struct itimerspec itst;
     struct sigaction sat;
@@ -108,8 +112,10 @@ void wait_for_barrier(int total_processes)
         }
     }
 #endif
-    // Wait until the barrier is lifted
-    sem_wait(start);
+    // Wait until the barrier is lifted, signals must not release the barrier early
+    while (sem_wait(start) == -1 && errno == EINTR)
+    {
+    }
 
 #ifdef BARRIER_TIMEOUT
     passed_barrier = true;
@@ -121,10 +127,23 @@ void wait_for_barrier(int total_processes)
 #endif
 }
 
+void close_semaphores()
+{
+    if (ready != nullptr && ready != SEM_FAILED)
+    {
+        sem_close(ready);
+    }
+    if (start != nullptr && start != SEM_FAILED)
+    {
+        sem_close(start);
+    }
+    ready = nullptr;
+    start = nullptr;
+}
+
 void cleanup_semaphores()
 {
-    sem_close(ready);
-    sem_close(start);
+    close_semaphores();
 
     // Unlink semaphores when done
     sem_unlink(SEM_READY);
@@ -4,6 +4,8 @@
 
 void init_semaphores();
 void wait_for_barrier(int total_processes);
+// Closes this process' semaphore handles without unlinking them
+void close_semaphores();
 void cleanup_semaphores();
 
 #endif // BARRIER_SYNC_H
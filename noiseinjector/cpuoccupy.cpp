@@ -1,9 +1,17 @@
 #include <chrono>
 #include <cmath>
+#include <cstdint>
 #include <cstdlib>
+#include <cstring>
 #include <fstream>
 #include <iostream>
+#include <span>
+#include <vector>
 #include <unistd.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sched.h>
 #include <linux/prctl.h>
 #include <sys/prctl.h>
 #include <time.h>
@@ -15,11 +23,32 @@
 
 using json = nlohmann::json;
 
+// Packed so a binary noise schedule can be used in place after mmap
+#pragma pack(push, 1)
 struct Noise {
     signed long long start_time;
     signed long long duration;
     signed int priority;
 };
+#pragma pack(pop)
+static_assert(sizeof(Noise) == 20, "Noise must match the binary noise schedule record layout");
+
+// Binary noise schedule layout, written by scripts/noise_schedule.py
+const char SCHEDULE_MAGIC[8] = {'P', 'V', 'N', 'O', 'I', 'S', 'E', '1'};
+const uint32_t SCHEDULE_VERSION = 1;
+
+struct ScheduleHeader {
+    char magic[8];
+    uint32_t version;
+    uint32_t core_count;
+};
+
+struct ScheduleEntry {
+    int32_t core_id;
+    uint32_t reserved;
+    uint64_t offset;
+    uint64_t count;
+};
 
 #ifdef USE_TIMER
 static void handler(int sig, siginfo_t *si, void *uc) {
@@ -28,7 +57,34 @@ static void handler(int sig, siginfo_t *si, void *uc) {
 #endif
 bool should_exit = false;
 
-int cpuoccupy(const std::vector<Noise>& noises, int number_of_processes, std::string core_id) {
+// Set by the run_noise.py supervisor: SIGUSR1 re-arms the schedule for the next workload, SIGUSR2 stops the current one
+volatile sig_atomic_t rearm_requested = 0;
+volatile sig_atomic_t stop_requested = 0;
+
+void rearmHandler(int signum) {
+    rearm_requested = 1;
+}
+
+void stopHandler(int signum) {
+    stop_requested = 1;
+}
+
+// Sleeps until the supervisor re-arms this process. Returns false if the process should exit instead.
+bool waitForRearm() {
+    sigset_t rearm_mask, old_mask;
+    sigemptyset(&rearm_mask);
+    sigaddset(&rearm_mask, SIGUSR1);
+    sigprocmask(SIG_BLOCK, &rearm_mask, &old_mask);
+    while (!rearm_requested && !should_exit) {
+        sigsuspend(&old_mask);
+    }
+    rearm_requested = 0;
+    stop_requested = 0;
+    sigprocmask(SIG_SETMASK, &old_mask, nullptr);
+    return !should_exit;
+}
+
+int cpuoccupy(std::span<const Noise> noises, int number_of_processes, std::string core_id, bool supervised) {
     //Set seed
     int seed = rand();
     //auto ok = nice(-19);
@@ -75,12 +131,43 @@ int cpuoccupy(const std::vector<Noise>& noises, int number_of_processes, std::st
     }
     #endif
 
-    init_semaphores();
+    // Every supervised iteration starts from the initial scheduling policy
+    int initial_policy = sched_getscheduler(0);
+    struct sched_param initial_param;
+    sched_getparam(0, &initial_param);
+
+    if (supervised) {
+        // Keep the schedule resident between iterations
+        if (mlockall(MCL_CURRENT | MCL_FUTURE) == -1) {
+            perror("mlockall");
+        }
+        std::cout << "READY " << core_id << std::endl;
+    }
+
+    do {
+        if (supervised) {
+            if (!waitForRearm()) {
+                break;
+            }
+            if (sched_setscheduler(0, initial_policy, &initial_param) == -1) {
+                perror("sched_setscheduler");
+                return EXIT_FAILURE;
+            }
+        }
+
+        // Opens the semaphores of the current workload
+        init_semaphores();
+        if (supervised) {
+            std::cout << "ARMED " << core_id << std::endl;
+        }
 
-    // Sync up all processes to start at the same time.
-    wait_for_barrier(number_of_processes);
+        // Sync up all processes to start at the same time.
+        struct timespec barrier_arrive, barrier_release;
+        clock_gettime(CLOCK_MONOTONIC, &barrier_arrive);
+        wait_for_barrier(number_of_processes);
+        clock_gettime(CLOCK_MONOTONIC, &barrier_release);
     #ifdef LOOP
-    while(!should_exit){
+    while(!should_exit && !stop_requested){
     #endif
         auto total_delay = 0;
         auto max_delay = 0;
@@ -94,7 +181,7 @@ int cpuoccupy(const std::vector<Noise>& noises, int number_of_processes, std::st
         auto program_start_time = std::chrono::high_resolution_clock::now();
 
         for (const auto& noise : noises) { 
-            if(should_exit){
+            if(should_exit || stop_requested){
                 break;
             }
 
@@ -150,10 +237,13 @@ int cpuoccupy(const std::vector<Noise>& noises, int number_of_processes, std::st
                 start_t.tv_sec = std::floor(wait_time.count() / 1e9);
                 start_t.tv_nsec = std::fmod(wait_time.count(), 1e9);
                 //while (clock_nanosleep(CLOCK_MONOTONIC, 0, &start_t, &rem_t) != 0) {
-                while (nanosleep(&start_t, &rem_t) != 0) {
+                while (nanosleep(&start_t, &rem_t) != 0 && !stop_requested) {
                     start_t.tv_sec = rem_t.tv_sec;
                     start_t.tv_nsec = rem_t.tv_nsec;
                 }
+                if (stop_requested) {
+                    break;
+                }
                 #ifdef DEBUG
                 sleeps++;
                 auto wakeup_delay = std::chrono::duration<signed long long, std::nano>(noise.start_time) -
@@ -197,6 +287,13 @@ int cpuoccupy(const std::vector<Noise>& noises, int number_of_processes, std::st
     #ifdef LOOP
     }
     #endif
+        // Reported after the schedule so the write does not delay the first noise
+        std::cout << "BARRIER " << core_id
+            << " " << barrier_arrive.tv_sec * 1000000000LL + barrier_arrive.tv_nsec
+            << " " << barrier_release.tv_sec * 1000000000LL + barrier_release.tv_nsec
+            << std::endl;
+    } while (supervised && !should_exit);
+
     while(!should_exit){
         sleep(10);
     }
@@ -240,6 +337,86 @@ int parseJSON(std::vector<Noise>& noise_schedule, const std::string& json_file,
     return EXIT_SUCCESS;
 }
 
+bool isBinarySchedule(const std::string& schedule_file) {
+    char magic[sizeof(SCHEDULE_MAGIC)] = {};
+    std::ifstream file(schedule_file, std::ios::binary);
+    file.read(magic, sizeof(magic));
+    return file && std::memcmp(magic, SCHEDULE_MAGIC, sizeof(magic)) == 0;
+}
+
+// Maps only this core's records of a binary noise schedule. Nothing is parsed or copied.
+int mapBinarySchedule(std::span<const Noise>& noise_schedule, const std::string& schedule_file, const std::string& core_id) {
+    int fd = open(schedule_file.c_str(), O_RDONLY);
+    if (fd == -1) {
+        std::cerr << "Error: Unable to open schedule file: " << schedule_file << std::endl;
+        return EXIT_FAILURE;
+    }
+
+    ScheduleHeader header;
+    struct stat file_stat;
+    if (fstat(fd, &file_stat) == -1 ||
+        pread(fd, &header, sizeof(header), 0) != sizeof(header) ||
+        std::memcmp(header.magic, SCHEDULE_MAGIC, sizeof(SCHEDULE_MAGIC)) != 0 ||
+        header.version != SCHEDULE_VERSION) {
+        std::cerr << "Error: Invalid binary noise schedule: " << schedule_file << std::endl;
+        close(fd);
+        return EXIT_FAILURE;
+    }
+
+    std::vector<ScheduleEntry> entries(header.core_count);
+    ssize_t table_size = header.core_count * sizeof(ScheduleEntry);
+    if (pread(fd, entries.data(), table_size, sizeof(header)) != table_size) {
+        std::cerr << "Error: Truncated binary noise schedule: " << schedule_file << std::endl;
+        close(fd);
+        return EXIT_FAILURE;
+    }
+
+    const ScheduleEntry* core_entry = nullptr;
+    for (const auto& entry : entries) {
+        if (std::to_string(entry.core_id) == core_id) {
+            core_entry = &entry;
+        }
+    }
+    if (core_entry == nullptr) {
+        std::cerr << "Error: Core ID " << core_id << " not found in schedule file." << std::endl;
+        close(fd);
+        return EXIT_FAILURE;
+    }
+    if (core_entry->offset + core_entry->count * sizeof(Noise) > static_cast<uint64_t>(file_stat.st_size)) {
+        std::cerr << "Error (" << core_id << "): Noises exceed the end of the schedule file." << std::endl;
+        close(fd);
+        return EXIT_FAILURE;
+    }
+    if (core_entry->count == 0) {
+        close(fd);
+        noise_schedule = {};
+        return EXIT_SUCCESS;
+    }
+
+    // mmap offsets must be page aligned. Populate the pages now so no faults occur after the barrier.
+    off_t page_size = sysconf(_SC_PAGESIZE);
+    off_t map_offset = core_entry->offset - core_entry->offset % page_size;
+    size_t map_length = core_entry->offset - map_offset + core_entry->count * sizeof(Noise);
+    void* map = mmap(nullptr, map_length, PROT_READ, MAP_PRIVATE | MAP_POPULATE, fd, map_offset);
+    close(fd);
+    if (map == MAP_FAILED) {
+        perror("mmap");
+        return EXIT_FAILURE;
+    }
+
+    noise_schedule = std::span<const Noise>(
+        reinterpret_cast<const Noise*>(static_cast<const char*>(map) + (core_entry->offset - map_offset)),
+        core_entry->count);
+
+    for (size_t i = 1; i < noise_schedule.size(); i++) {
+        if (noise_schedule[i - 1].start_time >= noise_schedule[i].start_time) {
+            std::cerr << "Error (" << core_id << "): Noise not in cronological order. Previous Noise start: " << noise_schedule[i - 1].start_time << "Current Start Time: " << noise_schedule[i].start_time << std::endl;
+            return EXIT_FAILURE;
+        }
+    }
+    return EXIT_SUCCESS;
+}
+
 void termHandler( int signum ) {
     should_exit = true;
     std::cout << "KILL" <<std::endl;
@@ -249,22 +426,42 @@ void termHandler( int signum ) {
 
 int main(int argc, char* argv[]) {
     if (argc < 4) {
-        std::cerr << "Usage: " << argv[0] << " <json_file> <core_id> <number_of_processes>" << std::endl;
+        std::cerr << "Usage: " << argv[0] << " <json_file|schedule_file> <core_id> <number_of_processes> [--supervised]" << std::endl;
         return EXIT_FAILURE;
     }
     signal(SIGTERM, termHandler);  
 
+    // Supervised processes stay alive across workload iterations and are re-armed by signals
+    bool supervised = argc > 4 && std::string(argv[4]) == "--supervised";
+    if (supervised) {
+        struct sigaction sa = {};
+        sigemptyset(&sa.sa_mask);
+        sa.sa_handler = rearmHandler;
+        sigaction(SIGUSR1, &sa, NULL);
+        sa.sa_handler = stopHandler;
+        sigaction(SIGUSR2, &sa, NULL);
+    }
+
     std::string json_file = argv[1];
     std::string core_id = argv[2];
     int number_of_processes = std::stoi(argv[3]);
 
 
-    std::vector<Noise> noises_schedule;
-    if (parseJSON(noises_schedule, json_file, core_id)) {
-        // Failed parsing JSON file.
-        return EXIT_FAILURE;
+    std::vector<Noise> parsed_schedule;
+    std::span<const Noise> noises_schedule;
+    if (isBinarySchedule(json_file)) {
+        if (mapBinarySchedule(noises_schedule, json_file, core_id)) {
+            // Failed mapping binary noise schedule.
+            return EXIT_FAILURE;
+        }
+    } else {
+        if (parseJSON(parsed_schedule, json_file, core_id)) {
+            // Failed parsing JSON file.
+            return EXIT_FAILURE;
+        }
+        noises_schedule = parsed_schedule;
     }
 
     // Start the CPU occupy function with higher resolution
-    return cpuoccupy(noises_schedule, number_of_processes, core_id);
+    return cpuoccupy(noises_schedule, number_of_processes, core_id, supervised);
 }
@@ -4,10 +4,18 @@
 SYSTEM="chris"  # System name
 OSNOISEPATH="/sys/kernel/tracing"  # Path to osnoise tracer
 CURPATH="$PWD"  # Current working directory
-ITER=5  # Number of iterations per benchmark
+PERFVAR="$CURPATH/perfvar"  # Entry point running the analysis scripts, see scripts/perfvar
+ITER=5  # Number of iterations per benchmark, the maximum when stopping adaptively
+MIN_ITER=100  # Iterations per benchmark before stopping adaptively
+STOP_TOLERANCE="" # Stop once the confidence intervals of STOP_QUANTILES are within this many percent (empty to always run ITER iterations)
+STOP_QUANTILES="0.5 0.9 0.99"  # Quantiles of the iteration durations the adaptive stop waits for
 TRACE=1  # Enable/disable tracing (1 = enabled, 0 = disabled)
 INJECT_NOISE_VALUE="no"  # Enable/disable noise injection (yes/no)
 NOISE_INJECT_ON_ANY_CORE="no" # Enable/disable migration of noise injections processes during noise injection
+SUPERVISE_NOISE=0 # Keep the noise injection processes alive across iterations (1 = enabled, 0 = disabled)
+TRACE_WATCHER=0 # Parse traces in the background while benchmarking (1 = enabled, 0 = disabled)
+TRACE_PIPE=0 # Stream the trace from trace_pipe while the workload runs instead of copying the buffer afterwards (1 = enabled, 0 = disabled)
+TRACE_COMPRESSION="" # Compress saved traces (zst, gz or empty for uncompressed traces)
 THREADS="$(nproc)"     # Sets the amount of threads that will be utilized by the workload
 THREAD_PINNING="no" # Enable/disable thread pinning (yes/no), warning: miniFE sycl does not perform with both OMP and DPCPP envars
 HOUSEHOLDING="no" # Enable/disable thread pinning (yes/no)
@@ -58,10 +66,34 @@ for i in "$@"; do
         ITER="${i#*=}"
         shift # past argument=value
         ;;
+    -imin=*)
+        MIN_ITER="${i#*=}"
+        shift # past argument=value
+        ;;
+    -st=*)
+        STOP_TOLERANCE="${i#*=}"
+        shift # past argument=value
+        ;;
     -t=*)
         TRACE="${i#*=}"
         shift # past argument=value
         ;;
+    -s=*)
+        SUPERVISE_NOISE="${i#*=}"
+        shift # past argument=value
+        ;;
+    -tw=*)
+        TRACE_WATCHER="${i#*=}"
+        shift # past argument=value
+        ;;
+    -tp=*)
+        TRACE_PIPE="${i#*=}"
+        shift # past argument=value
+        ;;
+    -tc=*)
+        TRACE_COMPRESSION="${i#*=}"
+        shift # past argument=value
+        ;;
     -na=*)
         INJECT_NOISE_VALUE="yes"
         NOISE_INJECT_ON_ANY_CORE="yes"
@@ -132,7 +164,7 @@ if [ "$INJECT_NOISE_VALUE" = "yes" ]; then
     config_file_name=$(basename -- "$noise_config_file")
     echo "Copy Noise config file at: $noise_config_file to $logfolderpath"
     cp  "$noise_config_file" "$logfolderpath/"
-    key_count=$(jq 'length' $logfolderpath/$config_file_name)
+    key_count=$(python3 "$PERFVAR" analyze schedule --count "$logfolderpath/$config_file_name")
     for k in "${!benchparameters[@]}"; do
         benchparameters[$k]="${benchparameters[$k]} $key_count"
     done
@@ -140,8 +172,8 @@ if [ "$INJECT_NOISE_VALUE" = "yes" ]; then
     #This should ensure that we are able to reach 100% utilization for the realtime processes
     echo 1000000 > /proc/sys/kernel/sched_rt_runtime_us
     # TODO Allow different noises for different frameworks.
-    python3 "$CURPATH/noise_config_graphs.py" "$noise_config_file" "$graphfolder/injected_noise"
-    echo "Running: $CURPATH/noise_config_graphs.py" "$noise_config_file" "$graphfolder/injected_noise"
+    python3 "$PERFVAR" graphs config "$noise_config_file" "$graphfolder/injected_noise"
+    echo "Running: perfvar graphs config" "$noise_config_file" "$graphfolder/injected_noise"
 fi
 
 # Source Intel OneAPI environment
@@ -174,6 +206,21 @@ if [ "$HOUSEHOLDING" = "yes" ]; then
     #echo Threads are now = $THREADS
 fi
 
+# The trace watcher and capture run on the CPUs left to housekeeping, so they do not add noise to the workload
+if [ $THREADS -lt $(nproc) ]; then
+    watcher_cpus="$THREADS-$(($(nproc) - 1))"
+else
+    watcher_cpus=""
+    if [ $TRACE_WATCHER -eq 1 ]; then
+        echo "No housekeeping CPU left for the trace watcher (see -m=2 and -t), the traces are parsed after benchmarking instead"
+        TRACE_WATCHER=0
+    fi
+    if [ $TRACE_PIPE -eq 1 ]; then
+        echo "No housekeeping CPU left for the trace capture (see -m=2 and -t), the trace buffer is copied after every iteration instead"
+        TRACE_PIPE=0
+    fi
+fi
+
 if [ ${#frameworks[@]} = 1 ]; then
     if [ ${frameworks[0]} = "omp" ]; then
         #export OMP_DISPLAY_ENV=VERBOSE
@@ -211,6 +258,16 @@ cleanup() {
         kill -SIGTERM "$noise_pid"
         wait "$noise_pid"  # Wait for the noise process to terminate
     fi
+    if [ -n "$capture_pid" ]; then
+        echo "Stopping trace capture with PID: $capture_pid"
+        kill -SIGTERM "$capture_pid"
+        wait "$capture_pid"
+    fi
+    if [ -n "$watcher_pid" ]; then
+        echo "Stopping trace watcher with PID: $watcher_pid"
+        kill -SIGTERM "$watcher_pid"
+        wait "$watcher_pid"
+    fi
     exit 0
 }
 
@@ -250,6 +307,29 @@ for bench in ${benches[@]}; do
             ./"$binary" $params >/dev/null 2>&1
         fi
 
+        output_file="$logpath/$curbench-$SYSTEM.noiseout"
+        noise_args="--verbose --debug --json-file $logfolderpath/$config_file_name"
+        if [ "$NOISE_INJECT_ON_ANY_CORE" = "yes" ]; then
+            noise_args="--any-core $noise_args"
+        fi
+
+        # Start the noise injection supervisor once, it is re-armed for every iteration
+        if [ "$INJECT_NOISE_VALUE" = "yes" ] && [ $SUPERVISE_NOISE -eq 1 ]; then
+            cd "$CURPATH" || exit 1
+            python3 "$PERFVAR" inject --supervise --rearm-log "$logpath/$curbench-$SYSTEM.rearm.csv" --startup-log "$logpath/$curbench-$SYSTEM.startup.csv" $noise_args >> $output_file&
+            noise_pid=$!
+            cd "$benchpath/$curbench/${makefilepath[$benchidx]}" || exit 1
+        fi
+
+        # Start the trace watcher, parsing every trace at idle priority once its iteration is done
+        if [ $TRACE -eq 1 ] && [ "$INJECT_NOISE_VALUE" != "yes" ] && [ $TRACE_WATCHER -eq 1 ]; then
+            ionice -c 3 python3 "$PERFVAR" watch "$logpath" -w "$binary" --cpus "$watcher_cpus" >> "$logpath/$curbench-$SYSTEM.watcherout" 2>&1 &
+            watcher_pid=$!
+        fi
+
+        # Start a new stopping log, the stopping rule reads the durations of every iteration logged in it
+        rm -f "$logpath/$curbench-$SYSTEM.stopping.jsonl"
+
         echo "Start: $curbench"
         for ((i=1; i<=$ITER; i++)) do                
             TRACECOUNT=$i
@@ -257,8 +337,14 @@ for bench in ${benches[@]}; do
 
             # Enable tracing if specified
             if [ $TRACE -eq 1 ]; then
-                touch "$logpath/$curbench-$TRACECOUNT-$SYSTEM.trace"
+                trace_file="$logpath/$curbench-$TRACECOUNT-$SYSTEM.trace${TRACE_COMPRESSION:+.$TRACE_COMPRESSION}"
+                touch "$trace_file"
                 echo > "$OSNOISEPATH/trace"
+                if [ $TRACE_PIPE -eq 1 ]; then
+                    # Stream the trace while the workload runs, lost events are recorded in a .capture.json file
+                    python3 "$PERFVAR" capture "$trace_file" --tracefs "$OSNOISEPATH" --cpus "$watcher_cpus" &
+                    capture_pid=$!
+                fi
                 sleep 1  # Allow tracer warmup
             fi
 
@@ -270,24 +356,29 @@ for bench in ${benches[@]}; do
             if [ "$INJECT_NOISE_VALUE" = "yes" ]; then
                 # Allow the workload to reach barrier 
                 sleep 1
-                # Run noise injection script in the background
-                cd "$CURPATH" || exit 1
-                output_file="$logpath/$curbench-$SYSTEM.noiseout" 2>&1
-                if [ "$NOISE_INJECT_ON_ANY_CORE" = "yes" ]; then
-                    python3 "$CURPATH/run_noise.py" --verbose --debug --any-core --json-file "$logfolderpath/$config_file_name" >> $output_file&
+                if [ $SUPERVISE_NOISE -eq 1 ]; then
+                    # Re-arm the running noise injection processes for this workload
+                    kill -SIGUSR1 $noise_pid
                 else
-                    python3 "$CURPATH/run_noise.py" --verbose --debug --json-file "$logfolderpath/$config_file_name" >> $output_file&
+                    # Run noise injection script in the background
+                    cd "$CURPATH" || exit 1
+                    python3 "$PERFVAR" inject --startup-log "$logpath/$curbench-$TRACECOUNT-$SYSTEM.startup.csv" $noise_args >> $output_file&
+                    noise_pid=$!
+                    cd "$benchpath/$curbench/${makefilepath[$benchidx]}" || exit 1
                 fi
-                noise_pid=$!
-                cd "$benchpath/$curbench/${makefilepath[$benchidx]}" || exit 1
             fi
             #Wait for all child processes to finish
             wait  $benchmark_pid
 
             if [ "$INJECT_NOISE_VALUE" = "yes" ]; then
-                # End noise injection
-                kill -SIGTERM $noise_pid
-                wait $noise_pid
+                if [ $SUPERVISE_NOISE -eq 1 ]; then
+                    # Stop the noise of this iteration
+                    kill -SIGUSR2 $noise_pid
+                else
+                    # End noise injection
+                    kill -SIGTERM $noise_pid
+                    wait $noise_pid
+                fi
             fi
 
             # Disable tracing if specified
@@ -295,21 +386,52 @@ for bench in ${benches[@]}; do
                 # Sleep to allow for cooldown period where noises stretching past workload end are captured
                 sleep 1
                 # Save trace
-                cat "$OSNOISEPATH/trace" > "$logpath/$curbench-$TRACECOUNT-$SYSTEM.trace"
+                if [ $TRACE_PIPE -eq 1 ]; then
+                    kill -SIGTERM $capture_pid
+                    wait $capture_pid
+                    capture_pid=""
+                elif [ "$TRACE_COMPRESSION" = "zst" ]; then
+                    zstd -q -c "$OSNOISEPATH/trace" > "$trace_file"
+                elif [ "$TRACE_COMPRESSION" = "gz" ]; then
+                    gzip -c "$OSNOISEPATH/trace" > "$trace_file"
+                else
+                    cat "$OSNOISEPATH/trace" > "$trace_file"
+                fi
             fi
             
             # Save benchmark output
             echo "Input params: $params" >> "$logpath/$curbench-$TRACECOUNT-$SYSTEM.benchout"
             echo "Noise injector was enabled? A: $INJECT_NOISE_VALUE" >> "$logpath/$curbench-$TRACECOUNT-$SYSTEM.benchout"
+
+            # Stop once the duration distribution has converged, every decision is logged in a .stopping.jsonl file
+            if [ -n "$STOP_TOLERANCE" ] && python3 "$PERFVAR" stop "$logpath/$curbench-$TRACECOUNT-$SYSTEM.benchout" "$logpath/$curbench-$SYSTEM.stopping.jsonl" \
+                    --tolerance "$STOP_TOLERANCE" --quantiles $STOP_QUANTILES --min_iterations "$MIN_ITER" --max_iterations "$ITER"; then
+                break
+            fi
         done
+
+        # End the noise injection supervisor
+        if [ "$INJECT_NOISE_VALUE" = "yes" ] && [ $SUPERVISE_NOISE -eq 1 ]; then
+            kill -SIGTERM $noise_pid
+            wait $noise_pid
+            noise_pid=""
+        fi
         #Create noise graphs
         if [ "$INJECT_NOISE_VALUE" = "yes" ]; then
-            python3 "$CURPATH/noise_graphs.py" "$logpath" "$graphfolder/observed_noise"
+            python3 "$PERFVAR" graphs noise "$logpath" "$graphfolder/observed_noise"
         #Generate noise injection configuration
         elif [ $TRACE -eq 1 ]; then
             cd "$CURPATH" || exit 1
             echo "Main workload name: ${benches[$benchidx]}"
-            python3 $CURPATH/traces_to_noise_config.py $logpath -o $config_file_name -w ${binname[$benchidx]}
+            if [ -n "$watcher_pid" ]; then
+                # Stop the trace watcher, only the traces it did not get to are parsed
+                kill -SIGTERM $watcher_pid
+                wait $watcher_pid
+                watcher_pid=""
+                python3 "$PERFVAR" config $logpath -o $config_file_name -w ${binname[$benchidx]} --partial
+            else
+                python3 "$PERFVAR" config $logpath -o $config_file_name -w ${binname[$benchidx]}
+            fi
             mv "$CURPATH/$config_file_name" "$logpath" 
             cd "$benchpath/$curbench/${makefilepath[$benchidx]}" || exit 1
         fi
@@ -327,8 +449,8 @@ if [ $TRACE -eq 1 ]; then
 fi
 
 mkdir -p "$graphfolder/performance"
-echo "Running: $CURPATH/bench_graphs.py" "$logfolderpath" "$graphfolder/performance"
-python3 "$CURPATH/bench_graphs.py" "$logfolderpath" "$graphfolder/performance"
+echo "Running: perfvar graphs bench" "$logfolderpath" "$graphfolder/performance" --db "$benchpath/logs/results.sqlite"
+python3 "$PERFVAR" graphs bench "$logfolderpath" "$graphfolder/performance" --db "$benchpath/logs/results.sqlite"
 
 echo "Benchmarking done"
 
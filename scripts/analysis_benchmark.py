@@ -0,0 +1,296 @@
+import os
+import io
+import copy
+import json
+import time
+import platform
+import argparse
+import subprocess
+import contextlib
+import statistics
+import numpy as np
+from trace_cache import parse_trace, parse_trace_window, load_trace
+from synthetic_traces import generate_traces
+from trace_storage import list_trace_files, benchout_path, open_trace, compress_trace, zstandard, READ_SIZE
+from traces_to_noise_config import process_traces, compute_average_trace, clean_worst_trace, \
+    cpu_to_noise_dict, combine_consecutive_noises
+
+# Constants
+DEFAULT_DATA_FOLDER = "analysis_benchmark_data"
+DEFAULT_RESULTS_FOLDER = "analysis_benchmark_results"
+WORKLOAD_NAME = "main"
+
+# Synthetic trace sets the pipeline is timed on
+SCALES = {
+    "small": {"cpus": 4, "smt": False, "event_rate": 1000, "duration": 0.5, "iterations": 5},
+    "medium": {"cpus": 16, "smt": False, "event_rate": 2000, "duration": 1.0, "iterations": 10},
+    "large": {"cpus": 32, "smt": True, "event_rate": 2000, "duration": 1.0, "iterations": 20},
+}
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(
+        description="Time the stages of traces_to_noise_config.py on synthetic traces and save the results for comparing commits."
+    )
+    parser.add_argument("-s", "--scales", type=str, nargs="+", default=["small", "medium"], choices=SCALES.keys(),
+                        help="Trace sets to benchmark (default: small medium).")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of timed runs of every stage (default: 3).")
+    parser.add_argument("-d", "--data_folder", type=str, default=DEFAULT_DATA_FOLDER,
+                        help="Folder the synthetic traces are generated in and reused from (default: 'analysis_benchmark_data').")
+    parser.add_argument("-o", "--results_folder", type=str, default=DEFAULT_RESULTS_FOLDER,
+                        help="Folder to save the results to (default: 'analysis_benchmark_results').")
+    parser.add_argument("--compare", type=str, nargs=2, metavar=("BASE", "NEW"), default=None,
+                        help="Compare two saved results instead of running the benchmark.")
+    return parser.parse_args()
+
+
+def git_commit():
+    """
+    Returns the current commit and whether the working tree has changes, or (None, None) outside a git repository.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def prepare_traces(data_folder, scale):
+    """
+    Generates the synthetic traces of a scale, reusing them when they were generated with the same parameters.
+
+    Returns:
+        tuple: The trace folder and the sorted trace file names.
+    """
+    params = SCALES[scale]
+    trace_path = os.path.join(data_folder, scale)
+    params_file = os.path.join(trace_path, "params.json")
+
+    if os.path.isfile(params_file):
+        with open(params_file, "r") as f:
+            reusable = json.load(f) == params
+    else:
+        reusable = False
+
+    if not reusable:
+        print(f"Generating {scale} traces in {trace_path}")
+        if os.path.isdir(trace_path):
+            for file in os.listdir(trace_path):
+                os.remove(os.path.join(trace_path, file))
+        generate_traces(trace_path, **params)
+        with open(params_file, "w") as f:
+            json.dump(params, f)
+
+    trace_files = list_trace_files(trace_path)
+    trace_files.sort(key=lambda file: int(file.split("-")[2]))  # Sort by trace number
+    return trace_path, trace_files
+
+
+def time_stage(stage, repeat, setup=None):
+    """
+    Times a stage, calling setup before every run outside of the timing.
+    Output printed by the stage is discarded.
+
+    Returns:
+        tuple: The timings in seconds and the result of the last run.
+    """
+    runs = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = stage(*args)
+            runs.append(time.perf_counter() - start)
+    return runs, result
+
+
+def evict_from_page_cache(paths):
+    """
+    Asks the kernel to drop the cached pages of files, so the next read comes from disk.
+    """
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def read_all(paths):
+    """
+    Reads the uncompressed contents of trace files.
+
+    Returns:
+        int: The number of uncompressed bytes read.
+    """
+    total = 0
+    for path in paths:
+        with open_trace(path, "rb") as f:
+            while (chunk := f.read(READ_SIZE)):
+                total += len(chunk)
+    return total
+
+
+def benchmark_storage(trace_path, trace_files, repeat):
+    """
+    Times cold and warm reads of the traces of a scale stored uncompressed and compressed with every
+    available format. The compressed copies are written next to the traces once.
+
+    Returns:
+        tuple: The stored bytes and the timings of every read stage, by format.
+    """
+    formats = [""] + [suffix for suffix in (".zst", ".gz") if suffix != ".zst" or zstandard is not None]
+    storage_bytes = dict()
+    stages = dict()
+    for suffix in formats:
+        paths = []
+        for file in trace_files:
+            path = os.path.join(trace_path, file)
+            if suffix and not os.path.isfile(path + suffix):
+                compress_trace(path, suffix, keep=True)
+            paths.append(path + suffix)
+        name = suffix[1:] or "plain"
+        storage_bytes[name] = sum(os.path.getsize(path) for path in paths)
+        def evict():
+            evict_from_page_cache(paths)
+            return ()
+        stages[f"read_{name}_cold"], _ = time_stage(lambda: read_all(paths), repeat, evict)
+        stages[f"read_{name}_warm"], _ = time_stage(lambda: read_all(paths), repeat)
+    return storage_bytes, stages
+
+
+def benchmark_scale(data_folder, scale, repeat):
+    """
+    Times every stage of traces_to_noise_config.py on the traces of a scale.
+
+    Returns:
+        dict: The scale parameters, the size of the trace set and the timings of every stage.
+    """
+    trace_path, trace_files = prepare_traces(data_folder, scale)
+    trace_bytes = sum(os.path.getsize(os.path.join(trace_path, file)) for file in trace_files)
+    stages = dict()
+
+    def parse_all():
+        return sum(len(parse_trace(os.path.join(trace_path, file), os.path.join(trace_path, benchout_path(file))))
+                   for file in trace_files)
+    stages["parse"], events = time_stage(parse_all, repeat)
+
+    def parse_window_all():
+        return sum(len(parse_trace_window(os.path.join(trace_path, file), os.path.join(trace_path, benchout_path(file)),
+                                          WORKLOAD_NAME))
+                   for file in trace_files)
+    stages["parse_window"], _ = time_stage(parse_window_all, repeat)
+
+    storage_bytes, read_stages = benchmark_storage(trace_path, trace_files, repeat)
+    stages.update(read_stages)
+
+    # Build the trace caches so the remaining stages measure the analysis
+    for file in trace_files:
+        load_trace(file, trace_path, workload_name=WORKLOAD_NAME)
+    stages["load_cached"], _ = time_stage(lambda: [load_trace(file, trace_path, workload_name=WORKLOAD_NAME)
+                                                   for file in trace_files], repeat)
+
+    stages["process"], (worst_trace, average_dict) = \
+        time_stage(lambda: process_traces(trace_files, trace_path, WORKLOAD_NAME), repeat)
+    stages["average"], _ = time_stage(lambda: compute_average_trace(trace_files, trace_path, WORKLOAD_NAME), repeat)
+
+    stages["clean"], _ = time_stage(clean_worst_trace, repeat,
+                                    lambda: (copy.deepcopy(worst_trace), copy.deepcopy(average_dict)))
+    # clean_worst_trace works in place
+    cleaned_trace = copy.deepcopy(worst_trace)
+    clean_worst_trace(cleaned_trace, copy.deepcopy(average_dict))
+
+    stages["convert"], noise_dict = time_stage(cpu_to_noise_dict, repeat,
+                                               lambda: (copy.deepcopy(cleaned_trace[0]), cleaned_trace[1]))
+    stages["merge"], _ = time_stage(combine_consecutive_noises, repeat, lambda: (copy.deepcopy(noise_dict),))
+
+    json_file = os.path.join(trace_path, "noise_config.json")
+    def write_json():
+        with open(json_file, "w") as f:
+            f.write(json.dumps(noise_dict, indent=4))
+    stages["json"], _ = time_stage(write_json, repeat)
+
+    return {
+        "params": SCALES[scale],
+        "traces": len(trace_files),
+        "events": events,
+        "trace_bytes": trace_bytes,
+        "storage_bytes": storage_bytes,
+        "stages": {stage: {"min_s": min(runs), "median_s": statistics.median(runs), "runs": runs}
+                   for stage, runs in stages.items()},
+    }
+
+
+def print_results(results):
+    for scale, result in results["scales"].items():
+        print(f"{scale}: {result['traces']} traces, {result['events']} events, {result['trace_bytes'] / 1e6:.1f} MB")
+        for stage, timing in result["stages"].items():
+            print(f"    {stage:<16} min {timing['min_s'] * 1e3:10.1f} ms    median {timing['median_s'] * 1e3:10.1f} ms")
+        for name, stored in result.get("storage_bytes", {}).items():
+            cold = result["stages"][f"read_{name}_cold"]["median_s"]
+            print(f"    {name:<6} {stored / 1e6:8.1f} MB stored    ratio {result['trace_bytes'] / stored:5.1f}x    "
+                  f"cold read {result['trace_bytes'] / cold / 1e6:8.1f} MB/s")
+
+
+def compare_results(base_file, new_file):
+    """
+    Prints the median time of every stage in two saved results and their ratio.
+    """
+    with open(base_file, "r") as f:
+        base = json.load(f)
+    with open(new_file, "r") as f:
+        new = json.load(f)
+
+    print(f"Base: {base['commit']} ({base['timestamp']})    New: {new['commit']} ({new['timestamp']})")
+    for scale, result in new["scales"].items():
+        if scale not in base["scales"]:
+            continue
+        if result["params"] != base["scales"][scale]["params"]:
+            print(f"{scale}: trace parameters differ, skipping")
+            continue
+        print(f"{scale}:")
+        for stage, timing in result["stages"].items():
+            if stage not in base["scales"][scale]["stages"]:
+                continue
+            base_median = base["scales"][scale]["stages"][stage]["median_s"]
+            print(f"    {stage:<16} {base_median * 1e3:10.1f} ms -> {timing['median_s'] * 1e3:10.1f} ms"
+                  f"    x{base_median / timing['median_s']:.2f}")
+
+
+def main():
+    args = parse_arguments()
+    if args.compare:
+        compare_results(*args.compare)
+        return
+
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y%m%d-%H%M%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "scales": {scale: benchmark_scale(args.data_folder, scale, args.repeat) for scale in args.scales},
+    }
+    print_results(results)
+
+    os.makedirs(args.results_folder, exist_ok=True)
+    results_file = os.path.join(args.results_folder, f"{commit or 'nogit'}{'-dirty' if dirty else ''}-{results['timestamp']}.json")
+    with open(results_file, "w") as f:
+        f.write(json.dumps(results, indent=4))
+    print(f"Results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
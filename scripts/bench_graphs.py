@@ -1,95 +1,52 @@
 import os
-import re
-import sys
+import argparse
 import matplotlib.pyplot as plt
-import numpy as np
+from results_db import open_results, query_durations, execution_statistics
+from tail_model import tail_statistics
+from quantile_sketch import TDigest, sketch_path, save_sketch
 
-def calculate_percentiles(data):
-    return {
-        'min': np.min(data),
-        'max': np.max(data),
-        '1th': np.percentile(data, 1),
-        '10th': np.percentile(data, 10),
-        '25th': np.percentile(data, 25),
-        '50th': np.percentile(data, 50),
-        '75th': np.percentile(data, 75),
-        '90th': np.percentile(data, 90),
-        '99th': np.percentile(data, 99),
-    }
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Plot and summarize the execution times of the benchmarks in a log folder.")
+    parser.add_argument("input_folder", type=str, help="Path to the folder containing benchmark outputs.")
+    parser.add_argument("output_folder", type=str, nargs="?", default=None,
+                        help="Path to the folder the graphs and statistics are saved to (default: input folder).")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Results database to ingest the log folder into and read it from (default: in memory).")
+    return parser.parse_args()
 
-def write_statistics_to_file(output_folder, bench, exectimes, normexectimes):
+def write_statistics_to_file(output_folder, bench, exectimes, durations):
     stats_file_path = os.path.join(output_folder, f"{bench}_stats.txt")
-    percentiles = calculate_percentiles(exectimes)
-    norm_percentiles = calculate_percentiles(normexectimes)
+    stats = execution_statistics(exectimes)
+    # The tail models need the durations in iteration order, exectimes is sorted
+    stats.update(tail_statistics(durations))
     
     with open(stats_file_path, "w") as stats_file:
         stats_file.write(f"Statistics for {bench}:\n")
-        stats_file.write("\n--- Execution Times (seconds) ---\n")
-        stats_file.write(f"Min: {percentiles['min']:.9f}\n")
-        stats_file.write(f"1th percentile: {percentiles['1th']:.9f}\n")
-        stats_file.write(f"10th percentile: {percentiles['10th']:.9f}\n")
-        stats_file.write(f"25th percentile: {percentiles['25th']:.9f}\n")
-        stats_file.write(f"50th percentile: {percentiles['50th']:.9f}\n")
-        stats_file.write(f"75th percentile: {percentiles['75th']:.9f}\n")
-        stats_file.write(f"90th percentile: {percentiles['90th']:.9f}\n")
-        stats_file.write(f"99th percentile: {percentiles['99th']:.9f}\n")
-        stats_file.write(f"Max: {percentiles['max']:.9f}\n")
-        stats_file.write(f"Average: {np.mean(exectimes):.9f}\n")
-        stats_file.write(f"Standard Deviation: {np.std(exectimes):.9f}\n")
-
-        stats_file.write("\n--- Normalized Execution Times ---\n")
-        stats_file.write(f"Min: {norm_percentiles['min']:.9f}\n")
-        stats_file.write(f"1th percentile: {norm_percentiles['1th']:.9f}\n")
-        stats_file.write(f"10th percentile: {norm_percentiles['10th']:.9f}\n")
-        stats_file.write(f"25th percentile: {norm_percentiles['25th']:.9f}\n")
-        stats_file.write(f"50th percentile: {norm_percentiles['50th']:.9f}\n")
-        stats_file.write(f"75th percentile: {norm_percentiles['75th']:.9f}\n")
-        stats_file.write(f"90th percentile: {norm_percentiles['90th']:.9f}\n")
-        stats_file.write(f"99th percentile: {norm_percentiles['99th']:.9f}\n")
-        stats_file.write(f"Max: {norm_percentiles['max']:.9f}\n")
-        stats_file.write(f"Standard Deviation: {np.std(normexectimes):.9f}\n")
+        for section, values in stats.items():
+            stats_file.write(f"\n--- {section} ---\n")
+            for key, value in values.items():
+                stats_file.write(f"{key}: {value:.9f}\n")
 
 def main():
-    if len(sys.argv) < 2 or not os.path.exists(sys.argv[1]):
+    args = parse_arguments()
+    if not os.path.exists(args.input_folder):
         print('First argument must be a valid path to the folder containing benchmark outputs.')
         return
     
-    input_folder = sys.argv[1]
-    output_folder = sys.argv[2] if len(sys.argv) > 2 else input_folder  # Use input folder as default for output
+    input_folder = args.input_folder
+    output_folder = args.output_folder if args.output_folder else input_folder  # Use input folder as default for output
 
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     
-    benches = os.listdir(input_folder)
-    print(benches)
-
-    for bench in benches:
-        if not ("sycl" in bench or "omp" in bench):
-            continue
-
-        benchpath = os.path.join(input_folder, bench)
-        if not os.path.isdir(benchpath):
-            continue
-        
-        files = [f for f in os.listdir(benchpath) if f.endswith(".benchout")]
-        
-        if not files:
-            print(f"No .benchout files found in {benchpath}")
-            continue
+    conn = open_results([input_folder], args.db)
+    results = [result for result in query_durations(conn, [input_folder]) if result["path"] == os.path.abspath(input_folder)]
+    print([result["bench"] for result in results])
 
-        exectimes = []
-        duration_re = re.compile(r"Total Duration: (\d+\.\d+) seconds")
+    for result in results:
+        bench = result["bench"]
+        exectimes = sorted(result["durations"])
 
-        for file in files:
-            file_path = os.path.join(benchpath, file)
-            with open(file_path, "r") as lines:
-                for line in lines:
-                    dur_match = duration_re.match(line)
-                    if dur_match:
-                        total_duration = float(dur_match.group(1))
-                        exectimes.append(total_duration)
-
-        exectimes.sort()
         avgexectime = sum(exectimes) / len(exectimes)
         normexectimes = [x / avgexectime for x in exectimes]
 
@@ -110,7 +67,14 @@ def main():
         plt.savefig(os.path.join(output_folder, f"{bench}-sec.png"))
 
         # Write statistics to file
-        write_statistics_to_file(output_folder, bench, exectimes, normexectimes)
+        write_statistics_to_file(output_folder, bench, exectimes, result["durations"])
+
+        # Save a sketch of the durations next to the run, so quantiles across runs merge sketches instead of reading every run
+        bench_folder = os.path.join(result["path"], bench)
+        if os.path.isdir(bench_folder):
+            sketch = TDigest()
+            sketch.update(result["durations"])
+            save_sketch(sketch, sketch_path(bench_folder, bench, "durations"))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+import os
+import re
+
+# The Timer in common/time_utils.hpp prints these lines when the workload ends, and Benchmark.sh only
+# appends the input parameters and injector state after them, so they are found at the end of the file
+START_RE = re.compile(r"Start time: ([\d.]+) seconds")
+END_RE = re.compile(r"End time: ([\d.]+) seconds")
+DURATION_RE = re.compile(r"Total Duration: (\d+\.\d+) seconds")
+TAIL_SIZE = 8192
+
+# Parsed .benchout files by path, with the size and modification time they were read at
+_cache = dict()
+
+
+class BenchoutTimes:
+    """
+    Timer output of a single workload run. When a line occurs several times the last one is used.
+
+    Attributes:
+        start, end (float): Start and end time (s) of the workload, or None if missing.
+        duration (float): Total duration (s) of the workload, or None if missing.
+        duration_ns (int): Total duration (ns), or -1 if missing.
+    """
+
+    def __init__(self, start=None, end=None, duration=None):
+        self.start = None if start is None else float(start)
+        self.end = None if end is None else float(end)
+        self.duration = None if duration is None else float(duration)
+        self.duration_ns = -1 if duration is None else int(duration.replace(".", ""))
+
+
+def _match_lines(lines):
+    """
+    Returns the last start, end and duration text found in the lines, or None for the missing ones.
+    """
+    start = end = duration = None
+    for line in lines:
+        if (match := START_RE.search(line)):
+            start = match.group(1)
+        if (match := END_RE.search(line)):
+            end = match.group(1)
+        if (match := DURATION_RE.match(line)):
+            duration = match.group(1)
+    return start, end, duration
+
+
+def _read_tail(path, size):
+    """
+    Parses the complete lines in the last TAIL_SIZE bytes of a file. Returns None if a line is missing there
+    and the file is longer.
+    """
+    with open(path, "rb") as f:
+        f.seek(max(size - TAIL_SIZE, 0))
+        tail = f.read().decode(errors="replace").split("\n")
+    if size > TAIL_SIZE:
+        # The first line may be cut off
+        tail = tail[1:]
+    found = _match_lines(tail)
+    if None in found and size > TAIL_SIZE:
+        return None
+    return found
+
+
+def read_benchout(path):
+    """
+    Reads the Timer output of a .benchout file. Only the end of the file is read, falling back to the
+    whole file when a line is not found there. Results are cached until the file changes.
+
+    Args:
+        path (str): Path to the .benchout file.
+
+    Returns:
+        BenchoutTimes: The start, end and duration of the workload.
+    """
+    stat = os.stat(path)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == (stat.st_size, stat.st_mtime_ns):
+        return cached[1]
+
+    found = _read_tail(path, stat.st_size)
+    if found is None:
+        with open(path, "r") as lines:
+            found = _match_lines(lines)
+
+    times = BenchoutTimes(*found)
+    _cache[path] = ((stat.st_size, stat.st_mtime_ns), times)
+    return times
+
+
+def read_total_duration(benchout_file):
+    """
+    Reads the workload duration (ns) from a .benchout file. Returns -1 if no duration is present.
+    """
+    return read_benchout(benchout_file).duration_ns
@@ -1,8 +1,8 @@
 import os
-import re
 import sys
 import argparse
 import matplotlib.pyplot as plt
+from results_db import open_results, query_durations
 
 
 def parse_arguments():
@@ -10,6 +10,8 @@ def parse_arguments():
     parser.add_argument("input_folder", type=str, help="Path to the folder containing benchmark outputs.")
     parser.add_argument("-o","--output_folder", type=str, help="Path to the folder where the output graph will be saved.")
     parser.add_argument("-hl", "--horizontal-line", type=float, help="Optional horizontal line at given y-value")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Results database to ingest the benchmark outputs into and read them from (default: in memory).")
 
     return parser.parse_args()
 def main():
@@ -24,45 +26,12 @@ def main():
         os.makedirs(output_folder)
     
 
-    #r = re.compile(".*benchout")
     exec_dict = dict()
 
-    for root, subdirs, files in os.walk(input_folder):
-        print(root)
-        benches = os.listdir(root)
-
-
-
-
-        for bench in benches:
-            if not ("sycl" in bench or "omp" in bench):
-                continue
-
-            benchpath = os.path.join(root, bench)
-            if not os.path.isdir(benchpath):
-                continue
-            
-            files = [f for f in os.listdir(benchpath) if f.endswith(".benchout")]
-            
-            if not files:
-                print(f"No .benchout files found in {benchpath}")
-                continue
-
-            exectimes = []
-            duration_re = re.compile(r"Total Duration: (\d+\.\d+) seconds")
-
-            for file in files:
-                file_path = os.path.join(benchpath, file)
-                with open(file_path, "r") as lines:
-                    for line in lines:
-                        dur_match = duration_re.match(line)
-                        if dur_match:
-                            total_duration = float(dur_match.group(1))
-                            exectimes.append(total_duration)
-
-            exectimes.sort()
-            bench.split("-")
-            exec_dict[os.path.basename(root)+"-"+bench.split("-")[1]] = exectimes
+    conn = open_results([input_folder], parser.db)
+    for result in query_durations(conn, [input_folder]):
+        exectimes = sorted(result["durations"])
+        exec_dict[result["name"]+"-"+result["bench"].split("-")[1]] = exectimes
 
 
     #plt.title(os.path.basename(input_folder))
@@ -1,17 +1,21 @@
 import os
-import re
+import sys
+import json
 import argparse
-from tabulate import tabulate
-from termcolor import colored
-
-def find_stats_files(root_dirs):
-    stats_files = []
-    for root_dir in root_dirs:
-        for dirpath, _, filenames in os.walk(root_dir):
-            for filename in filenames:
-                if filename.endswith("_stats.txt"):
-                    stats_files.append(os.path.join(dirpath, filename))
-    return stats_files
+from results_db import open_results, query_durations, execution_statistics
+from significance import METRICS, DEFAULT_RESAMPLES, DEFAULT_CONFIDENCE, DEFAULT_SEED
+
+# Rows of the execution time table tested by the bootstrap comparison, with the statistic of significance.py
+SIGNIFICANCE_SECTION = "Execution Times (seconds)"
+SIGNIFICANCE_METRICS = {"Average": "mean", "50th percentile": "median", "90th percentile": "p90", "99th percentile": "p99"}
+NORMALIZED_SECTION = "Normalized Execution Times"
+# Allowed increase (%) of every metric checked by the regression gate unless --budget is given
+DEFAULT_BUDGETS = {"mean": 3.0, "normalized_p99": 3.0}
+# Exit codes of the regression gate, 2 is left to argparse and invalid input
+EXIT_PASS = 0
+EXIT_REGRESSION = 1
+EXIT_INPUT_ERROR = 2
+EXIT_INCONCLUSIVE = 3
 
 def parse_stats_file(file_path):
     stats = {}
@@ -29,11 +33,12 @@ def parse_stats_file(file_path):
 
 def compare_stats(all_stats, all_names, baseline_index):
     comparison = {}
-    sections = list(all_stats[0].keys())
+    # A baseline stats file can hold sections the other runs lack, e.g. the tail estimates of bench_graphs.py
+    sections = [section for section in all_stats[0] if all(section in stats for stats in all_stats)]
 
     for section in sections:
         comparison[section] = {}
-        for key in all_stats[0][section]:
+        for key in [key for key in all_stats[0][section] if all(key in stats[section] for stats in all_stats)]:
             comparison[section][key] = {}
             for i, stats in enumerate(all_stats):
                 comparison[section][key][all_names[i]] = stats[section][key]
@@ -60,7 +65,46 @@ def get_color(value):
     else:
         return "#81c784"  # Light green
 
-def print_comparison_html(comparison, all_names, baseline_index, output_file=None):
+def change_color_class(pct_change, significant=None):
+    """
+    Returns the color class of a percent change. When the significance of the change is known,
+    only significant changes are colored.
+    """
+    if significant is not None and not significant:
+        return ""
+    if pct_change > 10:
+        return "color-red"
+    elif pct_change > 5:
+        return "color-yellow"
+    else:
+        return "color-green"
+
+def significance_table(significance, short_names, baseline_index, confidence):
+    """
+    Returns the HTML table of the bootstrap confidence intervals and rank test of every run against the baseline.
+    """
+    table = "<table>"
+    headers = ["Run", "Statistic", "Baseline", "Run Value", "Difference", f"{confidence:.0%} CI", f"{confidence:.0%} CI (% Change)", "Significant"]
+    table += "<tr>" + "".join(f"<th>{header}</th>" for header in headers) + "</tr>"
+    for i, comparison in enumerate(significance):
+        if i == baseline_index:
+            continue
+        for statistic, result in comparison.items():
+            if statistic == "rank_test":
+                continue
+            color_class = change_color_class(result["relative_low"] if result["low"] > 0 else result["relative_high"], result["significant"])
+            table += (f"<tr><td>{short_names[i]}</td><td>{statistic}</td><td>{result['base']:.6f}</td><td>{result['new']:.6f}</td>"
+                      f"<td>{result['difference']:.6f}</td><td>[{result['low']:.6f}, {result['high']:.6f}]</td>"
+                      f"<td class='{color_class}'>[{result['relative_low']:.2f}%, {result['relative_high']:.2f}%]</td>"
+                      f"<td>{'yes' if result['significant'] else 'no'}</td></tr>")
+        rank = comparison["rank_test"]
+        table += (f"<tr><td>{short_names[i]}</td><td>rank test</td><td colspan='4'>p = {rank['p_value']:.4g}, "
+                  f"P(iteration slower than baseline) = {rank['slower']:.3f}</td><td></td>"
+                  f"<td>{'yes' if rank['significant'] else 'no'}</td></tr>")
+    table += "</table>"
+    return table
+
+def print_comparison_html(comparison, all_names, baseline_index, output_file=None, significance=None, confidence=None):
     short_names = []
     run_counter = 1
     absolute_paths = []  # Store the absolute paths of each run
@@ -161,13 +205,11 @@ def print_comparison_html(comparison, all_names, baseline_index, output_file=Non
                 if i != baseline_index:
                     row += f"<td>{values[f'{all_names[i]}_diff']:.6f}</td>"
                     pct_change = values[f'{all_names[i]}_pct_change']
-                    color_class = ""
-                    if pct_change > 10:
-                        color_class = "color-red"
-                    elif pct_change > 5:
-                        color_class = "color-yellow"
-                    else:
-                        color_class = "color-green"
+                    significant = None
+                    if significance is not None:
+                        statistic = SIGNIFICANCE_METRICS.get(key) if section == SIGNIFICANCE_SECTION else None
+                        significant = statistic is not None and significance[i][statistic]["significant"]
+                    color_class = change_color_class(pct_change, significant)
                     row += f"<td class='{color_class}'>{pct_change:.2f}%</td>"
             row += "</tr>"
             table += row
@@ -175,6 +217,12 @@ def print_comparison_html(comparison, all_names, baseline_index, output_file=Non
         table += "</table>"
         output += table
 
+    if significance is not None:
+        output += "<h3>=== Significance (vs Baseline) ===</h3>\n"
+        output += (f"<p>Percentile bootstrap confidence intervals of the difference to the baseline and a Mann-Whitney U rank test. "
+                   f"Only changes whose {confidence:.0%} confidence interval excludes zero are colored.</p>")
+        output += significance_table(significance, short_names, baseline_index, confidence)
+
     # Finalize the HTML output
     output += "</body></html>"
 
@@ -190,32 +238,177 @@ def print_comparison_html(comparison, all_names, baseline_index, output_file=Non
 
 
 
+def metric_row(metric):
+    """
+    Returns the section and row of the statistics table holding a metric of significance.py.
+    """
+    rows = {statistic: key for key, statistic in SIGNIFICANCE_METRICS.items()}
+    if metric.startswith("normalized_"):
+        return NORMALIZED_SECTION, rows[metric[len("normalized_"):]]
+    return SIGNIFICANCE_SECTION, rows[metric]
+
+def parse_budgets(specs):
+    """
+    Parses budgets given as "<metric>=<percent>", e.g. "normalized_p99=3".
+    """
+    budgets = dict()
+    for spec in specs:
+        metric, _, budget = spec.partition("=")
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {', '.join(METRICS)}")
+        try:
+            budgets[metric] = float(budget)
+        except ValueError:
+            raise ValueError(f"Invalid budget {spec}, expected <metric>=<percent>")
+    return budgets
+
+def runs_by_bench(conn, folder):
+    """
+    Returns the durations of every benchmark of the single run in a folder.
+    """
+    runs = dict()
+    for result in query_durations(conn, [folder]):
+        if result["bench"] in runs:
+            raise ValueError(f"{folder} contains several runs of {result['bench']}")
+        runs[result["bench"]] = result
+    return runs
+
+def regression_gate(conn, baseline_dir, candidate_dir, budgets, resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE,
+                    seed=DEFAULT_SEED):
+    """
+    Checks the budget of every metric for every benchmark in both the baseline and the candidate run.
+    The change of every metric is taken from compare_stats, the verdict from bootstrap bounds of the change.
+    A benchmark of the baseline missing from the candidate, e.g. because it crashed or never ran, fails the gate.
+
+    Args:
+        conn (sqlite3.Connection): Results database holding both runs.
+        baseline_dir, candidate_dir (str): Log folders of the baseline and the candidate run.
+        budgets (dict): Allowed increase (%) by metric, see significance.METRICS.
+        resamples (int): Number of bootstrap resamples.
+        confidence (float): Confidence of the bounds a verdict is taken on.
+        seed (int): Seed of the bootstrap resampling.
+
+    Returns:
+        dict: The overall verdict, the result of every check and the benchmarks only found in one run.
+    """
+    from significance import bootstrap_samples, check_budget  # Imports numpy, which only the gate and --bootstrap need
+
+    baseline = runs_by_bench(conn, baseline_dir)
+    candidate = runs_by_bench(conn, candidate_dir)
+    checks = []
+    for bench in sorted(baseline.keys() & candidate.keys()):
+        durations = [baseline[bench]["durations"], candidate[bench]["durations"]]
+        comparison = compare_stats([execution_statistics(sorted(run)) for run in durations], ["baseline", "candidate"], 0)
+        bootstraps = bootstrap_samples(durations, resamples, seed)
+        for metric, budget in budgets.items():
+            section, key = metric_row(metric)
+            checks.append({
+                "bench": bench,
+                "metric": metric,
+                "budget_pct": budget,
+                "baseline": float(comparison[section][key]["baseline"]),
+                "candidate": float(comparison[section][key]["candidate"]),
+                "change_pct": float(comparison[section][key]["candidate_pct_change"]),
+                **check_budget(bootstraps[0], bootstraps[1], metric, budget, confidence),
+            })
+
+    missing = sorted(baseline.keys() - candidate.keys())
+    verdicts = {check["verdict"] for check in checks}
+    return {
+        "verdict": "fail" if "fail" in verdicts or missing else "inconclusive" if "inconclusive" in verdicts else "pass",
+        "baseline": os.path.abspath(baseline_dir),
+        "candidate": os.path.abspath(candidate_dir),
+        "confidence": confidence,
+        "resamples": resamples,
+        "seed": seed,
+        "budgets": budgets,
+        "checks": checks,
+        "unmatched": {"baseline": missing,
+                      "candidate": sorted(candidate.keys() - baseline.keys())},
+    }
+
 def main():
     parser = argparse.ArgumentParser(description="Compare benchmark results.")
     parser.add_argument("root_dirs", nargs="+", help="Root directories containing benchmark results.")
     parser.add_argument("--baseline", help="Absolute path to the baseline stats file.")
     parser.add_argument("--output", help="Path to the output HTML file.", default=None)
+    parser.add_argument("--db", help="Results database to ingest the root directories into and read them from (default: in memory).",
+                        default=None)
+    parser.add_argument("--bootstrap", action="store_true",
+                        help="Test the differences to the baseline for significance on the iteration durations and only color significant changes.")
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES, help="Number of bootstrap resamples (default: 2000).")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE, help="Confidence level of the bootstrap intervals (default: 0.95).")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed of the bootstrap resampling (default: 0).")
+    parser.add_argument("--gate", action="store_true",
+                        help="Check the candidate run (second root directory) against the budgets of the baseline run (first root directory) "
+                             "and print a JSON verdict. Exits with 1 if a metric is worse than its budget with the given confidence "
+                             "or a benchmark of the baseline is missing from the candidate.")
+    parser.add_argument("--budget", action="append", default=None, metavar="METRIC=PERCENT",
+                        help=f"Allowed increase of a metric in percent, repeatable. Metrics: {', '.join(METRICS)} "
+                             f"(default: mean=3 normalized_p99=3).")
+    parser.add_argument("--verdict", default=None, help="Path to additionally write the JSON verdict of --gate to.")
+    parser.add_argument("--strict", action="store_true", help="Exit with 3 when a budget check of --gate is inconclusive.")
     args = parser.parse_args()
 
-    stats_files = find_stats_files(args.root_dirs)
-    if not stats_files:
-        print("No _stats.txt files found in the provided directories.")
+    if args.gate:
+        if len(args.root_dirs) != 2:
+            parser.error("--gate takes a baseline and a candidate run folder")
+        try:
+            budgets = parse_budgets(args.budget) if args.budget else DEFAULT_BUDGETS
+        except ValueError as e:
+            parser.error(str(e))
+
+        conn = open_results(args.root_dirs, args.db)
+        try:
+            verdict = regression_gate(conn, *args.root_dirs, budgets, args.resamples, args.confidence, args.seed)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(EXIT_INPUT_ERROR)
+        if not verdict["checks"]:
+            print("The baseline and candidate run have no benchmark in common.", file=sys.stderr)
+            sys.exit(EXIT_INPUT_ERROR)
+
+        for check in verdict["checks"]:
+            print(f"{check['verdict']:<12} {check['bench']:<20} {check['metric']:<16} {check['change_pct']:+7.2f}% "
+                  f"[{check['low_pct']:+.2f}%, {check['high_pct']:+.2f}%], budget {check['budget_pct']:+.2f}%", file=sys.stderr)
+        for bench in verdict["unmatched"]["baseline"]:
+            print(f"{'fail':<12} {bench:<20} missing from the candidate run", file=sys.stderr)
+        print(json.dumps(verdict, indent=4))
+        if args.verdict:
+            with open(args.verdict, "w") as f:
+                f.write(json.dumps(verdict, indent=4))
+
+        if verdict["verdict"] == "fail":
+            sys.exit(EXIT_REGRESSION)
+        if verdict["verdict"] == "inconclusive" and args.strict:
+            sys.exit(EXIT_INCONCLUSIVE)
+        sys.exit(EXIT_PASS)
+
+    conn = open_results(args.root_dirs, args.db)
+    results = query_durations(conn, args.root_dirs)
+    if not results:
+        print("No benchmark results found in the provided directories.")
         return
 
     all_stats = []
     all_names = []
+    all_durations = []
 
-    # Load benchmark stats from root directories
-    for stats_file in stats_files:
-        name = os.path.relpath(stats_file, start=os.path.commonpath(args.root_dirs))
+    # Compute benchmark stats of every log folder in the root directories
+    common_path = os.path.commonpath([os.path.abspath(root_dir) for root_dir in args.root_dirs])
+    for result in results:
+        name = os.path.join(os.path.relpath(result["path"], start=common_path), result["bench"])
         all_names.append(name)
-        stats = parse_stats_file(stats_file)
-        all_stats.append(stats)
+        all_stats.append(execution_statistics(sorted(result["durations"])))
+        all_durations.append(result["durations"])
 
     # Handle baseline file if provided as an absolute path
     baseline_index = 0
     if args.baseline:
         baseline_path = os.path.abspath(args.baseline)
+        if args.bootstrap:
+            print("The bootstrap comparison needs the iteration durations of the baseline, pass its log folder first instead of --baseline.")
+            return
         if not os.path.isfile(baseline_path):
             print(f"Baseline file {baseline_path} not found.")
             return
@@ -225,8 +418,13 @@ def main():
         all_stats.insert(0, baseline_stats)  # Add baseline stats to the front
         baseline_index = 0  # Ensure baseline is the first entry
     
+    significance = None
+    if args.bootstrap:
+        from significance import compare_to_baseline
+        significance = compare_to_baseline(all_durations, baseline_index, args.resamples, args.confidence, args.seed)
+
     comparison = compare_stats(all_stats, all_names, baseline_index)
-    print_comparison_html(comparison, all_names, baseline_index, args.output)
+    print_comparison_html(comparison, all_names, baseline_index, args.output, significance, args.confidence)
 
 if __name__ == "__main__":
     main()
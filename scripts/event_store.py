@@ -0,0 +1,196 @@
+import numpy as np
+
+# Layout of a single noise event
+EVENT_DTYPE = np.dtype([
+    ("start", np.int64),
+    ("duration", np.int64),
+    ("priority", np.int8),
+    ("cpu", np.uint16),
+    ("task", np.uint32),
+])
+
+
+class EventStore:
+    """
+    Noise events of one trace in a single NumPy structured array, grouped by CPU and task.
+
+    Every (cpu, task) pair owns a contiguous slice of the events, sorted on start time with ties in
+    trace order, and all pairs of a CPU are adjacent. Slices are returned as views, so writing to them
+    updates the store. CPUs, and tasks within a CPU, keep the order in which they first appeared in the
+    trace, and a pair stays in the store when all of its events are removed.
+
+    Attributes:
+        events (np.ndarray): The events, with EVENT_DTYPE.
+        task_names [str]: Intern table mapping task ids to task names, shared with the parsed trace.
+        cpu_ids [int]: The CPU IDs in order. A CPU stays when all of its pairs are removed.
+        pair_cpu, pair_task (np.ndarray): CPU ID and task id of every pair, in order.
+        offsets (np.ndarray): Events of pair i are events[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, events, task_names, cpu_ids, pair_cpu, pair_task, offsets):
+        self.events = events
+        self.task_names = task_names
+        self.task_ids = {name: i for i, name in enumerate(task_names)}
+        self.cpu_ids = cpu_ids
+        self.pair_cpu = pair_cpu
+        self.pair_task = pair_task
+        self.offsets = offsets
+        self._index_pairs()
+
+    @classmethod
+    def from_arrays(cls, cpu, task, start, duration, priority, task_names, pair_cpu, pair_task):
+        """
+        Builds a store from event columns and the (cpu, task) pairs in the order they should be kept in.
+        Pairs are regrouped so that all pairs of a CPU are adjacent, keeping the order of the CPUs.
+
+        Args:
+            cpu, task, start, duration, priority (np.ndarray): One entry per event, in trace order.
+            task_names [str]: Intern table mapping task ids to task names.
+            pair_cpu, pair_task (np.ndarray): CPU ID and task id of every pair. Must contain every pair of the events.
+        """
+        cpu_ids, cpu_first = np.unique(pair_cpu, return_index=True)
+        cpu_ids = cpu_ids[np.argsort(cpu_first)]
+        cpu_rank = np.empty(int(cpu_ids.max(initial=0)) + 1, dtype=np.int64)
+        cpu_rank[cpu_ids] = np.arange(len(cpu_ids))
+        pair_order = np.argsort(cpu_rank[pair_cpu], kind="stable")
+        pair_cpu = np.asarray(pair_cpu)[pair_order]
+        pair_task = np.asarray(pair_task)[pair_order]
+
+        # Rank of every event's pair, then group the events by pair and sort on start time
+        task_amount = max(len(task_names), 1)
+        pair_key = pair_cpu.astype(np.int64) * task_amount + pair_task
+        key_order = np.argsort(pair_key)
+        event_key = cpu.astype(np.int64) * task_amount + task
+        event_rank = key_order[np.searchsorted(pair_key, event_key, sorter=key_order)]
+        order = np.lexsort((start, event_rank))
+
+        events = np.empty(len(order), dtype=EVENT_DTYPE)
+        events["start"] = start[order]
+        events["duration"] = duration[order]
+        events["priority"] = priority[order]
+        events["cpu"] = cpu[order]
+        events["task"] = task[order]
+
+        offsets = np.searchsorted(event_rank[order], np.arange(len(pair_cpu) + 1))
+        return cls(events, task_names, cpu_ids.tolist(), pair_cpu, pair_task, offsets)
+
+    def _index_pairs(self):
+        self.pairs = {(cpu, task): i for i, (cpu, task) in enumerate(zip(self.pair_cpu.tolist(), self.pair_task.tolist()))}
+        self.cpu_offsets = dict()
+        for i, cpu in enumerate(self.pair_cpu.tolist()):
+            # Pairs of a CPU are adjacent
+            low, _ = self.cpu_offsets.get(cpu, (i, i))
+            self.cpu_offsets[cpu] = (low, i + 1)
+
+    def __len__(self):
+        return len(self.events)
+
+    def cpus(self):
+        """
+        Returns the CPU IDs in order.
+        """
+        return list(self.cpu_ids)
+
+    def tasks(self, cpu):
+        """
+        Returns the names of the tasks on a CPU in order.
+        """
+        low, high = self.cpu_offsets.get(cpu, (0, 0))
+        return [self.task_names[task] for task in self.pair_task[low:high].tolist()]
+
+    def has(self, cpu, task_name):
+        """
+        Checks whether a task has a pair on a CPU.
+        """
+        return (cpu, self.task_ids.get(task_name)) in self.pairs
+
+    def view(self, cpu, task_name):
+        """
+        Returns the events of a task on a CPU as a view, or None if the task never ran on the CPU.
+        """
+        pair = self.pairs.get((cpu, self.task_ids.get(task_name)))
+        if pair is None:
+            return None
+        return self.events[self.offsets[pair]:self.offsets[pair + 1]]
+
+    def cpu_events(self, cpu):
+        """
+        Returns the events of all tasks on a CPU as a view, grouped by task in order.
+        """
+        low, high = self.cpu_offsets.get(cpu, (0, 0))
+        return self.events[self.offsets[low]:self.offsets[high]]
+
+    def items(self):
+        """
+        Iterates over the pairs in order as (cpu, task name, view of the events).
+        """
+        for i, (cpu, task) in enumerate(zip(self.pair_cpu.tolist(), self.pair_task.tolist())):
+            yield cpu, self.task_names[task], self.events[self.offsets[i]:self.offsets[i + 1]]
+
+    def counts(self):
+        """
+        Returns the number of events of every pair.
+        """
+        return np.diff(self.offsets)
+
+    def duration_sums(self):
+        """
+        Returns the total duration (ns) of the events of every pair.
+        """
+        sums = np.zeros(len(self.pair_cpu), dtype=np.int64)
+        non_empty = self.counts() > 0
+        if np.any(non_empty):
+            sums[non_empty] = np.add.reduceat(self.events["duration"], self.offsets[:-1][non_empty])
+        return sums
+
+    def keep(self, mask, pair_mask=None):
+        """
+        Keeps the events where mask is set and, if given, the pairs where pair_mask is set.
+        The CPUs stay in the store.
+        """
+        pair_of_event = np.repeat(np.arange(len(self.pair_cpu)), self.counts())
+        if pair_mask is not None:
+            mask = mask & pair_mask[pair_of_event]
+        kept_pairs = pair_of_event[mask]
+
+        if pair_mask is not None:
+            self.pair_cpu = self.pair_cpu[pair_mask]
+            self.pair_task = self.pair_task[pair_mask]
+            kept_pairs = (np.cumsum(pair_mask) - 1)[kept_pairs]
+        self.events = self.events[mask]
+        self.offsets = np.searchsorted(kept_pairs, np.arange(len(self.pair_cpu) + 1))
+        self._index_pairs()
+
+    def remove_task(self, task_name):
+        """
+        Removes a task and all of its events from every CPU.
+
+        Returns:
+            int: The number of CPUs the task was removed from.
+        """
+        task = self.task_ids.get(task_name)
+        pair_mask = self.pair_task != task
+        removed = len(pair_mask) - int(np.count_nonzero(pair_mask))
+        if removed:
+            self.keep(np.ones(len(self.events), dtype=bool), pair_mask)
+        return removed
+
+    def remove_zero_durations(self, task_names=None):
+        """
+        Removes the events without duration, only of the given tasks if task_names is set.
+        """
+        mask = self.events["duration"] != 0
+        if task_names is not None:
+            task_ids = [self.task_ids[name] for name in task_names if name in self.task_ids]
+            mask |= ~np.isin(self.events["task"], task_ids)
+        if not np.all(mask):
+            self.keep(mask)
+
+    def to_cpu_dict(self):
+        """
+        Builds the "dict(cpu, dict(task, list((start, duration, priority))))" representation of the store.
+        """
+        cpu_dict = {cpu: dict() for cpu in self.cpu_ids}
+        for cpu, task, events in self.items():
+            cpu_dict[cpu][task] = list(zip(events["start"].tolist(), events["duration"].tolist(), events["priority"].tolist()))
+        return cpu_dict
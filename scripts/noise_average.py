@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import math
+import argparse
+from trace_storage import stamp_matches, refresh_stamp
+
+# Constants
+PARTIAL_VERSION = 1
+PARTIAL_FILENAME = "noise_average.json"
+
+
+def _add_exact(partials, value):
+    """
+    Adds a float to a list of non-overlapping partial sums without rounding, see math.fsum.
+    """
+    i = 0
+    for partial in partials:
+        if abs(value) < abs(partial):
+            value, partial = partial, value
+        high = value + partial
+        low = partial - (high - value)
+        if low:
+            partials[i] = low
+            i += 1
+        value = high
+    partials[i:] = [value]
+
+
+def trace_sums(event_store):
+    """
+    Sums the number of events and their duration for every CPU and task of a parsed trace.
+
+    Args:
+        event_store (EventStore): The events of one trace.
+
+    Returns:
+        dict: The event count and total duration for each CPU and task present in the trace.
+    """
+    sums = dict()
+    counts = event_store.counts().tolist()
+    durations = event_store.duration_sums().tolist()
+    for (cpu, task, _), count, duration in zip(event_store.items(), counts, durations):
+        if count > 0:
+            sums.setdefault(cpu, {})[task] = (count, duration)
+    return sums
+
+
+class AveragePartial:
+    """
+    Mergeable state of the average noise of a set of traces.
+
+    For every CPU and task the event count, the sum of the per-trace frequencies and the total duration
+    are kept, together with the number of traces and the stamp of every trace added. Frequencies are
+    summed without rounding, so partials of separate trace folders merge to exactly the same
+    state as adding all traces to one partial, in any order. Traces rejected for the events the tracer
+    lost are kept as well, so they are not parsed again.
+
+    Attributes:
+        workload_name (str): The name of the task representing the workload.
+        traces (dict): Stamp and workload duration of every trace added, by absolute path.
+        rejected (dict): Stamp and number of lost events of every trace rejected, by absolute path.
+        sums (dict): Event count, frequency partial sums and total duration for each CPU and task.
+        worst (str): Path of the first added trace with the longest workload duration, or None.
+    """
+
+    def __init__(self, workload_name):
+        self.workload_name = workload_name
+        self.traces = dict()
+        self.rejected = dict()
+        self.sums = dict()
+        self.worst = None
+
+    def __len__(self):
+        return len(self.traces)
+
+    def __contains__(self, trace_file):
+        return os.path.abspath(trace_file) in self.traces
+
+    def add(self, trace_file, total_duration, sums, stamp=None):
+        """
+        Adds one trace to the partial.
+
+        Args:
+            trace_file (str): Path to the trace file.
+            total_duration (int): The workload duration (ns) of the trace.
+            sums (dict): The event counts and durations of the trace as returned by trace_sums.
+            stamp (dict): The file stamp of the trace, see trace_cache.file_stamp. Needed to detect changed
+                traces once the partial is saved.
+        """
+        trace_file = os.path.abspath(trace_file)
+        if trace_file in self.traces:
+            raise ValueError(f"{trace_file} was already added to the average")
+        self.traces[trace_file] = {"stamp": stamp, "duration": total_duration}
+        self.rejected.pop(trace_file, None)
+        for cpu, tasks in sums.items():
+            cpu_sums = self.sums.setdefault(cpu, {})
+            for task, (count, duration) in tasks.items():
+                task_sums = cpu_sums.setdefault(task, [0, [], 0])
+                task_sums[0] += count
+                _add_exact(task_sums[1], count / total_duration)
+                task_sums[2] += duration
+        self._update_worst(trace_file, total_duration)
+
+    def reject(self, trace_file, lost_events, stamp=None):
+        """
+        Records a trace that was not added because the tracer lost too many events in it.
+        """
+        self.rejected[os.path.abspath(trace_file)] = {"stamp": stamp, "lost_events": lost_events}
+
+    def was_rejected(self, trace_file, max_lost_events=None):
+        """
+        Checks whether a trace was rejected before and lost more than max_lost_events events, so parsing
+        it again would reject it again. Traces are never rejected without a maximum.
+        """
+        rejected = self.rejected.get(os.path.abspath(trace_file))
+        return rejected is not None and max_lost_events is not None and rejected["lost_events"] > max_lost_events
+
+    def _update_worst(self, trace_file, total_duration):
+        if self.worst is None or total_duration > self.traces[self.worst]["duration"]:
+            self.worst = trace_file
+
+    def merge(self, other):
+        """
+        Adds every trace of another partial. Both partials must be of the same workload and
+        must not share traces.
+        """
+        if other.workload_name != self.workload_name:
+            raise ValueError(f"Cannot merge averages of workloads {self.workload_name} and {other.workload_name}")
+        shared = self.traces.keys() & other.traces.keys()
+        if shared:
+            raise ValueError(f"Both averages contain {min(shared)}")
+
+        self.traces.update(other.traces)
+        self.rejected.update(other.rejected)
+        for trace_file in self.traces.keys() & self.rejected.keys():
+            del self.rejected[trace_file]
+        for cpu, tasks in other.sums.items():
+            cpu_sums = self.sums.setdefault(cpu, {})
+            for task, (count, frequencies, duration) in tasks.items():
+                task_sums = cpu_sums.setdefault(task, [0, [], 0])
+                task_sums[0] += count
+                for frequency in frequencies:
+                    _add_exact(task_sums[1], frequency)
+                task_sums[2] += duration
+        if other.worst is not None:
+            self._update_worst(other.worst, other.traces[other.worst]["duration"])
+
+    def changed_traces(self):
+        """
+        Returns the paths of the added traces that were modified or removed since. Traces added without a stamp
+        are always reported. The modification times of unchanged traces are refreshed, so their content hash
+        is only recomputed once after copying a folder. Rejected traces that changed are forgotten, so they are parsed again.
+        """
+        changed = []
+        for trace_file, trace in self.traces.items():
+            if trace["stamp"] is None or not stamp_matches(trace_file, trace["stamp"]):
+                changed.append(trace_file)
+            else:
+                trace["stamp"] = refresh_stamp(trace_file, trace["stamp"])
+        for trace_file, trace in list(self.rejected.items()):
+            if trace["stamp"] is None or not stamp_matches(trace_file, trace["stamp"]):
+                del self.rejected[trace_file]
+            else:
+                trace["stamp"] = refresh_stamp(trace_file, trace["stamp"])
+        return changed
+
+    def average(self):
+        """
+        Calculates the average frequency and duration for each task on each CPU over all added traces.
+
+        Returns:
+            dict: A dictionary containing the average frequency and durations for each CPU and task.
+        """
+        trace_amount = len(self.traces)
+        average_dict = dict()
+        for cpu, tasks in self.sums.items():
+            for task, (_, frequencies, duration) in tasks.items():
+                average_dict.setdefault(cpu, {})[task] = (math.fsum(frequencies) / trace_amount, int(duration // trace_amount))
+        return average_dict
+
+    def to_json(self, folder):
+        """
+        Returns the partial as a JSON object, with trace paths relative to the folder it is stored in.
+        """
+        return {
+            "version": PARTIAL_VERSION,
+            "workload_name": self.workload_name,
+            "traces": {os.path.relpath(trace_file, folder): trace for trace_file, trace in self.traces.items()},
+            "rejected": {os.path.relpath(trace_file, folder): trace for trace_file, trace in self.rejected.items()},
+            "worst": None if self.worst is None else os.path.relpath(self.worst, folder),
+            "sums": {str(cpu): tasks for cpu, tasks in self.sums.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data, folder):
+        """
+        Builds a partial from a JSON object written by to_json.
+        """
+        if data.get("version") != PARTIAL_VERSION:
+            raise ValueError(f"Unsupported average version {data.get('version')}, expected {PARTIAL_VERSION}")
+        partial = cls(data["workload_name"])
+        partial.traces = {os.path.normpath(os.path.join(folder, trace_file)): trace for trace_file, trace in data["traces"].items()}
+        # Partials written before rejected traces were kept have none
+        partial.rejected = {os.path.normpath(os.path.join(folder, trace_file)): trace
+                            for trace_file, trace in data.get("rejected", {}).items()}
+        partial.worst = None if data["worst"] is None else os.path.normpath(os.path.join(folder, data["worst"]))
+        partial.sums = {int(cpu): tasks for cpu, tasks in data["sums"].items()}
+        return partial
+
+
+def partial_path(trace_path):
+    """
+    Returns the path of the average partial stored in a trace folder. Other paths are returned as is.
+    """
+    return os.path.join(trace_path, PARTIAL_FILENAME) if os.path.isdir(trace_path) else trace_path
+
+
+def load_partial(path):
+    """
+    Reads an average partial from a file, or from the partial file of a trace folder.
+    """
+    path = os.path.abspath(partial_path(path))
+    with open(path, "r") as f:
+        return AveragePartial.from_json(json.load(f), os.path.dirname(path))
+
+
+def open_partial(trace_path, workload_name):
+    """
+    Reads the average partial of a trace folder to add new traces to. A new partial is returned if there is none,
+    if it is of another workload, or if one of its traces was changed or removed since.
+    """
+    path = partial_path(trace_path)
+    if not os.path.isfile(path):
+        return AveragePartial(workload_name)
+    partial = load_partial(path)
+    if partial.workload_name != workload_name:
+        print(f"Average partial is of workload {partial.workload_name}, rebuilding it")
+        return AveragePartial(workload_name)
+    changed = partial.changed_traces()
+    if changed:
+        print(f"{len(changed)} averaged traces were changed or removed, rebuilding the average partial")
+        return AveragePartial(workload_name)
+    return partial
+
+
+def save_partial(partial, path):
+    """
+    Writes an average partial to a file, or to the partial file of a trace folder.
+    The file is replaced atomically so an interrupted write never leaves a broken partial.
+    """
+    path = os.path.abspath(partial_path(path))
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(partial.to_json(os.path.dirname(path)), f)
+    os.replace(temp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the average noise partials of several trace folders.")
+    parser.add_argument("output", type=str, help="Path to the merged partial file.")
+    parser.add_argument("partials", type=str, nargs="+", help="Partial files, or trace folders containing one.")
+    args = parser.parse_args()
+
+    merged = None
+    for path in args.partials:
+        partial = load_partial(path)
+        if merged is None:
+            merged = partial
+        else:
+            merged.merge(partial)
+    changed = merged.changed_traces()
+    if changed:
+        print(f"Warning: {len(changed)} traces changed since they were averaged, e.g. {changed[0]}", file=sys.stderr)
+    save_partial(merged, args.output)
+    print(f"Merged {len(merged)} traces into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,11 @@
-import json
+from noise_schedule import load_noise_config
 import matplotlib.pyplot as plt
 import numpy as np
 import argparse
 import os
 
 def load_noise_data(file_path):
-    with open(file_path, "r") as f:
-        return json.load(f)
+    return load_noise_config(file_path)
 
 def save_plot(plt, filename, output_dir):
     os.makedirs(output_dir, exist_ok=True)
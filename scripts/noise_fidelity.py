@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from trace_cache import load_trace
+from trace_storage import list_trace_files
+from noise_schedule import load_noise_config
+
+# Constants
+DEFAULT_WORKLOAD_NAME = "main"
+DEFAULT_INJECTOR_NAME = "cpuoccupy"
+DEFAULT_MAX_LAG = 100000
+PERCENTILES = (50, 90, 99, 100)
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare an injected noise configuration with the noise observed in the traces captured during injection."
+    )
+    parser.add_argument("trace_folder_path", type=str,
+                        help="Path to the folder containing the traces captured while injecting noise.")
+    parser.add_argument("noise_config", type=str,
+                        help="Path to the injected JSON or binary noise configuration.")
+    parser.add_argument("-w", "--workload_name", type=str, default=DEFAULT_WORKLOAD_NAME,
+                        help="Name of the workload task (default: 'main').")
+    parser.add_argument("-i", "--injector_name", type=str, default=DEFAULT_INJECTOR_NAME,
+                        help="Name of the noise injecting task (default: 'cpuoccupy').")
+    parser.add_argument("--max_lag", type=int, default=DEFAULT_MAX_LAG,
+                        help="Time in nanoseconds an observed noise may start after the end of an injected noise and still be matched to it (default: 100000).")
+    parser.add_argument("-o", "--output_filename", type=str, default=None,
+                        help="JSON file to write the fidelity report to.")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Always re-parse trace files instead of reading and writing the parsed trace cache.")
+    return parser.parse_args()
+
+
+def injected_arrays(noise_dict):
+    """
+    Flattens a noise dict into arrays sorted on core and start time.
+    Noises without duration only change the priority of the injector and are left out.
+
+    Returns:
+        tuple: Arrays of core IDs, start times (ns) and durations (ns).
+    """
+    cores, starts, durations = [], [], []
+    for core, noises in noise_dict.items():
+        for (start, duration, priority) in noises:
+            if duration > 0:
+                cores.append(int(core))
+                starts.append(start)
+                durations.append(duration)
+
+    core, start, duration = (np.array(values, dtype=np.int64) for values in (cores, starts, durations))
+    order = np.lexsort((start, core))
+    return core[order], start[order], duration[order]
+
+
+def observed_arrays(trace, workload_name, injector_name):
+    """
+    Selects the noise caused by the injector within the workload window of a trace.
+    Time instant 0 is set to the workload start, as in the noise configuration.
+
+    Returns:
+        tuple: Arrays of core IDs, start times (ns) and durations (ns), sorted on core and start time.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    workload_start = trace.workload_start(workload_name)
+    if workload_start < 0 or injector_name not in trace.task_names:
+        return empty, empty, empty
+
+    start = np.asarray(trace.start) - workload_start
+    duration = np.asarray(trace.duration, dtype=np.int64)
+    keep = (np.asarray(trace.task) == trace.task_names.index(injector_name)) & \
+        (start + duration > 0) & (start <= trace.total_duration)
+
+    core = np.asarray(trace.cpu, dtype=np.int64)[keep]
+    start, duration = start[keep], duration[keep]
+    order = np.lexsort((start, core))
+    return core[order], start[order], duration[order]
+
+
+def match_noises(injected, observed, max_lag=DEFAULT_MAX_LAG):
+    """
+    Matches observed noise to injected noise on every core at once with sorted-array interval intersection.
+
+    Core and time are combined into a single sort key, so one searchsorted over all cores finds the first
+    injected noise, extended by max_lag, that each observed noise overlaps. An injected noise interrupted
+    by other noise shows up as several observed noises, which are all matched to it.
+
+    Args:
+        injected (tuple): Core, start and duration arrays of the injected noise, see injected_arrays.
+        observed (tuple): Core, start and duration arrays of the observed noise, see observed_arrays.
+        max_lag (int): Time in nanoseconds an observed noise may start after the end of an injected noise.
+
+    Returns:
+        tuple: Per injected noise the number of matched observed noises, the start lag (ns) of the first
+            match and the duration error (ns) of all matches, followed by the number of unmatched observed noises per core.
+    """
+    inj_core, inj_start, inj_duration = injected
+    obs_core, obs_start, obs_duration = observed
+
+    # Shift all times to be positive and leave room for the longest noise between cores
+    base = min(inj_start.min(initial=0), obs_start.min(initial=0))
+    stride = max((inj_start + inj_duration).max(initial=0), (obs_start + obs_duration).max(initial=0)) - base + max_lag + 1
+    inj_key_start = inj_core * stride + (inj_start - base)
+    inj_key_end = inj_key_start + inj_duration + max_lag
+    obs_key_start = obs_core * stride + (obs_start - base)
+    obs_key_end = obs_key_start + obs_duration
+
+    candidate = np.searchsorted(inj_key_end, obs_key_start, side="right")
+    valid = candidate < len(inj_core)
+    valid[valid] = inj_key_start[candidate[valid]] < obs_key_end[valid]
+    matched = candidate[valid]
+
+    counts = np.bincount(matched, minlength=len(inj_core))
+    first_start = np.full(len(inj_core), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first_start, matched, obs_start[valid])
+    observed_duration = np.zeros(len(inj_core), dtype=np.int64)
+    np.add.at(observed_duration, matched, obs_duration[valid])
+
+    start_lag = np.where(counts > 0, first_start - inj_start, 0)
+    duration_error = observed_duration - inj_duration
+    extra_cores, extra_counts = np.unique(obs_core[~valid], return_counts=True)
+    return counts, start_lag, duration_error, dict(zip(extra_cores.tolist(), extra_counts.tolist()))
+
+
+def percentiles(values):
+    """
+    Returns the reported percentiles of an array, or None for every percentile if it is empty.
+    """
+    if len(values) == 0:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def fidelity_report(trace_files, trace_path, noise_dict, workload_name, injector_name, max_lag=DEFAULT_MAX_LAG, use_cache=True):
+    """
+    Compares the injected noise with the noise observed in every trace.
+
+    Args:
+        trace_files [str]: The trace file names.
+        trace_path (str): The path to the directory containing the trace files.
+        noise_dict (dict): The injected noise configuration.
+        workload_name (str): The name of the task representing the workload.
+        injector_name (str): The name of the noise injecting task.
+        max_lag (int): Time in nanoseconds an observed noise may start after the end of an injected noise.
+        use_cache (bool): Controls whether the parsed trace cache is used.
+
+    Returns:
+        dict: Per core the number of injected, missed and extra noises together with start lag,
+            duration error and per-trace missed percentage percentiles.
+    """
+    injected = injected_arrays(noise_dict)
+    inj_core = injected[0]
+    cores = np.unique(inj_core).tolist()
+
+    start_lags = {core: [] for core in cores}
+    duration_errors = {core: [] for core in cores}
+    missed_pcts = {core: [] for core in cores}
+    missed = dict.fromkeys(cores, 0)
+    extra = dict.fromkeys(cores, 0)
+
+    for file in trace_files:
+        trace = load_trace(file, trace_path, use_cache, workload_name)
+        counts, start_lag, duration_error, extra_counts = \
+            match_noises(injected, observed_arrays(trace, workload_name, injector_name), max_lag)
+        if trace.workload_start(workload_name) < 0:
+            print(f"No workload found in {file}")
+        if trace.lost_events > 0:
+            print(f"Warning: {file} lost {trace.lost_events} events")
+
+        for core in cores:
+            on_core = inj_core == core
+            hit = on_core & (counts > 0)
+            start_lags[core].append(start_lag[hit])
+            duration_errors[core].append(duration_error[hit])
+            missed[core] += int(np.count_nonzero(on_core & (counts == 0)))
+            missed_pcts[core].append(100 * np.count_nonzero(on_core & (counts == 0)) / np.count_nonzero(on_core))
+            extra[core] += extra_counts.get(core, 0)
+
+    report = dict()
+    for core in cores:
+        injected_amount = int(np.count_nonzero(inj_core == core)) * len(trace_files)
+        report[str(core)] = {
+            "injected": injected_amount,
+            "missed": missed[core],
+            "missed_pct": 100 * missed[core] / injected_amount if injected_amount else None,
+            "extra": extra[core],
+            "start_lag_ns": percentiles(np.concatenate(start_lags[core]) if trace_files else []),
+            "duration_error_ns": percentiles(np.concatenate(duration_errors[core]) if trace_files else []),
+            "missed_pct_per_trace": percentiles(missed_pcts[core]),
+        }
+    return report
+
+
+def print_report(report):
+    """
+    Prints a fidelity report as one table row per core.
+    """
+    def fmt(value):
+        return "-" if value is None else f"{value:.0f}"
+
+    print(f"{'core':>5} {'injected':>9} {'missed%':>8} {'extra':>6} "
+          f"{'lag p50':>9} {'lag p99':>9} {'lag max':>9} {'err p50':>9} {'err p99':>9} {'miss% p90':>10}")
+    for core, stats in report.items():
+        print(f"{core:>5} {stats['injected']:>9} {fmt(stats['missed_pct']):>8} {stats['extra']:>6} "
+              f"{fmt(stats['start_lag_ns']['p50']):>9} {fmt(stats['start_lag_ns']['p99']):>9} {fmt(stats['start_lag_ns']['p100']):>9} "
+              f"{fmt(stats['duration_error_ns']['p50']):>9} {fmt(stats['duration_error_ns']['p99']):>9} "
+              f"{fmt(stats['missed_pct_per_trace']['p90']):>10}")
+
+
+def main():
+    args = parse_arguments()
+    trace_path = os.path.normpath(args.trace_folder_path)
+
+    if not os.path.isfile(args.noise_config):
+        print(f"Error: Noise configuration not found: {args.noise_config}")
+        sys.exit(1)
+
+    trace_files = list_trace_files(trace_path)
+    trace_files.sort(key=lambda file: int(file.split("-")[2]))  # Sort by trace number
+    print(f"Number of traces: {len(trace_files)}")
+
+    report = fidelity_report(trace_files, trace_path, load_noise_config(args.noise_config),
+                             args.workload_name, args.injector_name, args.max_lag, not args.no_cache)
+    print_report(report)
+
+    if args.output_filename:
+        with open(args.output_filename, "w") as f:
+            f.write(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
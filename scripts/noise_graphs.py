@@ -127,7 +127,7 @@ def generate_plots(df, output_dir):
     plt.savefig(os.path.join(output_dir, 'all_cores_distribution_plots.png'))
     plt.close()
 
-def main(folder_path, output_path):
+def plot_noise_folder(folder_path, output_path):
     # Create the output directory if it doesn't exist
     os.makedirs(output_path, exist_ok=True)
 
@@ -145,11 +145,14 @@ def main(folder_path, output_path):
 
             print(f"Plots saved in the directory: '{output_path}'")
 
-if __name__ == "__main__":
+def main():
     if len(sys.argv) != 3:
         print("Usage: python noise_graphs.py <path_to_folder> <path_to_output_folder>")
         sys.exit(1)
     
     folder_path = sys.argv[1]  
     output_path = sys.argv[2]
-    main(folder_path, output_path)
+    plot_noise_folder(folder_path, output_path)
+
+if __name__ == "__main__":
+    main()
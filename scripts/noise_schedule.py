@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import struct
+import argparse
+
+# Binary noise schedule layout (little-endian), read by noiseinjector/cpuoccupy.cpp:
+#   header:       magic (8 bytes), version (uint32), core count (uint32)
+#   offset table: one entry per core: core id (int32), reserved (uint32),
+#                 byte offset of the first record (uint64), record count (uint64)
+#   records:      packed start (int64), duration (int64), priority (int32), sorted on start per core
+SCHEDULE_MAGIC = b"PVNOISE1"
+SCHEDULE_VERSION = 1
+HEADER_FORMAT = struct.Struct("<8sII")
+ENTRY_FORMAT = struct.Struct("<iIQQ")
+RECORD_FORMAT = struct.Struct("<qqi")
+
+
+def is_binary_schedule(path):
+    """
+    Checks whether a noise configuration file is a binary noise schedule.
+    """
+    with open(path, "rb") as f:
+        return f.read(len(SCHEDULE_MAGIC)) == SCHEDULE_MAGIC
+
+
+def write_binary_schedule(noise_dict, path):
+    """
+    Writes a noise dict to a binary noise schedule.
+
+    Args:
+        noise_dict (dict): Dictionary mapping CPU IDs to lists of noise events (start time, duration, priority).
+        path (str): Path of the binary noise schedule.
+    """
+    cores = sorted(noise_dict.keys(), key=int)
+    offset = HEADER_FORMAT.size + ENTRY_FORMAT.size * len(cores)
+
+    with open(path, "wb") as f:
+        f.write(HEADER_FORMAT.pack(SCHEDULE_MAGIC, SCHEDULE_VERSION, len(cores)))
+        for core in cores:
+            f.write(ENTRY_FORMAT.pack(int(core), 0, offset, len(noise_dict[core])))
+            offset += RECORD_FORMAT.size * len(noise_dict[core])
+
+        for core in cores:
+            previous_start = None
+            for (start, duration, priority) in noise_dict[core]:
+                # cpuoccupy requires every core's noises in cronological order
+                if previous_start is not None and start <= previous_start:
+                    raise ValueError(f"Noise on core {core} not in cronological order: {start} after {previous_start}")
+                previous_start = start
+                f.write(RECORD_FORMAT.pack(start, duration, priority))
+
+
+def read_binary_schedule(path):
+    """
+    Reads a binary noise schedule into a noise dict with the same layout as the JSON configuration.
+
+    Args:
+        path (str): Path of the binary noise schedule.
+
+    Returns:
+        dict: Dictionary mapping CPU IDs (str) to lists of noise events [start time, duration, priority].
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, core_count = HEADER_FORMAT.unpack_from(data, 0)
+    if magic != SCHEDULE_MAGIC or version != SCHEDULE_VERSION:
+        raise ValueError(f"{path} is not a version {SCHEDULE_VERSION} binary noise schedule")
+
+    noise_dict = dict()
+    for i in range(core_count):
+        core_id, _, offset, count = ENTRY_FORMAT.unpack_from(data, HEADER_FORMAT.size + i * ENTRY_FORMAT.size)
+        noise_dict[str(core_id)] = [list(record) for record in
+                                    RECORD_FORMAT.iter_unpack(data[offset:offset + count * RECORD_FORMAT.size])]
+    return noise_dict
+
+
+def read_core_ids(path):
+    """
+    Returns the core IDs (str) present in a JSON or binary noise configuration, without reading the noises.
+    """
+    if not is_binary_schedule(path):
+        with open(path, "r") as f:
+            return list(json.load(f).keys())
+
+    with open(path, "rb") as f:
+        _, _, core_count = HEADER_FORMAT.unpack(f.read(HEADER_FORMAT.size))
+        table = f.read(ENTRY_FORMAT.size * core_count)
+    return [str(entry[0]) for entry in ENTRY_FORMAT.iter_unpack(table)]
+
+
+def load_noise_config(path):
+    """
+    Loads a JSON or binary noise configuration into a noise dict with CPU IDs (str) as keys.
+    """
+    if is_binary_schedule(path):
+        return read_binary_schedule(path)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_json_config(noise_dict, path):
+    """
+    Writes a noise dict to a JSON noise configuration.
+    """
+    json_string = json.dumps(noise_dict, indent=4)
+    with open(path, "w") as f:
+        f.write(json_string)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert noise configurations between the JSON and binary formats.")
+    parser.add_argument("input_file", type=str, help="Path to the JSON or binary noise configuration.")
+    parser.add_argument("output_file", type=str, nargs="?", default=None,
+                        help="Path of the converted noise configuration. The format is the opposite of the input format.")
+    parser.add_argument("--count", action="store_true",
+                        help="Print the number of cores in the noise configuration instead of converting it.")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.input_file):
+        print(f"Error: Noise configuration not found: {args.input_file}")
+        sys.exit(1)
+
+    if args.count:
+        print(len(read_core_ids(args.input_file)))
+        return
+
+    if args.output_file is None:
+        print("Error: No output file specified.")
+        sys.exit(1)
+
+    if is_binary_schedule(args.input_file):
+        write_json_config(read_binary_schedule(args.input_file), args.output_file)
+    else:
+        write_binary_schedule(load_noise_config(args.input_file), args.output_file)
+
+
+if __name__ == "__main__":
+    main()
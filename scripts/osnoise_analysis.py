@@ -5,26 +5,17 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from collections import defaultdict
+from benchout_reader import read_benchout
+from trace_storage import open_trace, benchout_path, strip_compression, TRACE_SUFFIX
+from quantile_sketch import TDigest, sketch_path, save_sketch
 
 def parse_benchout(filepath):
     """
     Parses a .benchout file to extract the start and end times.
     Returns a tuple (start_time, end_time).
     """
-    start_time_pattern = re.compile(r"Start time: ([\d.]+) seconds")
-    end_time_pattern = re.compile(r"End time: ([\d.]+) seconds")
-
-    start_time = None
-    end_time = None
-
-    with open(filepath, "r") as file:
-        for line in file:
-            start_match = start_time_pattern.search(line)
-            end_match = end_time_pattern.search(line)
-            if start_match:
-                start_time = float(start_match.group(1))
-            if end_match:
-                end_time = float(end_match.group(1))
+    times = read_benchout(filepath)
+    start_time, end_time = times.start, times.end
 
     if start_time is None or end_time is None:
         raise ValueError("Could not find start or end time in the benchout file.")
@@ -42,7 +33,7 @@ def parse_osnoise_trace(filepath, main_task_name, start_time, end_time):
     
     noise_data = defaultdict(list)
     
-    with open(filepath, "r") as file:
+    with open_trace(filepath, "r") as file:
         for line in file:
             match = osnoise_pattern.search(line)
             if match:
@@ -148,12 +139,15 @@ def plot_interarrival_times(noise_data):
 def noise_characterization(noise_data):
     """
     Analyzes and characterizes noise durations across all CPUs.
+
+    Returns:
+        TDigest: A sketch of the noise durations (µs) to merge with other runs, or None if there are no noise events.
     """
     all_durations = [event[1] for events in noise_data.values() for event in events]
     
     if not all_durations:
         print("No noise events to analyze.")
-        return
+        return None
 
     mean_duration = np.mean(all_durations)
     median_duration = np.median(all_durations)
@@ -166,6 +160,10 @@ def noise_characterization(noise_data):
     print(f"Standard Deviation: {std_duration:.2f} µs")
     print(f"Percentiles (25, 50, 75, 90, 95): {percentiles}")
 
+    sketch = TDigest()
+    sketch.update(all_durations)
+    return sketch
+
 def main():
     if len(sys.argv) < 3:
         print("Usage: python plot_osnoise.py <osnoise_trace_file> <main_task_name>")
@@ -174,7 +172,7 @@ def main():
     trace_filepath = sys.argv[1]
     main_task_name = sys.argv[2]
 
-    benchout_filepath = trace_filepath.rsplit('.', 1)[0] + ".benchout"
+    benchout_filepath = benchout_path(trace_filepath)
     
     if not os.path.isfile(trace_filepath) or not os.path.isfile(benchout_filepath):
         print("Invalid file path.")
@@ -186,7 +184,11 @@ def main():
     # Parse the osnoise trace file and filter by the start and end times
     noise_data = parse_osnoise_trace(trace_filepath, main_task_name, start_time, end_time)
 
-    noise_characterization(noise_data)
+    sketch = noise_characterization(noise_data)
+    if sketch is not None:
+        # Saved next to the trace, e.g. nbody-omp-1-sys-noise.digest.json
+        trace_name = os.path.basename(strip_compression(trace_filepath))[:-len(TRACE_SUFFIX)]
+        save_sketch(sketch, sketch_path(os.path.dirname(trace_filepath), trace_name, "noise"))
     plot_noise_frequency(noise_data)
     plot_noise_durations(noise_data)
     plot_heatmap(noise_data)
@@ -0,0 +1,80 @@
+import sys
+import importlib
+
+# Subcommands and the script whose main() runs each of them. A script is only imported once its subcommand
+# is chosen, so a subcommand never pays for the dependencies of the others. Commands holding a dict
+# select one of several scripts, e.g. "perfvar graphs bench".
+COMMANDS = {
+    "config": ("traces_to_noise_config", "Generate a noise configuration from the traces of a benchmark."),
+    "analyze": {
+        "fidelity": ("noise_fidelity", "Compare injected noise with the noise observed in traces."),
+        "cache": ("trace_cache", "Parse traces into the trace cache."),
+        "average": ("noise_average", "Merge the average noise partials of several trace folders."),
+        "compress": ("trace_storage", "Compress the traces of log folders."),
+        "schedule": ("noise_schedule", "Convert noise configurations between the JSON and binary formats."),
+        "results": ("results_db", "Ingest and summarize benchmark results in the results database."),
+        "table": ("table_of_avg", "Tabulate the average execution times of benchmark runs."),
+        "tail": ("tail_model", "Estimate extreme quantiles of execution times with tail models."),
+        "sketch": ("quantile_sketch", "Merge the quantile sketches saved next to runs."),
+        "synthetic": ("synthetic_traces", "Generate synthetic traces."),
+        "benchmark": ("analysis_benchmark", "Time the stages of the noise configuration generation."),
+        "startup": ("perfvar.startup", "Time the startup of every perfvar subcommand."),
+    },
+    "graphs": {
+        "bench": ("bench_graphs", "Plot the execution times of the benchmarks in a log folder."),
+        "combined": ("combined_execution_graph", "Plot the execution times of several runs together."),
+        "noise": ("noise_graphs", "Plot the noise injector output of a log folder."),
+        "config": ("noise_config_graphs", "Plot a noise configuration."),
+        "osnoise": ("osnoise_analysis", "Plot and summarize the osnoise of a single trace."),
+    },
+    "compare": ("compare_benchmark", "Compare the execution times of benchmark runs."),
+    "inject": ("run_noise", "Inject noise with cpuoccupy on multiple cores."),
+    "watch": ("trace_watcher", "Parse the traces of a running benchmark in the background."),
+    "capture": ("trace_capture", "Stream trace_pipe into a trace file."),
+    "stop": ("stopping_rule", "Decide whether a benchmark has run enough iterations."),
+}
+
+
+def usage(path, commands):
+    """
+    Returns the usage message listing the commands available after the command names in path.
+    """
+    lines = [f"usage: {' '.join(['perfvar'] + path)} <command> [arguments]", "", "commands:"]
+    for name, command in commands.items():
+        description = command[1] if isinstance(command, tuple) else f"One of: {', '.join(command)}."
+        lines.append(f"  {name:<12}{description}")
+    return "\n".join(lines)
+
+
+def resolve(argv):
+    """
+    Follows the command names at the start of argv through COMMANDS.
+
+    Returns:
+        tuple: The command names, the commands found after them and the remaining arguments.
+            The commands are a (module, description) tuple once a script is selected.
+    """
+    path = []
+    commands = COMMANDS
+    argv = list(argv)
+    while isinstance(commands, dict) and argv and argv[0] in commands:
+        path.append(argv.pop(0))
+        commands = commands[path[-1]]
+    return path, commands, argv
+
+
+def main(argv=None):
+    path, commands, argv = resolve(sys.argv[1:] if argv is None else argv)
+    if isinstance(commands, dict):
+        if argv and argv[0] in ("-h", "--help"):
+            print(usage(path, commands))
+            sys.exit(0)
+        print(usage(path, commands), file=sys.stderr)
+        if argv:
+            print(f"perfvar: unknown command '{' '.join(path + argv[:1])}'", file=sys.stderr)
+        sys.exit(2)
+
+    module_name, _ = commands
+    # The scripts read their arguments from sys.argv, and argparse names them after sys.argv[0]
+    sys.argv = [" ".join(["perfvar"] + path)] + argv
+    importlib.import_module(module_name).main()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+if not __package__:
+    # Run as "python3 scripts/perfvar", the scripts and this package are imported from the scripts folder
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from perfvar import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from perfvar import COMMANDS
+
+# Constants
+DEFAULT_RESULTS_FOLDER = "startup_benchmark_results"
+STARTUP_BUDGET = 0.1  # Time (s) non-plotting subcommands should start well within
+PLOTTING_COMMANDS = ("graphs",)
+HEAVIEST_IMPORTS = 3
+SCRIPTS_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Reference points: the interpreter itself and the dependency every trace parsing subcommand needs
+BASELINES = {"python": "pass", "numpy": "import numpy"}
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(
+        description="Time how long every perfvar subcommand takes to start, i.e. to import its script and parse --help."
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="Number of timed starts of every subcommand (default: 10).")
+    parser.add_argument("-c", "--commands", type=str, nargs="+", default=None,
+                        help="Subcommands to time, e.g. 'config' or 'graphs bench' (default: all).")
+    parser.add_argument("-o", "--results_folder", type=str, default=DEFAULT_RESULTS_FOLDER,
+                        help="Folder to save the results to (default: 'startup_benchmark_results').")
+    return parser.parse_args()
+
+
+def list_commands(commands=COMMANDS, path=()):
+    """
+    Returns the command names of every subcommand that runs a script, e.g. ("graphs", "bench").
+    """
+    paths = []
+    for name, command in commands.items():
+        if isinstance(command, dict):
+            paths.extend(list_commands(command, path + (name,)))
+        else:
+            paths.append(path + (name,))
+    return paths
+
+
+def time_process(args, repeat):
+    """
+    Times starting a Python process until it exits. One untimed start beforehand writes the bytecode caches.
+
+    Returns:
+        list: The wall time of every start in seconds.
+    """
+    runs = []
+    for i in range(repeat + 1):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=SCRIPTS_PATH, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if i > 0:
+            runs.append(time.perf_counter() - start)
+    return runs
+
+
+def heaviest_imports(path):
+    """
+    Returns the top-level imports of a subcommand that take the longest, from python -X importtime.
+
+    Returns:
+        list: (module, cumulative seconds) pairs, slowest first.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "perfvar"] + list(path) + ["--help"],
+                            cwd=SCRIPTS_PATH, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented by two spaces per level below the first
+        if cumulative.strip().isdigit() and not name.startswith("   "):
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    imports.sort(key=lambda entry: entry[1], reverse=True)
+    return imports[:HEAVIEST_IMPORTS]
+
+
+def benchmark_startup(paths, repeat):
+    """
+    Times the start of the interpreter baselines and of every subcommand.
+
+    Returns:
+        dict: The timings of every baseline and subcommand.
+    """
+    results = {"baselines": dict(), "commands": dict()}
+    for name, code in BASELINES.items():
+        runs = time_process(["-c", code], repeat)
+        results["baselines"][name] = {"min_s": min(runs), "median_s": statistics.median(runs), "runs": runs}
+    for path in paths:
+        runs = time_process(["-m", "perfvar"] + list(path) + ["--help"], repeat)
+        plotting = path[0] in PLOTTING_COMMANDS
+        results["commands"][" ".join(path)] = {
+            "min_s": min(runs),
+            "median_s": statistics.median(runs),
+            "runs": runs,
+            "plotting": plotting,
+            "over_budget": not plotting and statistics.median(runs) > STARTUP_BUDGET,
+            "heaviest_imports": heaviest_imports(path),
+        }
+    return results
+
+
+def print_results(results):
+    for name, timing in results["baselines"].items():
+        print(f"{name:<20} min {timing['min_s'] * 1e3:8.1f} ms    median {timing['median_s'] * 1e3:8.1f} ms")
+    for name, timing in results["commands"].items():
+        flag = "plotting" if timing["plotting"] else "OVER BUDGET" if timing["over_budget"] else ""
+        imports = ", ".join(f"{module} {seconds * 1e3:.0f} ms" for module, seconds in timing["heaviest_imports"])
+        print(f"{name:<20} min {timing['min_s'] * 1e3:8.1f} ms    median {timing['median_s'] * 1e3:8.1f} ms    "
+              f"{flag:<11}    {imports}")
+
+
+def main():
+    args = parse_arguments()
+    # analysis_benchmark imports the whole analysis, which --help should not wait for
+    from analysis_benchmark import git_commit
+
+    paths = list_commands()
+    if args.commands:
+        paths = [path for path in paths if " ".join(path) in args.commands or path[0] in args.commands]
+
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y%m%d-%H%M%S"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "budget_s": STARTUP_BUDGET,
+    }
+    results.update(benchmark_startup(paths, args.repeat))
+    print_results(results)
+
+    os.makedirs(args.results_folder, exist_ok=True)
+    results_file = os.path.join(args.results_folder, f"{commit or 'nogit'}{'-dirty' if dirty else ''}-{results['timestamp']}.json")
+    with open(results_file, "w") as f:
+        f.write(json.dumps(results, indent=4))
+    print(f"Results saved to {results_file}")
@@ -0,0 +1,302 @@
+import os
+import json
+import math
+import argparse
+
+# Constants
+SKETCH_VERSION = 2
+SKETCH_SUFFIX = ".digest.json"
+SKETCH_KINDS = ("durations", "noise")  # Iteration durations of a benchmark and noise durations of a trace
+SKETCH_UNITS = {"durations": "s", "noise": "µs"}
+DEFAULT_COMPRESSION = 500  # Bounds the number of centroids, larger is more accurate
+BUFFER_FACTOR = 5  # Values buffered per unit of compression before they are merged into the centroids
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class TDigest:
+    """
+    Mergeable quantile sketch of a stream of values, a merging t-digest (Dunning and Ertl 2019).
+
+    Values are merged into a sorted list of weighted centroids. The logarithmic k2 scale function limits
+    the size of every centroid by its quantile, so centroids shrink towards single values in the tails and
+    the extreme quantiles stay accurate. The sketch holds at most about compression centroids however many
+    values were added, and sketches merge by adding the centroids of one to the other, in any order.
+    The count, mean, min and max are kept exactly, together with the sum of squared deviations from the
+    mean for the standard deviation (Welford's update, Chan et al. when merging).
+
+    Attributes:
+        compression (float): Bound on the number of centroids.
+        means, weights (list): The centroids, ascending by mean, excluding the buffered values.
+        count (int): Number of values added.
+        min, max (float): The smallest and largest value, or inf and -inf without values.
+    """
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._buffer = []
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        """
+        Adds a single value. Values are buffered and merged into the centroids in batches.
+        """
+        value = float(value)
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._buffer.append(value)
+        if len(self._buffer) >= BUFFER_FACTOR * self.compression:
+            self._compress()
+
+    def update(self, values):
+        """
+        Adds an array or list of values, e.g. the noise durations of a trace, with one merge into the centroids.
+        """
+        import numpy as np  # Only needed to merge centroids, reading the constants starts without it
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        mean = float(values.mean())
+        self._merge_moments(len(values), mean, float(np.square(values - mean).sum()))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(values, np.ones(len(values), dtype=np.int64))
+
+    def merge(self, other):
+        """
+        Adds every value summarized by another sketch.
+        """
+        other._compress()
+        self._merge_moments(other.count, other._mean, other._m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(other.means, other.weights)
+        return self
+
+    def _merge_moments(self, count, mean, m2):
+        """
+        Combines the count, mean and sum of squared deviations with those of other values (Chan et al. 1979).
+        """
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self._mean
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self._mean += delta * count / total
+        self.count = total
+
+    def _compress(self, means=(), weights=()):
+        """
+        Merges the buffered values, and the given weighted points, into the centroids. Every point is assigned
+        to the unit interval of the k2 scale its left edge falls in, so a centroid spans about one unit of the
+        scale, and the points of an interval are merged with array operations.
+        """
+        import numpy as np
+
+        if not self._buffer and not len(means):
+            return
+        values = np.concatenate((np.asarray(self.means, dtype=np.float64), np.asarray(means, dtype=np.float64),
+                                 np.asarray(self._buffer, dtype=np.float64)))
+        counts = np.concatenate((np.asarray(self.weights, dtype=np.int64), np.asarray(weights, dtype=np.int64),
+                                 np.ones(len(self._buffer), dtype=np.int64)))
+        self._buffer = []
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        counts = counts[order]
+
+        total = int(counts.sum())
+        q = (np.cumsum(counts) - counts) / total
+        normalizer = self.compression / (4 * math.log(max(total / self.compression, 1.0)) + 24)
+        with np.errstate(divide="ignore"):
+            # The first point is at q = 0, where the scale is -inf, so the minimum stays a centroid of its own
+            scale = np.floor(normalizer * (np.log(q) - np.log1p(-q)))
+        starts = np.flatnonzero(np.concatenate(([True], scale[1:] != scale[:-1])))
+        weights = np.add.reduceat(counts, starts)
+        self.means = (np.add.reduceat(values * counts, starts) / weights).tolist()
+        self.weights = weights.tolist()
+
+    def quantile(self, q):
+        """
+        Estimates the q-quantile, interpolating linearly between the centers of neighbouring centroids
+        and between the outer centroids and the min and max. NaN if the sketch is empty.
+        """
+        self._compress()
+        if not self.count:
+            return math.nan
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        target = q * self.count
+        first_center = self.weights[0] / 2
+        if target < first_center:
+            return self.min + (self.means[0] - self.min) * target / first_center
+        left = 0
+        for i in range(len(self.means) - 1):
+            center = left + self.weights[i] / 2
+            next_center = left + self.weights[i] + self.weights[i + 1] / 2
+            if target <= next_center:
+                return self.means[i] + (self.means[i + 1] - self.means[i]) * (target - center) / (next_center - center)
+            left += self.weights[i]
+        last_center = self.count - self.weights[-1] / 2
+        return self.means[-1] + (self.max - self.means[-1]) * (target - last_center) / (self.count - last_center)
+
+    def mean(self):
+        return self._mean if self.count else math.nan
+
+    def std(self):
+        """
+        Returns the population standard deviation of the values, like np.std.
+        """
+        if not self.count:
+            return math.nan
+        return math.sqrt(self._m2 / self.count)
+
+    def to_json(self):
+        self._compress()
+        return {
+            "version": SKETCH_VERSION,
+            "compression": self.compression,
+            "count": self.count,
+            "mean": self._mean,
+            "m2": self._m2,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "means": self.means,
+            "weights": self.weights,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Builds a sketch from a JSON object written by to_json.
+        """
+        if data.get("version") != SKETCH_VERSION:
+            raise ValueError(f"Unsupported sketch version {data.get('version')}, expected {SKETCH_VERSION}")
+        sketch = cls(data["compression"])
+        sketch.count = data["count"]
+        sketch._mean = data["mean"]
+        sketch._m2 = data["m2"]
+        sketch.min = math.inf if data["min"] is None else data["min"]
+        sketch.max = -math.inf if data["max"] is None else data["max"]
+        sketch.means = data["means"]
+        sketch.weights = data["weights"]
+        return sketch
+
+
+def sketch_path(folder, name, kind):
+    """
+    Returns the path of a sketch of a kind of SKETCH_KINDS, e.g. "<folder>/nbody-omp-durations.digest.json".
+    """
+    return os.path.join(folder, f"{name}-{kind}{SKETCH_SUFFIX}")
+
+
+def sketch_kind(path):
+    """
+    Returns the kind of SKETCH_KINDS in the name of a sketch file, or None if the name holds none.
+    """
+    for kind in SKETCH_KINDS:
+        if path.endswith(f"-{kind}{SKETCH_SUFFIX}"):
+            return kind
+    return None
+
+
+def save_sketch(sketch, path):
+    """
+    Writes a sketch to a file. The file is replaced atomically so an interrupted write never leaves a broken sketch.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(sketch.to_json(), f)
+    os.replace(temp_path, path)
+
+
+def load_sketch(path):
+    with open(path, "r") as f:
+        return TDigest.from_json(json.load(f))
+
+
+def find_sketches(paths, kind=None):
+    """
+    Returns the sketch files among the paths and below the folders among them, only those of a kind if given.
+    """
+    suffix = f"-{kind}{SKETCH_SUFFIX}" if kind else SKETCH_SUFFIX
+    sketch_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            sketch_files.append(path)
+            continue
+        for root, _, files in os.walk(path):
+            sketch_files.extend(os.path.join(root, file) for file in sorted(files) if file.endswith(suffix))
+    return sketch_files
+
+
+def merge_sketches(sketch_files):
+    """
+    Merges sketch files into one sketch.
+    """
+    merged = None
+    for sketch_file in sketch_files:
+        sketch = load_sketch(sketch_file)
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Estimate quantiles across runs by merging the duration and noise sketches saved next to them."
+    )
+    parser.add_argument("paths", type=str, nargs="+", help="Sketch files, or folders to search for them.")
+    parser.add_argument("--kind", type=str, choices=SKETCH_KINDS, default=None,
+                        help="Only merge sketches of this kind (default: merge and report every kind found separately).")
+    parser.add_argument("--quantiles", type=float, nargs="+", default=list(DEFAULT_QUANTILES),
+                        help="Quantiles to estimate (default: 0.5 0.9 0.99 0.999).")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Path to save the merged sketch to.")
+    args = parser.parse_args()
+
+    sketch_files = find_sketches(args.paths, args.kind)
+    if not sketch_files:
+        print("No sketches found.")
+        return
+
+    # Durations and noise are in different units, so every kind is merged on its own
+    files_by_kind = dict()
+    for sketch_file in sketch_files:
+        kind = args.kind or sketch_kind(sketch_file)
+        if kind is None:
+            parser.error(f"Unknown kind of sketch {sketch_file}, pass --kind")
+        files_by_kind.setdefault(kind, []).append(sketch_file)
+    if args.output and len(files_by_kind) > 1:
+        parser.error(f"Found sketches of {len(files_by_kind)} kinds, pass --kind to save one merged sketch")
+
+    for kind, files in files_by_kind.items():
+        merged = merge_sketches(files)
+        unit = SKETCH_UNITS[kind]
+        print(f"Merged {len(files)} {kind} sketches of {merged.count} values ({unit})")
+        print(f"Min: {merged.min:.9g}")
+        print(f"Mean: {merged.mean():.9g}")
+        print(f"Standard Deviation: {merged.std():.9g}")
+        for q in args.quantiles:
+            print(f"p{q * 100:g}: {merged.quantile(q):.9g}")
+        print(f"Max: {merged.max:.9g}")
+        if args.output:
+            save_sketch(merged, args.output)
+            print(f"Merged sketch saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
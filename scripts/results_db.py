@@ -0,0 +1,314 @@
+import os
+import re
+import sys
+import sqlite3
+import hashlib
+import argparse
+from benchout_reader import read_benchout
+from trace_storage import find_trace
+
+# Constants
+SCHEMA_VERSION = 1
+FRAMEWORKS = ("omp", "sycl")
+NOISE_CONFIG_SUFFIXES = (".json", ".bin")
+
+# Log folders are named "<mitigation>-<threads>-...", e.g. "2-7-nbody"
+RUN_NAME_RE = re.compile(r"^(\d+)-(\d+)-")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    mitigation INTEGER,
+    threads INTEGER,
+    noise_config TEXT,
+    noise_config_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS iterations (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    benchmark TEXT NOT NULL,
+    framework TEXT NOT NULL,
+    system TEXT,
+    iteration INTEGER,
+    start_s REAL,
+    end_s REAL,
+    duration_s REAL,
+    duration_ns INTEGER,
+    benchout_path TEXT UNIQUE NOT NULL,
+    trace_path TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS iterations_by_run ON iterations(run_id, benchmark, framework);
+CREATE INDEX IF NOT EXISTS iterations_by_benchmark ON iterations(benchmark, framework);
+CREATE INDEX IF NOT EXISTS runs_by_mitigation ON runs(mitigation, threads);
+"""
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(description="Store benchmark results of Benchmark.sh log folders in a SQLite database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Add or update the iterations found in log folders.")
+    ingest_parser.add_argument("db", type=str, help="Path to the database file.")
+    ingest_parser.add_argument("folders", type=str, nargs="+", help="Log folders, or folders containing log folders.")
+
+    summary_parser = subparsers.add_parser("summary", help="Print the number of iterations and mean duration of every run.")
+    summary_parser.add_argument("db", type=str, help="Path to the database file.")
+    summary_parser.add_argument("folders", type=str, nargs="*", help="Only show runs inside these folders.")
+    return parser.parse_args()
+
+
+def connect(db_path):
+    """
+    Opens a results database, creating the tables if needed. Use ":memory:" for a temporary database.
+    """
+    conn = sqlite3.connect(db_path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SCHEMA_VERSION):
+        raise ValueError(f"{db_path} has schema version {version}, expected {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return conn
+
+
+def hash_file(path):
+    """
+    Returns the blake2b content hash of a file.
+    """
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def find_noise_config(run_path):
+    """
+    Returns the path of the noise configuration Benchmark.sh copied into a log folder, or None.
+    """
+    configs = sorted(entry.path for entry in os.scandir(run_path)
+                     if entry.is_file() and entry.name.endswith(NOISE_CONFIG_SUFFIXES))
+    return configs[0] if configs else None
+
+
+def upsert_run(conn, run_path):
+    """
+    Adds or updates a log folder in the runs table.
+
+    Returns:
+        int: The id of the run.
+    """
+    name = os.path.basename(run_path)
+    match = RUN_NAME_RE.match(name)
+    mitigation, threads = (int(match[1]), int(match[2])) if match else (None, None)
+    noise_config = find_noise_config(run_path)
+    noise_config_hash = hash_file(noise_config) if noise_config else None
+
+    conn.execute(
+        "INSERT INTO runs (path, name, mitigation, threads, noise_config, noise_config_hash) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(path) DO UPDATE SET name = excluded.name, mitigation = excluded.mitigation, threads = excluded.threads, "
+        "noise_config = excluded.noise_config, noise_config_hash = excluded.noise_config_hash",
+        (run_path, name, mitigation, threads, noise_config, noise_config_hash))
+    return conn.execute("SELECT id FROM runs WHERE path = ?", (run_path,)).fetchone()[0]
+
+
+def iteration_row(run_id, bench, entry):
+    """
+    Builds the iterations row of a .benchout file named "<bench>-<iteration>-<system>.benchout".
+    """
+    benchmark, framework = bench.rsplit("-", 1)
+    iteration, _, system = entry.name[len(bench) + 1:-len(".benchout")].partition("-")
+    times = read_benchout(entry.path)
+    trace_path = find_trace(entry.path[:-len(".benchout")] + ".trace")
+    stat = entry.stat()
+    return (run_id, benchmark, framework, system or None, int(iteration) if iteration.isdigit() else None,
+            times.start, times.end, times.duration, times.duration_ns, entry.path,
+            trace_path, stat.st_size, stat.st_mtime_ns)
+
+
+def find_bench_folders(folder):
+    """
+    Finds the benchmark folders below a folder, e.g. "<log folder>/nbody-omp", as (log folder, benchmark folder name).
+    """
+    bench_folders = []
+    for root, subdirs, _ in os.walk(folder):
+        for bench in subdirs:
+            if any(framework in bench for framework in FRAMEWORKS) and "-" in bench:
+                bench_folders.append((root, bench))
+    return bench_folders
+
+
+def ingest(conn, folders):
+    """
+    Adds the iterations found in log folders to the database. Files that did not change since they were
+    ingested are skipped, and iterations whose .benchout file was removed are deleted.
+
+    Args:
+        conn (sqlite3.Connection): The results database.
+        folders [str]: Log folders, or folders containing log folders.
+
+    Returns:
+        dict: The number of added or updated, unchanged and removed iterations.
+    """
+    counts = {"updated": 0, "unchanged": 0, "removed": 0}
+    with conn:
+        for folder in folders:
+            folder = os.path.abspath(folder)
+            known = {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute(
+                "SELECT benchout_path, size, mtime_ns FROM iterations WHERE benchout_path >= ? AND benchout_path < ?",
+                _path_range(folder))}
+
+            run_ids = dict()
+            rows = []
+            for run_path, bench in find_bench_folders(folder):
+                if run_path not in run_ids:
+                    run_ids[run_path] = upsert_run(conn, run_path)
+                for entry in os.scandir(os.path.join(run_path, bench)):
+                    if not (entry.is_file() and entry.name.startswith(bench + "-") and entry.name.endswith(".benchout")):
+                        continue
+                    stat = entry.stat()
+                    if known.pop(entry.path, None) == (stat.st_size, stat.st_mtime_ns):
+                        counts["unchanged"] += 1
+                    else:
+                        rows.append(iteration_row(run_ids[run_path], bench, entry))
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO iterations (run_id, benchmark, framework, system, iteration, start_s, end_s, "
+                "duration_s, duration_ns, benchout_path, trace_path, size, mtime_ns) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("DELETE FROM iterations WHERE benchout_path = ?", [(path,) for path in known])
+            counts["updated"] += len(rows)
+            counts["removed"] += len(known)
+        conn.execute("DELETE FROM runs WHERE id NOT IN (SELECT run_id FROM iterations)")
+    return counts
+
+
+def _path_range(folder):
+    """
+    Returns the bounds of the paths inside a folder, for comparisons that can use an index.
+    """
+    return folder + "/", folder + chr(ord("/") + 1)
+
+
+def open_results(folders, db_path=None):
+    """
+    Opens a results database and ingests the given folders into it. Without a database path the
+    results are only kept in memory.
+    """
+    conn = connect(db_path or ":memory:")
+    ingest(conn, folders)
+    return conn
+
+
+def query_durations(conn, folders=None):
+    """
+    Fetches the durations of every benchmark of every run.
+
+    Args:
+        conn (sqlite3.Connection): The results database.
+        folders [str]: Only return runs inside these folders, or every run if None.
+
+    Returns:
+        [dict]: One dict per run and benchmark with the run path, name, mitigation and threads,
+            the benchmark, framework and bench ("<benchmark>-<framework>") and the durations (s) in iteration order.
+    """
+    query = "SELECT runs.path, runs.name, runs.mitigation, runs.threads, benchmark, framework, duration_s " \
+            "FROM iterations JOIN runs ON runs.id = iterations.run_id WHERE duration_s IS NOT NULL"
+    params = []
+    if folders is not None:
+        conditions = []
+        for folder in folders:
+            folder = os.path.abspath(folder)
+            conditions.append("runs.path = ? OR (runs.path >= ? AND runs.path < ?)")
+            params += [folder, *_path_range(folder)]
+        query += " AND (" + " OR ".join(conditions or ["0"]) + ")"
+    query += " ORDER BY runs.path, benchmark, framework, iteration, benchout_path"
+
+    results = dict()
+    for path, name, mitigation, threads, benchmark, framework, duration in conn.execute(query, params):
+        key = (path, benchmark, framework)
+        if key not in results:
+            results[key] = {"path": path, "name": name, "mitigation": mitigation, "threads": threads,
+                            "benchmark": benchmark, "framework": framework, "bench": f"{benchmark}-{framework}",
+                            "durations": []}
+        results[key]["durations"].append(duration)
+    return list(results.values())
+
+
+def calculate_percentiles(data):
+    import numpy as np  # Only needed for statistics, ingesting starts without it
+
+    # One call selects every percentile from a single partition of the data
+    percentiles = np.percentile(data, [1, 10, 25, 50, 75, 90, 99])
+    return {
+        'min': np.min(data),
+        'max': np.max(data),
+        '1th': percentiles[0],
+        '10th': percentiles[1],
+        '25th': percentiles[2],
+        '50th': percentiles[3],
+        '75th': percentiles[4],
+        '90th': percentiles[5],
+        '99th': percentiles[6],
+    }
+
+
+def execution_statistics(exectimes):
+    """
+    Computes the statistics bench_graphs.py writes to the _stats.txt file of a benchmark.
+
+    Returns:
+        dict: The statistics per section, with the keys used in the _stats.txt file.
+    """
+    import numpy as np
+
+    avgexectime = sum(exectimes) / len(exectimes)
+    normexectimes = [x / avgexectime for x in exectimes]
+    stats = dict()
+    for section, times in (("Execution Times (seconds)", exectimes), ("Normalized Execution Times", normexectimes)):
+        percentiles = calculate_percentiles(times)
+        stats[section] = {
+            "Min": percentiles['min'],
+            "1th percentile": percentiles['1th'],
+            "10th percentile": percentiles['10th'],
+            "25th percentile": percentiles['25th'],
+            "50th percentile": percentiles['50th'],
+            "75th percentile": percentiles['75th'],
+            "90th percentile": percentiles['90th'],
+            "99th percentile": percentiles['99th'],
+            "Max": percentiles['max'],
+        }
+        if section == "Execution Times (seconds)":
+            stats[section]["Average"] = np.mean(times)
+        stats[section]["Standard Deviation"] = np.std(times)
+    return stats
+
+
+def main():
+    args = parse_arguments()
+    conn = connect(args.db)
+
+    if args.command == "ingest":
+        counts = ingest(conn, args.folders)
+        print(f"{counts['updated']} iterations added or updated, {counts['unchanged']} unchanged, {counts['removed']} removed")
+    elif args.command == "summary":
+        import numpy as np
+
+        results = query_durations(conn, args.folders or None)
+        if not results:
+            print("No iterations found")
+            sys.exit(1)
+        for result in results:
+            print(f"{result['name']:<30} {result['bench']:<20} {len(result['durations']):>5} iterations    "
+                  f"mean {np.mean(result['durations']):.9f} s")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,16 @@ import argparse
 import signal
 import atexit
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from noise_schedule import read_core_ids
 
 NOISE_INJECTOR_FOLDER_PATH = "../noiseinjector"
 
 def build_code(rebuild=False, debug=False):
     # Change the current working directory to the noise injector folder
     os.chdir(NOISE_INJECTOR_FOLDER_PATH)
-    
+
     if rebuild:
         print("Forcing a rebuild...")
         subprocess.run( ['make', 'clean'], check=True)
@@ -20,22 +23,17 @@ def build_code(rebuild=False, debug=False):
     else:
         subprocess.run(['make', 'all'], check=True)
 
-def run_cpuoccupy_parallel(json_file, verbose=False, no_benchmark=False, any_core=False):
+def check_core_ids(json_file):
     """
-    Run cpuoccupy processes in parallel, one for each core defined in the JSON file.
+    Reads the core IDs from the JSON file or binary noise schedule and checks that they exist on this system.
     """
     # Check if the JSON file exists
     if not os.path.exists(json_file):
         print(f"Error: JSON file not found: {json_file}")
         sys.exit(1)
 
-    # Parse the JSON file to get core IDs
-    import json
-    with open(json_file, 'r') as f:
-        config = json.load(f)
-
-    core_ids = config.keys()
-
+    # Read the core IDs from the JSON file or binary noise schedule
+    core_ids = read_core_ids(json_file)
 
     # Get the number of available CPU cores
     available_cores = os.cpu_count()
@@ -45,7 +43,7 @@ def run_cpuoccupy_parallel(json_file, verbose=False, no_benchmark=False, any_cor
 
     # Check if the number of cores in the JSON exceeds available cores
     num_cores_in_json = len(core_ids)
-    
+
     if num_cores_in_json > available_cores:
         print(f"Error: The JSON file specifies {num_cores_in_json} cores, but only {available_cores} cores are available on this system.")
         sys.exit(1)
@@ -56,30 +54,230 @@ def run_cpuoccupy_parallel(json_file, verbose=False, no_benchmark=False, any_cor
             print(f"Error: Core ID {core_id} is invalid. This system has only {available_cores} cores.")
             sys.exit(1)
 
-    num_processes = len(core_ids) if no_benchmark else len(core_ids) + 1
-    print(f"Num of processes (should be number of cores({num_cores_in_json}) + 1): {num_processes}")
-    for core_id in core_ids:
-        # Construct the command for taskset
-        command = f"./{NOISE_INJECTOR_FOLDER_PATH}/cpuoccupy {json_file} {core_id} {num_processes}"
-        if not any_core: 
-            command = f"taskset -c {core_id} " + command
+    return core_ids
 
-        if verbose:
-            print(f"Starting: {command}")
+class CpuoccupyProcess:
+    """
+    A cpuoccupy process started with posix_spawn in its own session.
+    """
+
+    def __init__(self, pid, core_id, spawn_ns, stdout):
+        self.pid = pid
+        self.core_id = core_id
+        self.spawn_ns = spawn_ns
+        self.stdout = stdout
 
-        # Start the process in parallel
+    def wait(self):
         try:
-            process = subprocess.Popen(command, shell=True, preexec_fn=os.setsid)
-            processes_list.append((process, core_id))
-        except Exception as e:
-            print(f"Failed to start process on core {core_id}: {e}")
-            sys.exit(1)
+            _, status = os.waitpid(self.pid, 0)
+        except ChildProcessError:
+            return None
+        return os.waitstatus_to_exitcode(status)
+
+def spawn_cpuoccupy(command, core_id, pin):
+    """
+    Spawns a cpuoccupy process without a shell. A pinned process inherits the affinity of the
+    spawning thread, so it runs on its core from the first instruction.
+    """
+    read_fd, write_fd = os.pipe()
+    original_affinity = os.sched_getaffinity(0)
+    if pin:
+        os.sched_setaffinity(0, {int(core_id)})
+    try:
+        spawn_ns = time.monotonic_ns()
+        pid = os.posix_spawn(command[0], command, os.environ,
+                             file_actions=[(os.POSIX_SPAWN_DUP2, write_fd, 1), (os.POSIX_SPAWN_CLOSE, read_fd)],
+                             setsid=True, setsigdef=(signal.SIGPIPE, signal.SIGXFSZ))
+    finally:
+        if pin:
+            os.sched_setaffinity(0, original_affinity)
+        os.close(write_fd)
+    return CpuoccupyProcess(pid, core_id, spawn_ns, os.fdopen(read_fd, "r"))
+
+class CpuoccupyFleet:
+    """
+    One cpuoccupy process per core, launched in parallel.
+
+    Every process reports the CLOCK_MONOTONIC time at which it reached and passed the barrier.
+    These are written, together with the time the process was started, to a CSV startup log.
+    """
+
+    def __init__(self, verbose=False, startup_log=None):
+        self.verbose = verbose
+        self.startup_log = startup_log
+        self.core_ids = None
+        self.lock = threading.Lock()
+        self.barrier_times = dict()
+
+        if self.startup_log:
+            with open(self.startup_log, "w") as f:
+                f.write("core,iteration,start_ns,barrier_arrive_ns,barrier_release_ns,start_to_barrier_us\n")
+
+    def start(self, json_file, core_ids, num_processes, any_core=False, supervised=False):
+        self.core_ids = list(core_ids)
+        command = [f"./{NOISE_INJECTOR_FOLDER_PATH}/cpuoccupy", json_file, "", str(num_processes)]
+        if supervised:
+            command.append("--supervised")
+
+        def spawn(core_id):
+            core_command = list(command)
+            core_command[2] = str(core_id)
+            if self.verbose:
+                print(f"Starting: {' '.join(core_command)}")
+            return spawn_cpuoccupy(core_command, core_id, not any_core)
+
+        launch_start = time.monotonic_ns()
+        with ThreadPoolExecutor(max_workers=len(self.core_ids)) as executor:
+            futures = [executor.submit(spawn, core_id) for core_id in self.core_ids]
+            for core_id, future in zip(self.core_ids, futures):
+                try:
+                    processes_list.append((future.result(), core_id))
+                except Exception as e:
+                    print(f"Failed to start process on core {core_id}: {e}")
+                    cleanup(signal.SIGTERM, None)
+                    sys.exit(1)
+        print(f"Launched {len(self.core_ids)} processes in {(time.monotonic_ns() - launch_start) / 1e3:.0f} us")
+
+        for process, core_id in processes_list:
+            threading.Thread(target=self.read_output, args=(process,), daemon=True).start()
+
+    def read_output(self, process):
+        """
+        Handles the status reports of a cpuoccupy process and forwards all other output.
+        """
+        for line in process.stdout:
+            if not self.handle_report(process, line.split()):
+                print(line, end="", flush=True)
+
+    def handle_report(self, process, fields):
+        if not fields or fields[0] != "BARRIER":
+            return False
+        arrive_ns, release_ns = int(fields[2]), int(fields[3])
+        with self.lock:
+            iteration_times = self.barrier_times.setdefault(self.iteration(), dict())
+            iteration_times[process.core_id] = (arrive_ns, release_ns)
+            if self.startup_log:
+                start_ns = self.start_ns(process)
+                with open(self.startup_log, "a") as f:
+                    f.write(f"{process.core_id},{self.iteration()},{start_ns},{arrive_ns},{release_ns},"
+                            f"{(arrive_ns - start_ns) / 1e3:.0f}\n")
+            if len(iteration_times) == len(self.core_ids):
+                self.report_barrier_skew(iteration_times)
+        return True
+
+    def iteration(self):
+        return 1
+
+    def start_ns(self, process):
+        return process.spawn_ns
+
+    def report_barrier_skew(self, iteration_times):
+        arrivals = [arrive for arrive, _ in iteration_times.values()]
+        releases = [release for _, release in iteration_times.values()]
+        print(f"Iteration {self.iteration()} barrier arrival skew: {(max(arrivals) - min(arrivals)) / 1e3:.0f} us, "
+              f"release skew: {(max(releases) - min(releases)) / 1e3:.0f} us", flush=True)
+
+    def wait(self):
+        for process, core_id in processes_list:
+            process.wait()
+            if self.verbose:
+                print(f"Process on core {core_id} finished.")
+
+def run_cpuoccupy_parallel(json_file, verbose=False, no_benchmark=False, any_core=False, startup_log=None):
+    """
+    Run cpuoccupy processes in parallel, one for each core defined in the JSON file.
+    """
+    core_ids = check_core_ids(json_file)
+    num_processes = len(core_ids) if no_benchmark else len(core_ids) + 1
+    print(f"Num of processes (should be number of cores({len(core_ids)}) + 1): {num_processes}")
+
+    fleet = CpuoccupyFleet(verbose, startup_log)
+    fleet.start(json_file, core_ids, num_processes, any_core)
 
     # Wait for all processes to finish
-    for process, core_id in processes_list:
-        process.wait()
-        if verbose:
-            print(f"Process on core {core_id} finished.")
+    fleet.wait()
+
+class NoiseSupervisor(CpuoccupyFleet):
+    """
+    Keeps one cpuoccupy process per core alive across benchmark iterations.
+
+    SIGUSR1 re-arms every process for the next workload and SIGUSR2 stops the noise of the current one.
+    The re-arm latency of an iteration is the time from SIGUSR1 until every process has opened the
+    semaphores of the workload and waits at the barrier.
+    """
+
+    def __init__(self, rearm_log=None, verbose=False, startup_log=None):
+        super().__init__(verbose, startup_log)
+        self.rearm_log = rearm_log
+        self.ready = set()
+        self.armed = set()
+        self.pending_arm = False
+        self.current_iteration = 0
+        self.arm_time = None
+        self.arm_ns = None
+
+        if self.rearm_log:
+            with open(self.rearm_log, "w") as f:
+                f.write("iteration,rearm_latency_us\n")
+
+    def handle_report(self, process, fields):
+        if fields and fields[0] == "READY":
+            with self.lock:
+                self.ready.add(process.core_id)
+                if self.pending_arm and len(self.ready) == len(self.core_ids):
+                    self.send_arm()
+            return True
+        if fields and fields[0] == "ARMED":
+            with self.lock:
+                self.armed.add(process.core_id)
+                if len(self.armed) == len(self.core_ids):
+                    self.report_rearm_latency(time.perf_counter() - self.arm_time)
+            return True
+        return super().handle_report(process, fields)
+
+    def iteration(self):
+        return self.current_iteration
+
+    def start_ns(self, process):
+        # Supervised processes are started for each iteration by the re-arm signal
+        return self.arm_ns
+
+    def send_arm(self):
+        self.pending_arm = False
+        self.current_iteration += 1
+        self.armed = set()
+        self.arm_time = time.perf_counter()
+        self.arm_ns = time.monotonic_ns()
+        for process, core_id in processes_list:
+            os.kill(process.pid, signal.SIGUSR1)
+
+    def report_rearm_latency(self, latency):
+        print(f"Iteration {self.current_iteration} re-arm latency: {latency * 1e6:.0f} us", flush=True)
+        if self.rearm_log:
+            with open(self.rearm_log, "a") as f:
+                f.write(f"{self.current_iteration},{latency * 1e6:.0f}\n")
+
+    def arm(self, signum, frame):
+        # Processes that are still loading their schedule are armed once all of them are ready
+        with self.lock:
+            if self.core_ids is not None and len(self.ready) == len(self.core_ids):
+                self.send_arm()
+            else:
+                self.pending_arm = True
+
+    def stop(self, signum, frame):
+        for process, core_id in processes_list:
+            os.kill(process.pid, signal.SIGUSR2)
+
+def supervise_cpuoccupy(supervisor, json_file, no_benchmark=False, any_core=False):
+    """
+    Run cpuoccupy processes that stay alive across benchmark iterations, one for each core defined in the JSON file.
+    Each iteration is started by sending SIGUSR1 to this process and stopped by sending SIGUSR2.
+    """
+    core_ids = check_core_ids(json_file)
+    num_processes = len(core_ids) if no_benchmark else len(core_ids) + 1
+    supervisor.start(json_file, core_ids, num_processes, any_core, supervised=True)
+    supervisor.wait()
 
 processes_list = []
 def cleanup(signum, frame):
@@ -88,23 +286,39 @@ def cleanup(signum, frame):
         os.killpg(os.getpgid(p.pid), signal.SIGTERM)
 
 def main():
+    # Installed here rather than in the main guard, since perfvar inject calls main() directly
+    signal.signal(signal.SIGTERM, cleanup)
     parser = argparse.ArgumentParser(description="Run cpuoccupy on multiple cores in parallel using a single JSON configuration.")
-    parser.add_argument('--json-file', type=str, default="noise_config.json", help="JSON file containing noise configurations")
+    parser.add_argument('--json-file', type=str, default="noise_config.json", help="JSON file or binary noise schedule containing noise configurations")
     parser.add_argument('--verbose', action='store_true', help="Enable verbose output")
     parser.add_argument('--rebuild', action='store_true', help="Force rebuild of the project")
     parser.add_argument('--debug', action='store_true', help="Build in debug mode")
     parser.add_argument('--no-benchmark', action='store_true', help="Whether to wait for benchmarks sync signal or not. This should be enabled if running without benchmark.")
     parser.add_argument('--any-core', action='store_true', help="Whether the noise should run on any core (if this option isn't selected the noise will run on specified core only).")
+    parser.add_argument('--supervise', action='store_true', help="Keep the cpuoccupy processes alive across benchmark iterations. Send SIGUSR1 to arm them for the next workload and SIGUSR2 to stop the current noise.")
+    parser.add_argument('--rearm-log', type=str, default=None, help="CSV file to write the per-iteration re-arm latency to in supervisor mode.")
+    parser.add_argument('--startup-log', type=str, default=None, help="CSV file to write the per-core spawn and barrier timestamps to.")
 
     args = parser.parse_args()
 
+    # Log files are given relative to the caller, not the noise injector folder
+    startup_log = os.path.abspath(args.startup_log) if args.startup_log else None
+    rearm_log = os.path.abspath(args.rearm_log) if args.rearm_log else None
+
+    # Handle re-arm requests that arrive while building and loading the noise schedules
+    if args.supervise:
+        supervisor = NoiseSupervisor(rearm_log, args.verbose, startup_log)
+        signal.signal(signal.SIGUSR1, supervisor.arm)
+        signal.signal(signal.SIGUSR2, supervisor.stop)
+
     # Step 1: Build the code
     build_code(args.rebuild, args.debug)
 
     # Step 2: Run all cpuoccupy processes in parallel
-    run_cpuoccupy_parallel(args.json_file, args.verbose, args.no_benchmark, args.any_core)
+    if args.supervise:
+        supervise_cpuoccupy(supervisor, args.json_file, args.no_benchmark, args.any_core)
+    else:
+        run_cpuoccupy_parallel(args.json_file, args.verbose, args.no_benchmark, args.any_core, startup_log)
 
 if __name__ == "__main__":
-    signal.signal(signal.SIGTERM, cleanup)
     main()
-
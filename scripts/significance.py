@@ -0,0 +1,192 @@
+import math
+
+# Constants
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0  # Fixed, so a report is reproducible
+CHUNK_ELEMENTS = 1 << 22  # Resampled durations held in memory at once
+# Statistics compared between runs, with the quantile of each or None for the mean
+STATISTICS = {"mean": None, "median": 0.5, "p90": 0.9, "p99": 0.99}
+# Metrics a budget can be set for: the statistics, and the quantiles normalized by the mean of their run
+METRICS = tuple(STATISTICS) + tuple(f"normalized_{name}" for name, q in STATISTICS.items() if q is not None)
+
+
+def _sorted_quantiles(sorted_rows, q):
+    """
+    Returns the q-quantile of every row of a row-wise sorted array, interpolated linearly like np.percentile.
+    """
+    position = (sorted_rows.shape[-1] - 1) * q
+    low = math.floor(position)
+    high = min(low + 1, sorted_rows.shape[-1] - 1)
+    return sorted_rows[..., low] + (sorted_rows[..., high] - sorted_rows[..., low]) * (position - low)
+
+
+def observed_statistics(durations):
+    """
+    Returns the statistics of a sample in the order of STATISTICS.
+    """
+    import numpy as np  # Imported on use, so scripts only reading the constants start without numpy
+    durations = np.sort(np.asarray(durations, dtype=np.float64))
+    return np.array([durations.mean() if q is None else _sorted_quantiles(durations, q) for q in STATISTICS.values()])
+
+
+def bootstrap_statistics(durations, resamples=DEFAULT_RESAMPLES, rng=None):
+    """
+    Computes the statistics of bootstrap resamples of a sample. All resamples are drawn and sorted
+    as one array per chunk, so the quantiles of every resample are read by index.
+
+    Args:
+        durations (list): The sample, e.g. the iteration durations of one run.
+        resamples (int): Number of resamples drawn with replacement.
+        rng (np.random.Generator): Source of the resamples.
+
+    Returns:
+        np.ndarray: The statistics of every resample, shape (resamples, len(STATISTICS)).
+    """
+    import numpy as np
+    rng = np.random.default_rng(DEFAULT_SEED) if rng is None else rng
+    durations = np.asarray(durations, dtype=np.float64)
+    statistics = np.empty((resamples, len(STATISTICS)))
+    chunk = max(1, CHUNK_ELEMENTS // len(durations))
+    for start in range(0, resamples, chunk):
+        rows = durations[rng.integers(0, len(durations), (min(chunk, resamples - start), len(durations)))]
+        rows.sort(axis=1)
+        for column, q in enumerate(STATISTICS.values()):
+            statistics[start:start + len(rows), column] = rows.mean(axis=1) if q is None else _sorted_quantiles(rows, q)
+    return statistics
+
+
+def metric_values(statistics):
+    """
+    Returns every metric of METRICS from statistics in the order of STATISTICS, either the observed statistics
+    of a run or its bootstrap statistics.
+
+    Returns:
+        dict: The value, or the value of every resample, of each metric.
+    """
+    values = {name: statistics[..., i] for i, name in enumerate(STATISTICS)}
+    for name, q in STATISTICS.items():
+        if q is not None:
+            values[f"normalized_{name}"] = values[name] / values["mean"]
+    return values
+
+
+def rank_test(base, new):
+    """
+    Mann-Whitney U test of whether the durations of two runs come from the same distribution,
+    using the normal approximation with tie and continuity correction.
+
+    Returns:
+        tuple: The two-sided p-value and the probability that an iteration of the new run is slower
+            than one of the base run, ties counting half.
+    """
+    import numpy as np
+    base = np.asarray(base, dtype=np.float64)
+    new = np.asarray(new, dtype=np.float64)
+    n_base, n_new = len(base), len(new)
+    _, inverse, counts = np.unique(np.concatenate((base, new)), return_inverse=True, return_counts=True)
+    # Tied durations share the average of the ranks they occupy
+    average_ranks = np.cumsum(counts) - (counts - 1) / 2
+    u_new = float(average_ranks[inverse[n_base:]].sum()) - n_new * (n_new + 1) / 2
+
+    n = n_base + n_new
+    mean = n_base * n_new / 2
+    variance = n_base * n_new / 12 * ((n + 1) - float(np.sum(counts ** 3 - counts)) / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0, 0.5
+    z = max(abs(u_new - mean) - 0.5, 0) / math.sqrt(variance)
+    return math.erfc(z / math.sqrt(2)), u_new / (n_base * n_new)
+
+
+def compare_samples(base, new, base_bootstrap, new_bootstrap, confidence=DEFAULT_CONFIDENCE):
+    """
+    Compares the statistics of two runs with percentile bootstrap confidence intervals of their difference.
+    The runs are resampled independently, so the bootstrap distribution of the difference is the difference
+    of the bootstrap statistics of both runs.
+
+    Args:
+        base, new (list): The durations of the base and the new run.
+        base_bootstrap, new_bootstrap (np.ndarray): Their bootstrap statistics, see bootstrap_statistics.
+        confidence (float): Confidence level of the intervals.
+
+    Returns:
+        dict: For every statistic the base and new value, the difference and its confidence interval,
+            the interval of the relative difference (%) and whether the interval excludes zero.
+            "rank_test" holds the p-value and probability of a slower iteration of rank_test.
+    """
+    import numpy as np
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    base_observed = observed_statistics(base)
+    new_observed = observed_statistics(new)
+    low, high = np.percentile(new_bootstrap - base_bootstrap, tails, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative_low, relative_high = np.percentile((new_bootstrap / base_bootstrap - 1) * 100, tails, axis=0)
+
+    comparison = dict()
+    for i, statistic in enumerate(STATISTICS):
+        comparison[statistic] = {
+            "base": float(base_observed[i]),
+            "new": float(new_observed[i]),
+            "difference": float(new_observed[i] - base_observed[i]),
+            "low": float(low[i]),
+            "high": float(high[i]),
+            "relative_low": float(relative_low[i]),
+            "relative_high": float(relative_high[i]),
+            "significant": bool(low[i] > 0 or high[i] < 0),
+        }
+    p_value, slower = rank_test(base, new)
+    comparison["rank_test"] = {"p_value": p_value, "slower": slower, "significant": p_value < 1 - confidence}
+    return comparison
+
+
+def bootstrap_samples(samples, resamples=DEFAULT_RESAMPLES, seed=DEFAULT_SEED):
+    """
+    Returns the bootstrap statistics of every sample, all resampled independently from one seeded generator.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    return [bootstrap_statistics(sample, resamples, rng) for sample in samples]
+
+
+def compare_to_baseline(samples, baseline_index=0, resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, seed=DEFAULT_SEED):
+    """
+    Compares every sample with the baseline sample. Every sample is resampled once, so comparing
+    many runs costs one bootstrap per run rather than one per pair.
+
+    Returns:
+        list: The comparison of every sample as returned by compare_samples, None for the baseline.
+    """
+    bootstraps = bootstrap_samples(samples, resamples, seed)
+    return [None if i == baseline_index else
+            compare_samples(samples[baseline_index], sample, bootstraps[baseline_index], bootstraps[i], confidence)
+            for i, sample in enumerate(samples)]
+
+
+def check_budget(base_bootstrap, new_bootstrap, metric, budget, confidence=DEFAULT_CONFIDENCE):
+    """
+    Checks whether a metric of a new run is worse than that of a base run by more than a budget. The verdict
+    is taken on one-sided bootstrap bounds of the relative change rather than on the point estimate,
+    so a noisy tail makes the verdict inconclusive instead of failing it.
+
+    Args:
+        base_bootstrap, new_bootstrap (np.ndarray): Bootstrap statistics of both runs, see bootstrap_statistics.
+        metric (str): One of METRICS.
+        budget (float): Allowed increase of the metric (%).
+        confidence (float): Confidence of each bound.
+
+    Returns:
+        dict: The lower and upper bound of the relative change (%) and the verdict: "fail" when the metric
+            is worse than the budget allows with the given confidence, "pass" when it is within the
+            budget with the given confidence and "inconclusive" otherwise.
+    """
+    import numpy as np
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (metric_values(new_bootstrap)[metric] / metric_values(base_bootstrap)[metric] - 1) * 100
+    low, high = np.percentile(change, [(1 - confidence) * 100, confidence * 100])
+    if low > budget:
+        verdict = "fail"
+    elif high <= budget:
+        verdict = "pass"
+    else:
+        verdict = "inconclusive"
+    return {"low_pct": float(low), "high_pct": float(high), "verdict": verdict}
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import cProfile
+import resource
+import contextlib
+
+
+class StageProfiler:
+    """
+    Records wall time, CPU time, peak memory and event counts for the stages of an analysis script.
+
+    CPU time includes the worker processes of a stage once they have exited, e.g. when its Pool is closed.
+    Peak RSS is the high-water mark of this process during the stage where the kernel allows resetting it
+    through /proc/self/clear_refs, and the high-water mark since start otherwise.
+
+    Attributes:
+        enabled (bool): Whether stages are recorded. A disabled profiler only runs the stages.
+        cprofile_stage (str): Name of a stage to run under cProfile, or None.
+        stages (dict): The recorded metrics of every finished stage, in order.
+    """
+
+    def __init__(self, enabled=False, cprofile_stage=None):
+        self.enabled = enabled
+        self.cprofile_stage = cprofile_stage
+        self.cprofile = None
+        self.stages = dict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Profiles the enclosed block as a stage. Yields a dict the block adds its counters to,
+        such as events_parsed, events_kept and bytes_read.
+        """
+        counters = dict()
+        if not self.enabled:
+            yield counters
+            return
+
+        reset_peak_rss()
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_before = time.process_time()
+        if name == self.cprofile_stage:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        wall_before = time.perf_counter()
+
+        yield counters
+
+        wall = time.perf_counter() - wall_before
+        if name == self.cprofile_stage:
+            self.cprofile.disable()
+        cpu = time.process_time() - cpu_before
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        self.stages[name] = dict({
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "children_cpu_s": (children.ru_utime + children.ru_stime) - (children_before.ru_utime + children_before.ru_stime),
+            "peak_rss_kb": peak_rss_kb(),
+            "children_peak_rss_kb": children.ru_maxrss,
+        }, **counters)
+
+    def write_report(self, path):
+        """
+        Writes the recorded stages to a JSON report, and the cProfile statistics of the
+        profiled stage next to it.
+        """
+        report = {
+            "stages": self.stages,
+            "total_wall_s": sum(stage["wall_s"] for stage in self.stages.values()),
+        }
+        with open(path, "w") as f:
+            f.write(json.dumps(report, indent=4))
+
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(f"{os.path.splitext(path)[0]}.{self.cprofile_stage}.prof")
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of this process. Fails silently on kernels that do not support it.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_kb():
+    """
+    Returns the peak RSS (kB) of this process.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
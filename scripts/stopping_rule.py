@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+from statistics import NormalDist
+from benchout_reader import read_benchout
+
+# Constants
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+DEFAULT_TOLERANCE = 1.0  # Half width (%) of the confidence interval of every quantile
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_ITERATIONS = 100
+DEFAULT_STABLE = 5  # Consecutive iterations the intervals must stay within the tolerance
+EXIT_STOP = 0
+EXIT_CONTINUE = 1  # Also the exit code of a crash, so a failing controller never ends a benchmark early
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(
+        description="Decide after every iteration of a benchmark whether its duration distribution has converged. "
+                    "Exits with 0 when the benchmark should stop and 1 when it should continue."
+    )
+    parser.add_argument("benchout", type=str, help="The .benchout file of the iteration that just finished.")
+    parser.add_argument("log", type=str,
+                        help="The .stopping.jsonl log of the benchmark. Every decision is appended to it, and the "
+                             "durations of the earlier iterations are read from it.")
+    parser.add_argument("--quantiles", type=float, nargs="+", default=list(DEFAULT_QUANTILES),
+                        help="Quantiles whose confidence intervals must converge (default: 0.5 0.9 0.99).")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed half width of every confidence interval in percent of its quantile (default: 1).")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE, help="Confidence level of the intervals (default: 0.95).")
+    parser.add_argument("--min_iterations", type=int, default=DEFAULT_MIN_ITERATIONS,
+                        help="Iterations with a duration to run before stopping early (default: 100).")
+    parser.add_argument("--max_iterations", type=int, default=None,
+                        help="Iterations after which the benchmark stops regardless (default: no limit).")
+    parser.add_argument("--stable", type=int, default=DEFAULT_STABLE,
+                        help="Consecutive iterations the intervals must stay within the tolerance (default: 5).")
+    return parser.parse_args()
+
+
+def read_log(log_path):
+    """
+    Reads the decisions logged for the earlier iterations of a benchmark.
+    """
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def quantile_interval(sorted_durations, q, confidence):
+    """
+    Estimates a quantile with a distribution-free confidence interval between two order statistics. The
+    number of durations below the quantile is binomial, so the ranks of the bounds are taken from its
+    normal approximation.
+
+    Args:
+        sorted_durations (list): The durations seen so far, ascending.
+        q (float): The quantile.
+        confidence (float): Confidence level of the interval.
+
+    Returns:
+        tuple: The estimate, interpolated linearly like np.percentile, and the lower and upper bound, which
+            are None while there are too few durations for an interval at the tail of the distribution.
+    """
+    n = len(sorted_durations)
+    position = (n - 1) * q
+    below = math.floor(position)
+    above = min(below + 1, n - 1)
+    estimate = sorted_durations[below] + (sorted_durations[above] - sorted_durations[below]) * (position - below)
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    spread = z * math.sqrt(n * q * (1 - q))
+    low_rank = math.floor(n * q - spread)
+    high_rank = math.ceil(n * q + spread)
+    if low_rank < 1 or high_rank > n:
+        return estimate, None, None
+    return estimate, sorted_durations[low_rank - 1], sorted_durations[high_rank - 1]
+
+
+def decide(durations, iterations, converged_streak, quantiles, tolerance, confidence, min_iterations, max_iterations, stable):
+    """
+    Applies the stopping rule after an iteration. The benchmark stops once it has min_iterations durations and
+    the confidence interval of every quantile has been within the tolerance for stable iterations in a row, or
+    once it ran max_iterations iterations. Requiring a streak keeps a single lucky interval from ending the
+    benchmark, since the intervals are checked again after every iteration.
+
+    Args:
+        durations (list): The durations of every iteration with a duration, including the last one.
+        iterations (int): The iterations run, including those without a duration.
+        converged_streak (int): Consecutive iterations before this one whose intervals were within the tolerance.
+
+    Returns:
+        dict: The decision ("stop" or "continue"), its reason, the streak and the interval of every quantile.
+    """
+    sorted_durations = sorted(durations)
+    intervals = dict()
+    converged = len(sorted_durations) > 0
+    for q in (quantiles if sorted_durations else ()):
+        estimate, low, high = quantile_interval(sorted_durations, q, confidence)
+        half_width = None if low is None else (high - low) / 2 / estimate * 100
+        intervals[f"p{q * 100:g}"] = {"estimate": estimate, "low": low, "high": high, "half_width_pct": half_width}
+        converged = converged and half_width is not None and half_width <= tolerance
+    streak = converged_streak + 1 if converged else 0
+
+    if max_iterations is not None and iterations >= max_iterations:
+        decision, reason = "stop", "maximum iterations reached"
+    elif len(durations) < min_iterations:
+        decision, reason = "continue", "minimum iterations not reached"
+    elif streak >= stable:
+        decision, reason = "stop", f"intervals within {tolerance:g}% for {streak} iterations"
+    elif converged:
+        decision, reason = "continue", f"intervals within {tolerance:g}% for {streak} of {stable} iterations"
+    else:
+        decision, reason = "continue", f"intervals wider than {tolerance:g}%"
+    return {"decision": decision, "reason": reason, "streak": streak, "quantiles": intervals}
+
+
+def main():
+    args = parse_arguments()
+    entries = read_log(args.log)
+    durations = [entry["duration"] for entry in entries if entry["duration"] is not None]
+    duration = read_benchout(args.benchout).duration
+    if duration is not None:
+        durations.append(duration)
+
+    streak = entries[-1]["streak"] if entries else 0
+    entry = {"iteration": len(entries) + 1, "benchout": os.path.basename(args.benchout), "duration": duration,
+             "timestamp": time.time()}
+    entry.update(decide(durations, len(entries) + 1, streak, args.quantiles, args.tolerance, args.confidence,
+                        args.min_iterations, args.max_iterations, args.stable))
+    with open(args.log, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+    print(f"Iteration {entry['iteration']}: {entry['decision']}, {entry['reason']}")
+    sys.exit(EXIT_STOP if entry["decision"] == "stop" else EXIT_CONTINUE)
+
+
+if __name__ == "__main__":
+    main()
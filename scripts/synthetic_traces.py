@@ -0,0 +1,201 @@
+import os
+import argparse
+import numpy as np
+
+# Constants
+DEFAULT_BENCHMARK_NAME = "nbody-omp"
+DEFAULT_SYSTEM_NAME = "synthetic"
+DEFAULT_WORKLOAD_NAME = "main"
+TRACE_HEADER = (
+    "# tracer: osnoise\n"
+    "#\n"
+    "#                                _-------=> irqs-off\n"
+    "#                               / _------=> need-resched\n"
+    "#                              | / _-----=> need-resched-lazy\n"
+    "#                              || / _----=> hardirq/softirq\n"
+    "#                              ||| / _---=> preempt-depth\n"
+    "#                              |||| / _--=> migrate-disable\n"
+    "#                              ||||| /     delay\n"
+    "#           TASK-PID     CPU#  |||||| TIMESTAMP  FUNCTION\n"
+    "#              | |         |   ||||||     |         |\n"
+)
+
+# Noise sources per event type: (task name, pid or irq vector, irq flags), together with the
+# log-normal median (ns) and shape of their durations
+NOISE_TYPES = {
+    "irq_noise": ([("local_timer", 236, "d.h1."), ("nvme0q1", 131, "d.h1."), ("eth0-TxRx-0", 145, "d.h1.")], 2500, 0.6),
+    "softirq_noise": ([("TIMER", 1, "..s1."), ("NET_RX", 3, "..s1."), ("RCU", 9, "..s1."), ("SCHED", 7, "..s1.")], 4000, 0.8),
+    "thread_noise": ([("kworker/{cpu}:1", 100, "....."), ("ksoftirqd/{cpu}", 20, "....."),
+                      ("rcu_preempt", 16, "....."), ("migration/{cpu}", 21, "....."), ("systemd-journal", 412, ".....")], 15000, 1.2),
+    "nmi_noise": ([("", 0, "d.Z1.")], 1500, 0.3),
+}
+DEFAULT_TASK_MIX = {"irq_noise": 0.45, "softirq_noise": 0.25, "thread_noise": 0.28, "nmi_noise": 0.02}
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic osnoise .trace and .benchout pairs in the format written by Benchmark.sh."
+    )
+    parser.add_argument("output_folder", type=str, help="Folder to write the trace files to.")
+    parser.add_argument("-c", "--cpus", type=int, default=8, help="Number of physical cores (default: 8).")
+    parser.add_argument("-smt", "--smt", action="store_true", help="Generate two hardware threads per core.")
+    parser.add_argument("-r", "--event_rate", type=float, default=2000,
+                        help="Noise events per second on every CPU (default: 2000).")
+    parser.add_argument("-d", "--duration", type=float, default=1.0,
+                        help="Median workload duration in seconds (default: 1.0).")
+    parser.add_argument("-i", "--iterations", type=int, default=10, help="Number of trace files (default: 10).")
+    parser.add_argument("-m", "--task_mix", type=str, default=None,
+                        help="Relative weights of the noise types as irq,softirq,thread,nmi (default: 0.45,0.25,0.28,0.02).")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Random seed (default: 0).")
+    parser.add_argument("-b", "--benchmark_name", type=str, default=DEFAULT_BENCHMARK_NAME,
+                        help="Benchmark name used in the file names (default: 'nbody-omp').")
+    parser.add_argument("-w", "--workload_name", type=str, default=DEFAULT_WORKLOAD_NAME,
+                        help="Name of the workload task (default: 'main').")
+    return parser.parse_args()
+
+
+def parse_task_mix(task_mix):
+    """
+    Parses "irq,softirq,thread,nmi" weights into a task mix dict.
+    """
+    if task_mix is None:
+        return dict(DEFAULT_TASK_MIX)
+    weights = [float(weight) for weight in task_mix.split(",")]
+    if len(weights) != len(NOISE_TYPES):
+        raise ValueError(f"Expected {len(NOISE_TYPES)} task mix weights, got {len(weights)}")
+    return dict(zip(NOISE_TYPES.keys(), weights))
+
+
+def format_time(ns, decimals=9):
+    """
+    Formats a time in nanoseconds as seconds the way the tracer and the Timer in common/time_utils.hpp do.
+    """
+    return f"{ns // 1000000000}.{ns % 1000000000:09d}"[:decimals - 9 or None]
+
+
+def generate_trace(rng, cpus, event_rate, workload_duration, task_mix, workload_name, workload_pid, trace_start):
+    """
+    Generates the lines of one osnoise trace and the workload window it was captured around.
+
+    Noise arrives as a Poisson process on every CPU over the whole capture, which starts one second
+    before the workload as in Benchmark.sh. The workload threads run once on every CPU at the start of the workload.
+
+    Args:
+        rng (np.random.Generator): Random number generator.
+        cpus (int): Number of logical CPUs.
+        event_rate (float): Noise events per second on every CPU.
+        workload_duration (int): Workload duration (ns).
+        task_mix (dict): Relative weight of every noise type.
+        workload_name (str): Name of the workload task.
+        workload_pid (int): PID of the workload task.
+        trace_start (int): Time (ns) the capture starts.
+
+    Returns:
+        tuple: The trace lines, the workload start (ns) and the workload end (ns).
+    """
+    workload_start = trace_start + 1000000000
+    workload_end = workload_start + workload_duration
+    capture_duration = workload_end + 100000000 - trace_start
+
+    events = rng.poisson(event_rate * capture_duration / 1e9, size=cpus)
+    cpu = np.repeat(np.arange(cpus), events)
+    start = trace_start + rng.integers(0, capture_duration, size=len(cpu))
+
+    types = list(NOISE_TYPES.keys())
+    weights = np.array([task_mix[t] for t in types], dtype=np.float64)
+    noise_type = rng.choice(len(types), size=len(cpu), p=weights / weights.sum())
+    source = np.empty(len(cpu), dtype=np.int64)
+    duration = np.empty(len(cpu), dtype=np.int64)
+    for i, (sources, median, shape) in enumerate(NOISE_TYPES.values()):
+        of_type = noise_type == i
+        source[of_type] = rng.integers(0, len(sources), size=np.count_nonzero(of_type))
+        duration[of_type] = np.maximum(1, rng.lognormal(np.log(median), shape, size=np.count_nonzero(of_type))).astype(np.int64)
+
+    # The workload threads are scheduled on every CPU right after the barrier
+    workload_offset = rng.integers(0, 20000, size=cpus)
+    cpu = np.concatenate([cpu, np.arange(cpus)])
+    start = np.concatenate([start, workload_start + workload_offset * (np.arange(cpus) > 0)])
+    noise_type = np.concatenate([noise_type, np.full(cpus, types.index("thread_noise"))])
+    source = np.concatenate([source, np.full(cpus, -1)])
+    duration = np.concatenate([duration, rng.integers(1000, 50000, size=cpus)])
+
+    # Events are written to the ring buffer when the noise ends
+    end = start + duration
+    order = np.lexsort((cpu, end))
+
+    lines = [TRACE_HEADER]
+    for c, s, d, e, t, src in zip(cpu[order].tolist(), start[order].tolist(), duration[order].tolist(),
+                                  end[order].tolist(), noise_type[order].tolist(), source[order].tolist()):
+        noise = types[t]
+        if src < 0:
+            name, pid, flags = workload_name, workload_pid, "....."
+        else:
+            name, pid, flags = NOISE_TYPES[noise][0][src]
+            name = name.format(cpu=c)
+        task = f" {name:>8}:{pid}" if name else ""
+        lines.append(f"       osnoise/{c}-{900 + c:<6} [{c:03d}] {flags} {format_time(e + 500, 6):>12}: "
+                     f"{noise}:{task} start {format_time(s)} duration {d} ns\n")
+    return lines, workload_start, workload_end
+
+
+def write_benchout(path, workload_start, workload_end):
+    """
+    Writes a .benchout file with the timer output of the workload and the lines Benchmark.sh appends.
+    """
+    duration = workload_end - workload_start
+    with open(path, "w") as f:
+        f.write("Synthetic workload\n")
+        f.write(f"Start time: {format_time(workload_start)} seconds\n")
+        f.write(f"End time: {format_time(workload_end)} seconds\n")
+        f.write(f"Total Duration: {format_time(duration)} seconds\n")
+        f.write("Input params: synthetic\n")
+        f.write("Noise injector was enabled? A: no\n")
+
+
+def generate_traces(output_folder, cpus=8, smt=False, event_rate=2000, duration=1.0, iterations=10, task_mix=None,
+                    seed=0, benchmark_name=DEFAULT_BENCHMARK_NAME, workload_name=DEFAULT_WORKLOAD_NAME):
+    """
+    Writes synthetic trace and benchout pairs named like the ones written by Benchmark.sh.
+    Workload durations vary by a few percent between iterations with an occasional slow iteration.
+
+    Returns:
+        [str]: The written trace file names.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    logical_cpus = cpus * 2 if smt else cpus
+    task_mix = task_mix or dict(DEFAULT_TASK_MIX)
+
+    trace_files = []
+    trace_start = 1000 * 1000000000
+    for iteration in range(1, iterations + 1):
+        slowdown = rng.normal(1.0, 0.02) + (rng.exponential(0.1) if rng.random() < 0.1 else 0)
+        workload_duration = int(duration * 1e9 * max(slowdown, 0.5))
+        lines, workload_start, workload_end = generate_trace(rng, logical_cpus, event_rate, workload_duration, task_mix,
+                                                             workload_name, 4000 + iteration, trace_start)
+
+        name = f"{benchmark_name}-{iteration}-{DEFAULT_SYSTEM_NAME}"
+        with open(os.path.join(output_folder, name + ".trace"), "w") as f:
+            f.writelines(lines)
+        write_benchout(os.path.join(output_folder, name + ".benchout"), workload_start, workload_end)
+        trace_files.append(name + ".trace")
+
+        trace_start = workload_end + 2 * 1000000000
+    return trace_files
+
+
+def main():
+    args = parse_arguments()
+    trace_files = generate_traces(args.output_folder, args.cpus, args.smt, args.event_rate, args.duration, args.iterations,
+                                  parse_task_mix(args.task_mix), args.seed, args.benchmark_name, args.workload_name)
+    print(f"Wrote {len(trace_files)} traces to {args.output_folder}")
+
+
+if __name__ == "__main__":
+    main()
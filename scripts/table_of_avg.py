@@ -1,63 +1,28 @@
-import os
-import re
 import argparse
-from tabulate import tabulate
-from termcolor import colored
-
-def find_stats_files(root_dirs):
-    stats_files = []
-    for root_dir in root_dirs:
-        for dirpath, _, filenames in os.walk(root_dir):
-            for filename in filenames:
-                if filename.endswith("_stats.txt"):
-                    stats_files.append(os.path.join(dirpath, filename))
-    return stats_files
-
-def parse_stats_file(file_path):
-    stats = {}
-    with open(file_path, "r") as file:
-        current_section = None
-        for line in file:
-            line = line.strip()
-            if line.startswith("---"):
-                current_section = line.strip("- ")
-                stats[current_section] = {}
-            elif line and current_section:
-                key, value = line.split(":", 1)
-                stats[current_section][key.strip()] = float(value.strip())
-    return stats
-
-def populate_stats_dict(stats_files, root_path):
-    all_stats = []
-    all_names = []
+from results_db import open_results, query_durations, execution_statistics
+
+# Names of the mitigation strategies, by the mitigation and thread count prefix of the log folder names
+MITIGATION_NAMES = {
+    (0, 8): "Roam",
+    (0, 7): "RoamHK",
+    (1, 8): "TP",
+    (2, 8): "TPHK",
+    (2, 7): "TPHKx2",
+}
+
+def populate_stats_dict(conn, root_dirs):
     stats_dict = dict()
 
-    # Load benchmark stats from root directories
-    for stats_file in stats_files:
-        name = os.path.relpath(stats_file, start=os.path.commonpath(root_path))
-        fin_name = name.split("/")[0]
-
-        match fin_name[:4]:
-            case "0-8-":
-                fin_name="Roam"
-            case "0-7-":
-                fin_name="RoamHK"
-            case "1-8-":
-                fin_name="TP"
-            case "2-8-":
-                fin_name="TPHK"
-            case "2-7-":
-                fin_name="TPHKx2"
-                
-        if "sycl" in name:
+    # Compute benchmark stats of every log folder in the root directories
+    for result in query_durations(conn, root_dirs):
+        fin_name = MITIGATION_NAMES.get((result["mitigation"], result["threads"]), result["name"])
+
+        if "sycl" in result["bench"]:
             fin_name = fin_name+"-sycl"
-        elif "omp" in name:
+        elif "omp" in result["bench"]:
             fin_name = fin_name+"-omp"
 
-        #all_names.append(fin_name)
-        stats = parse_stats_file(stats_file)
-        #all_stats.append(stats)
-        stats_dict[fin_name] = stats
+        stats_dict[fin_name] = execution_statistics(sorted(result["durations"]))
 
     return stats_dict
 
@@ -67,21 +32,21 @@ def main():
     parser.add_argument("root_dirs", nargs="+", help="Root directories containing compared benchmark results.")
     parser.add_argument("baseline_dirs", nargs="+", help="Root directories containing baseline benchmark results.")
     parser.add_argument("--output", help="Path to the output file.", default=None)
+    parser.add_argument("--db", help="Results database to ingest the directories into and read them from (default: in memory).",
+                        default=None)
     args = parser.parse_args()
 
-    stats_files_c = find_stats_files(args.root_dirs)
-    if not stats_files_c:
-        print("No _stats.txt files found in the provided comparison directories.")
+    conn = open_results(args.root_dirs + args.baseline_dirs, args.db)
+    dict_c = populate_stats_dict(conn, args.root_dirs)
+    if not dict_c:
+        print("No benchmark results found in the provided comparison directories.")
         return
 
-    stats_files_b = find_stats_files(args.baseline_dirs)
-    if not stats_files_c:
-        print("No _stats.txt files found in the provided baseline directories.")
+    dict_b = populate_stats_dict(conn, args.baseline_dirs)
+    if not dict_b:
+        print("No benchmark results found in the provided baseline directories.")
         return
 
-    dict_c = populate_stats_dict(stats_files_c, args.root_dirs)
-    dict_b = populate_stats_dict(stats_files_b, args.baseline_dirs)
-
     print(dict_c["Roam-omp"]["Execution Times (seconds)"]["Average"])
 
     out_name = "-"
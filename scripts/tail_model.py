@@ -0,0 +1,334 @@
+import math
+import argparse
+import numpy as np
+from results_db import open_results, query_durations
+from significance import DEFAULT_CONFIDENCE, DEFAULT_SEED
+
+# Constants
+MODELS = {"gev": "GEV", "gumbel": "Gumbel", "gpd": "GPD"}
+DEFAULT_BLOCK_SIZE = 10  # Iterations per block of the block maxima models (GEV, Gumbel)
+DEFAULT_THRESHOLD_QUANTILE = 0.9  # The peaks over threshold model (GPD) is fitted to the durations above this quantile
+DEFAULT_QUANTILES = (0.999, 0.9999)
+DEFAULT_RESAMPLES = 1000
+DEFAULT_GOF_RESAMPLES = 200
+DEFAULT_TARGET_WIDTH = 2.0  # Half width (%) of the confidence band of the first quantile the iteration count is searched for
+DEFAULT_STEP = 100  # Iterations added per step of the iteration count search
+MIN_FIT_SAMPLES = 10  # Block maxima or exceedances needed for a fit
+EULER_GAMMA = 0.5772156649015329
+SHAPE_EPSILON = 1e-9  # Shapes closer to zero use the exponential limit of the distributions
+
+_gamma = np.vectorize(math.gamma, otypes=[float])
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(
+        description="Estimate extreme quantiles of the execution times of benchmark runs with block maxima (GEV, Gumbel) and peaks over threshold (GPD) models."
+    )
+    parser.add_argument("folders", type=str, nargs="+", help="Log folders containing benchmark outputs.")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Results database to ingest the folders into and read them from (default: in memory).")
+    parser.add_argument("--block_size", type=int, default=DEFAULT_BLOCK_SIZE, help="Iterations per block maximum (default: 10).")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD_QUANTILE,
+                        help="Quantile of the durations the GPD is fitted above (default: 0.9).")
+    parser.add_argument("--target_width", type=float, default=DEFAULT_TARGET_WIDTH,
+                        help="Half width in percent of the p99.9 confidence band to find the needed iterations for (default: 2).")
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES, help="Number of bootstrap resamples (default: 1000).")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE, help="Confidence level of the bands (default: 0.95).")
+    return parser.parse_args()
+
+
+def quantile_name(q):
+    """
+    Returns the percentile name of a quantile, e.g. "p99.9" for 0.999.
+    """
+    return f"p{q * 100:.10g}"
+
+
+def _power_term(t, k):
+    """
+    Returns (1 - t^k) / k, or its limit -ln(t) for shapes close to zero.
+    """
+    small = np.abs(k) < SHAPE_EPSILON
+    safe = np.where(small, 1.0, k)
+    return np.where(small, -np.log(t), -np.expm1(safe * np.log(t)) / safe)
+
+
+def _log_term(z, k):
+    """
+    Returns -ln(1 - k z) / k, or its limit z for shapes close to zero. Values outside the support are
+    moved to its end, so the distribution functions evaluate to 0 or 1 there.
+    """
+    small = np.abs(k) < SHAPE_EPSILON
+    safe = np.where(small, 1.0, k)
+    return np.where(small, z, -np.log(np.maximum(1 - safe * z, np.finfo(float).tiny)) / safe)
+
+
+def _probability_weighted_moments(sorted_rows):
+    """
+    Returns the unbiased probability weighted moments b0, b1 and b2 of every row of a row-wise ascending array.
+    """
+    n = sorted_rows.shape[-1]
+    i = np.arange(n, dtype=np.float64)
+    b0 = sorted_rows.mean(axis=-1)
+    b1 = sorted_rows @ (i / (n - 1)) / n
+    b2 = sorted_rows @ (i * (i - 1) / ((n - 1) * (n - 2))) / n
+    return b0, b1, b2
+
+
+def fit_model(model, sorted_rows):
+    """
+    Fits a model to every row of a row-wise ascending array with L-moments (GEV, Gumbel, Hosking 1985) or
+    probability weighted moments (GPD, Hosking and Wallis 1987). Both are closed-form, so thousands of
+    bootstrap resamples are fitted with a few array operations, and are more stable than maximum
+    likelihood for the sample sizes of a benchmark.
+
+    Args:
+        model (str): One of MODELS.
+        sorted_rows (np.ndarray): Block maxima, or exceedances over the threshold for the GPD, sorted along the last axis.
+
+    Returns:
+        tuple: Location, scale and shape k of every row, with k = -xi (k > 0 is a bounded tail).
+    """
+    b0, b1, b2 = _probability_weighted_moments(sorted_rows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if model == "gpd":
+            a1 = b0 - b1
+            k = b0 / (b0 - 2 * a1) - 2
+            return np.zeros_like(b0), 2 * b0 * a1 / (b0 - 2 * a1), k
+
+        l1, l2, l3 = b0, 2 * b1 - b0, 6 * b2 - 6 * b1 + b0
+        if model == "gumbel":
+            scale = l2 / math.log(2)
+            return l1 - EULER_GAMMA * scale, scale, np.zeros_like(l1)
+
+        c = 2 / (3 + l3 / l2) - math.log(2) / math.log(3)
+        k = 7.8590 * c + 2.9554 * c ** 2
+        k = np.where(np.abs(k) < SHAPE_EPSILON, SHAPE_EPSILON, k)
+        gamma = _gamma(1 + k)
+        scale = l2 * k / ((1 - 2 ** -k) * gamma)
+        return l1 - scale * (1 - gamma) / k, scale, k
+
+
+def model_quantile(model, params, f):
+    """
+    Returns the quantile of the fitted distribution at probability f.
+    """
+    loc, scale, k = params
+    if model == "gpd":
+        return loc + scale * _power_term(1 - f, k)
+    return loc + scale * _power_term(-np.log(f), k)
+
+
+def model_cdf(model, params, x):
+    """
+    Returns the fitted distribution function at x, x broadcasting against the fitted rows.
+    """
+    loc, scale, k = (np.expand_dims(param, -1) for param in params)
+    z = (x - loc) / scale
+    if model == "gpd":
+        return -np.expm1(-_log_term(z, k))
+    return np.exp(-np.exp(-_log_term(z, k)))
+
+
+def ks_statistic(model, params, sorted_rows):
+    """
+    Returns the Kolmogorov-Smirnov distance between every row and the distribution fitted to it.
+    """
+    n = sorted_rows.shape[-1]
+    cdf = model_cdf(model, params, sorted_rows)
+    above = np.arange(1, n + 1) / n - cdf
+    below = cdf - np.arange(n) / n
+    return np.maximum(above.max(axis=-1), below.max(axis=-1))
+
+
+def tail_quantile(model, params, threshold, q, block_size, exceedance_rate):
+    """
+    Returns the q-quantile of the per-iteration duration implied by a fitted model.
+    """
+    if model == "gpd":
+        return threshold + model_quantile(model, params, 1 - (1 - q) / exceedance_rate)
+    return model_quantile(model, params, q ** block_size)
+
+
+def block_maxima(durations, block_size):
+    """
+    Returns the maxima of consecutive blocks of iterations, dropping the iterations of an incomplete last block.
+    """
+    blocks = durations.shape[-1] // block_size
+    return durations[..., :blocks * block_size].reshape(durations.shape[:-1] + (blocks, block_size)).max(axis=-1)
+
+
+def fit_sizes(n, block_size, threshold_quantile):
+    """
+    Returns the number of block maxima and of exceedances used for n iterations.
+    """
+    # n - ceil(n q) rather than floor(n (1 - q)), since 1 - q is rounded, e.g. 1 - 0.9 < 0.1
+    return n // block_size, n - math.ceil(n * threshold_quantile)
+
+
+def estimate_tail(durations, model, quantiles=DEFAULT_QUANTILES, block_size=DEFAULT_BLOCK_SIZE,
+                  threshold_quantile=DEFAULT_THRESHOLD_QUANTILE, resamples=DEFAULT_RESAMPLES,
+                  gof_resamples=DEFAULT_GOF_RESAMPLES, confidence=DEFAULT_CONFIDENCE, rng=None):
+    """
+    Fits a tail model to the durations of a run and estimates extreme quantiles with bootstrap confidence bands.
+
+    Block maxima models are fitted to the maxima of consecutive blocks of block_size iterations, and the
+    q-quantile of one iteration is the q^block_size-quantile of a block maximum. The GPD is fitted to the
+    exceedances over the threshold_quantile of the durations. The bands resample the iterations and
+    refit the model. Goodness of fit is the Kolmogorov-Smirnov distance between the fitted sample
+    and the model, with a parametric bootstrap p-value since the parameters are estimated from the sample.
+
+    Args:
+        durations (list): Durations of the iterations, in iteration order.
+        model (str): One of MODELS.
+        quantiles (tuple): Quantiles to estimate.
+        block_size (int): Iterations per block maximum.
+        threshold_quantile (float): Quantile of the durations the GPD is fitted above.
+        resamples (int): Number of bootstrap resamples of the bands.
+        gof_resamples (int): Number of parametric bootstrap samples of the goodness of fit p-value.
+        confidence (float): Confidence level of the bands.
+        rng (np.random.Generator): Source of the resamples.
+
+    Returns:
+        dict: The parameters, with the shape as xi (xi > 0 is a heavy tail), the estimate and band of every
+            quantile and the goodness of fit, or None if the run has too few iterations for the model.
+            The p-value is NaN when gof_resamples is 0.
+    """
+    rng = np.random.default_rng(DEFAULT_SEED) if rng is None else rng
+    durations = np.asarray(durations, dtype=np.float64)
+    maxima, exceedances = fit_sizes(len(durations), block_size, threshold_quantile)
+    if (exceedances if model == "gpd" else maxima) < MIN_FIT_SAMPLES:
+        return None
+    exceedance_rate = exceedances / len(durations)
+
+    def fit(rows):
+        # Block maxima, or the largest durations minus the threshold, the largest duration below them
+        if model != "gpd":
+            sample = np.sort(block_maxima(rows, block_size), axis=-1)
+            return sample, 0.0, fit_model(model, sample)
+        rows = np.sort(rows, axis=-1)
+        threshold = rows[..., -exceedances - 1]
+        sample = rows[..., -exceedances:] - threshold[..., None]
+        return sample, threshold, fit_model(model, sample)
+
+    sample, threshold, params = fit(durations)
+    resampled = durations[rng.integers(0, len(durations), (resamples, len(durations)))]
+    _, resampled_threshold, resampled_params = fit(resampled)
+
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    result = {
+        "samples": sample.shape[-1],
+        "threshold": float(threshold),
+        "loc": float(params[0]),
+        "scale": float(params[1]),
+        "shape": 0.0 - float(params[2]),
+    }
+    for q in quantiles:
+        estimates = tail_quantile(model, resampled_params, resampled_threshold, q, block_size, exceedance_rate)
+        low, high = np.nanpercentile(estimates, tails)
+        result[quantile_name(q)] = float(tail_quantile(model, params, threshold, q, block_size, exceedance_rate))
+        result[f"{quantile_name(q)}_low"] = float(low)
+        result[f"{quantile_name(q)}_high"] = float(high)
+
+    # Parametric bootstrap of the distance, fitting every simulated sample like the observed one
+    ks = float(ks_statistic(model, params, sample))
+    result["ks"] = ks
+    result["ks_p_value"] = math.nan
+    if gof_resamples > 0:
+        simulated = np.sort(model_quantile(model, params, rng.random((gof_resamples, sample.shape[-1]))), axis=-1)
+        simulated_ks = ks_statistic(model, fit_model(model, simulated), simulated)
+        result["ks_p_value"] = float(np.mean(simulated_ks >= ks))
+    return result
+
+
+def iterations_needed(durations, model, q=DEFAULT_QUANTILES[0], target_width=DEFAULT_TARGET_WIDTH, step=DEFAULT_STEP,
+                      block_size=DEFAULT_BLOCK_SIZE, threshold_quantile=DEFAULT_THRESHOLD_QUANTILE,
+                      resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, rng=None):
+    """
+    Finds how many iterations were needed for the confidence band of a quantile to become narrower than
+    target_width percent of the estimate on either side, refitting the model on the first iterations
+    of the run in steps of step iterations.
+
+    Returns:
+        tuple: The first iteration count reaching the target or None, and the relative half width (%)
+            of the band at every iteration count tried.
+    """
+    rng = np.random.default_rng(DEFAULT_SEED) if rng is None else rng
+    widths = dict()
+    for n in range(step, len(durations) + 1, step):
+        estimate = estimate_tail(durations[:n], model, (q,), block_size, threshold_quantile, resamples, 0, confidence, rng)
+        if estimate is None:
+            continue
+        name = quantile_name(q)
+        widths[n] = (estimate[f"{name}_high"] - estimate[f"{name}_low"]) / 2 / estimate[name] * 100
+        if widths[n] <= target_width:
+            return n, widths
+    return None, widths
+
+
+def tail_statistics(durations, quantiles=DEFAULT_QUANTILES, block_size=DEFAULT_BLOCK_SIZE,
+                    threshold_quantile=DEFAULT_THRESHOLD_QUANTILE, target_width=DEFAULT_TARGET_WIDTH,
+                    resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, seed=DEFAULT_SEED):
+    """
+    Computes the tail estimates bench_graphs.py adds to the _stats.txt file of a benchmark.
+
+    Args:
+        durations (list): Durations of the iterations, in iteration order.
+
+    Returns:
+        dict: The statistics per section, with the keys used in the _stats.txt file. Models the run
+            has too few iterations for are left out.
+    """
+    rng = np.random.default_rng(seed)
+    estimates = dict()
+    needed = dict()
+    for model, label in MODELS.items():
+        estimate = estimate_tail(durations, model, quantiles, block_size, threshold_quantile, resamples,
+                                 DEFAULT_GOF_RESAMPLES, confidence, rng)
+        if estimate is None:
+            continue
+        for q in quantiles:
+            name = quantile_name(q)
+            estimates[f"{label} {name}"] = estimate[name]
+            estimates[f"{label} {name} {confidence:.0%} CI low"] = estimate[f"{name}_low"]
+            estimates[f"{label} {name} {confidence:.0%} CI high"] = estimate[f"{name}_high"]
+        estimates[f"{label} shape"] = estimate["shape"]
+        estimates[f"{label} KS distance"] = estimate["ks"]
+        estimates[f"{label} KS p-value"] = estimate["ks_p_value"]
+        iterations, _ = iterations_needed(durations, model, quantiles[0], target_width, DEFAULT_STEP, block_size,
+                                          threshold_quantile, resamples, confidence, rng)
+        needed[label] = iterations if iterations is not None else math.nan
+
+    if not estimates:
+        return dict()
+    return {
+        "Tail Estimates (seconds)": estimates,
+        f"Iterations Needed for {quantile_name(quantiles[0])} within {target_width:g}%": needed,
+    }
+
+
+def main():
+    args = parse_arguments()
+    conn = open_results(args.folders, args.db)
+    for result in query_durations(conn, args.folders):
+        print(f"{result['name']} {result['bench']}: {len(result['durations'])} iterations, "
+              f"empirical p99 {np.percentile(result['durations'], 99):.9f} s, max {max(result['durations']):.9f} s")
+        stats = tail_statistics(result["durations"], DEFAULT_QUANTILES, args.block_size, args.threshold,
+                                args.target_width, args.resamples, args.confidence)
+        if not stats:
+            print("    Too few iterations for a tail model")
+        for section, values in stats.items():
+            print(f"    --- {section} ---")
+            for key, value in values.items():
+                print(f"    {key}: {value:.9g}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import copy
+import random
+import pytest
+from synthetic_traces import generate_traces, DEFAULT_WORKLOAD_NAME
+from traces_to_noise_config import get_event_store, remove_workload, compute_average_trace, clean_worst_trace
+
+
+def baseline_clean_worst_trace(worst_trace, average_dict):
+    """
+    clean_worst_trace before the removal orders, on the "dict(cpu, dict(task, list((start, duration, priority))))"
+    representation of a trace. Rescans every CPU for the closest noise of each removed occurrence.
+    """
+    cpus = sorted(list(worst_trace[0].keys()))
+    cpu_amount = len(cpus)
+
+    global_avg = {}
+    for cpu, task_dict in average_dict.items():
+        for task, (avg_frequency, avg_duration) in task_dict.items():
+            temp_avg = global_avg.setdefault(task, (float(0), 0))
+            global_avg[task] = (temp_avg[0] + avg_frequency, temp_avg[1] + avg_duration)
+
+    for task, (sum_avg_freq, sum_avg_dur) in global_avg.items():
+        global_avg[task] = (int(sum_avg_freq * worst_trace[1]), int(sum_avg_dur/cpu_amount))
+
+    for task, (occurences, avg_duration) in global_avg.items():
+        abs_timings = [() for x in range(cpus[len(cpus)-1]+1)]
+        for cpu in cpus:
+            if task in worst_trace[0][cpu]:
+                abs_timings[cpu] = sorted(enumerate(worst_trace[0][cpu][task]), key=lambda x: abs(x[1][1]-avg_duration))
+
+        for x in range(occurences):
+            global_closest_idx = -1
+            global_closest_cpu = -1
+            global_closest_abs = -1
+            global_closest_local_idx = -1
+
+            for cpu in cpus:
+                closest_idx = -1
+                closest_abs = -1
+                closest_local_idx = -1
+                for (local_idx, (idx, (_, dur, _))) in enumerate(abs_timings[cpu]):
+                    if closest_idx == -1 or abs(dur - avg_duration) < closest_abs:
+                        closest_abs = abs(dur - avg_duration)
+                        closest_idx = idx
+                        closest_local_idx = local_idx
+                    else:
+                        break
+
+                if closest_idx > -1 and (global_closest_cpu == -1 or global_closest_abs > closest_abs):
+                    global_closest_idx = closest_idx
+                    global_closest_cpu = cpu
+                    global_closest_abs = closest_abs
+                    global_closest_local_idx = closest_local_idx
+
+            if global_closest_cpu != -1:
+                start, duration, priority = worst_trace[0][global_closest_cpu][task][global_closest_idx]
+                if duration - avg_duration < 0:
+                    worst_trace[0][global_closest_cpu][task][global_closest_idx] = (start, 0, priority)
+                    abs_timings[global_closest_cpu] = (
+                        abs_timings[global_closest_cpu][:global_closest_local_idx] +
+                        abs_timings[global_closest_cpu][global_closest_local_idx + 1:]
+                    )
+                else:
+                    worst_trace[0][global_closest_cpu][task][global_closest_idx] = (start, duration - avg_duration, priority)
+                    abs_timings[global_closest_cpu][global_closest_local_idx] = (abs_timings[global_closest_cpu][global_closest_local_idx][0], (start, duration - avg_duration, priority))
+
+        for cpu in cpus:
+            if task in worst_trace[0][cpu]:
+                worst_trace[0][cpu][task] = [x for x in worst_trace[0][cpu][task] if x[1] != 0]
+
+    return worst_trace
+
+
+def random_average(event_store, total_duration, rng):
+    """
+    Returns an average dict for the tasks of a trace with random frequencies (events per ns) of up to
+    twice those of the trace and random durations, some of them equal to a duration of the trace.
+    """
+    average_dict = dict()
+    for cpu, task, events in event_store.items():
+        durations = events["duration"].tolist()
+        avg_duration = rng.choice(durations) if durations and rng.random() < 0.5 else rng.randint(0, 40000)
+        average_dict.setdefault(cpu, dict())[task] = (rng.uniform(0, 2) * len(durations) / total_duration, avg_duration)
+    return average_dict
+
+
+def assert_same_cleaning(event_store, total_duration, average_dict):
+    expected = baseline_clean_worst_trace((copy.deepcopy(event_store.to_cpu_dict()), total_duration), average_dict)
+    cleaned = clean_worst_trace((event_store, total_duration), average_dict)
+    assert cleaned[0].to_cpu_dict() == expected[0]
+
+
+@pytest.mark.parametrize("cpus, smt, event_rate", [(2, False, 500), (4, True, 2000), (8, False, 4000)])
+def test_matches_baseline_with_trace_average(tmp_path, cpus, smt, event_rate):
+    trace_files = generate_traces(str(tmp_path), cpus=cpus, smt=smt, event_rate=event_rate, duration=0.05, iterations=4, seed=cpus)
+    average_dict = compute_average_trace(trace_files, str(tmp_path), DEFAULT_WORKLOAD_NAME, use_cache=False)
+    for trace_file in trace_files:
+        worst_trace = remove_workload(get_event_store(trace_file, str(tmp_path), DEFAULT_WORKLOAD_NAME, use_cache=False),
+                                      DEFAULT_WORKLOAD_NAME)
+        assert_same_cleaning(worst_trace[0], worst_trace[1], average_dict)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_baseline_with_random_average(tmp_path, seed):
+    rng = random.Random(seed)
+    trace_files = generate_traces(str(tmp_path), cpus=rng.randint(1, 6), event_rate=rng.choice([200, 1000, 3000]),
+                                  duration=0.02, iterations=1, seed=seed)
+    worst_trace = remove_workload(get_event_store(trace_files[0], str(tmp_path), DEFAULT_WORKLOAD_NAME, use_cache=False),
+                                  DEFAULT_WORKLOAD_NAME)
+    assert_same_cleaning(worst_trace[0], worst_trace[1], random_average(worst_trace[0], worst_trace[1], rng))
@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import subprocess
+import numpy as np
+import pytest
+from synthetic_traces import write_benchout
+from compare_benchmark import EXIT_PASS, EXIT_REGRESSION, EXIT_INPUT_ERROR, EXIT_INCONCLUSIVE
+
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_run(folder, durations_by_bench):
+    """
+    Writes a log folder like Benchmark.sh, with a .benchout file for every iteration duration (s) of every benchmark.
+    """
+    for bench, durations in durations_by_bench.items():
+        os.makedirs(os.path.join(folder, bench))
+        start = 1000 * 1000000000
+        for iteration, duration in enumerate(durations, 1):
+            end = start + int(duration * 1e9)
+            write_benchout(os.path.join(folder, bench, f"{bench}-{iteration}-synthetic.benchout"), start, end)
+            start = end + 1000000000
+    return str(folder)
+
+
+def run_gate(baseline, candidate, *args):
+    result = subprocess.run([sys.executable, os.path.join(SCRIPTS, "compare_benchmark.py"), baseline, candidate, "--gate",
+                             "--resamples", "500", *args], capture_output=True, text=True, cwd=SCRIPTS)
+    return result.returncode, json.loads(result.stdout) if result.stdout else None
+
+
+@pytest.fixture
+def durations():
+    return np.random.default_rng(0).lognormal(np.log(0.05), 0.01, size=200)
+
+
+def test_identical_run_passes(tmp_path, durations):
+    baseline = write_run(tmp_path / "base", {"nbody-omp": durations})
+    candidate = write_run(tmp_path / "same", {"nbody-omp": durations})
+    code, verdict = run_gate(baseline, candidate)
+    assert code == EXIT_PASS
+    assert verdict["verdict"] == "pass"
+    assert {check["metric"] for check in verdict["checks"]} == {"mean", "normalized_p99"}
+
+
+def test_slower_run_fails(tmp_path, durations):
+    baseline = write_run(tmp_path / "base", {"nbody-omp": durations})
+    candidate = write_run(tmp_path / "slow", {"nbody-omp": durations * 1.1})
+    code, verdict = run_gate(baseline, candidate)
+    assert code == EXIT_REGRESSION
+    assert verdict["verdict"] == "fail"
+    assert [check["verdict"] for check in verdict["checks"] if check["metric"] == "mean"] == ["fail"]
+
+
+def test_missing_benchmark_fails(tmp_path, durations):
+    baseline = write_run(tmp_path / "base", {"nbody-omp": durations, "nbody-sycl": durations})
+    candidate = write_run(tmp_path / "crashed", {"nbody-omp": durations})
+    code, verdict = run_gate(baseline, candidate)
+    assert code == EXIT_REGRESSION
+    assert verdict["verdict"] == "fail"
+    assert verdict["unmatched"] == {"baseline": ["nbody-sycl"], "candidate": []}
+
+
+def test_no_common_benchmark_is_an_input_error(tmp_path, durations):
+    baseline = write_run(tmp_path / "base", {"nbody-omp": durations})
+    candidate = write_run(tmp_path / "other", {"nbody-sycl": durations})
+    code, verdict = run_gate(baseline, candidate)
+    assert code == EXIT_INPUT_ERROR
+    assert verdict is None
+
+
+def test_inconclusive_run_is_strict_only(tmp_path):
+    # Few noisy iterations whose mean grew by about the budget, so the bounds of the change straddle it
+    rng = np.random.default_rng(1)
+    durations = rng.lognormal(np.log(0.05), 0.2, size=10)
+    baseline = write_run(tmp_path / "base", {"nbody-omp": durations})
+    candidate = write_run(tmp_path / "noisy", {"nbody-omp": durations * 1.03})
+    code, verdict = run_gate(baseline, candidate, "--budget", "mean=3")
+    assert code == EXIT_PASS
+    assert verdict["verdict"] == "inconclusive"
+    code, verdict = run_gate(baseline, candidate, "--budget", "mean=3", "--strict")
+    assert code == EXIT_INCONCLUSIVE
@@ -0,0 +1,104 @@
+import os
+import re
+import json
+import numpy as np
+import pytest
+from synthetic_traces import generate_traces, DEFAULT_WORKLOAD_NAME
+from trace_cache import parse_trace
+from trace_storage import benchout_path
+
+DURATION_RE = re.compile(r"Total Duration: (\d+\.\d+) seconds")
+TRACE_RE = re.compile(r"\[(\d{3})\].*?:\s(.*noise):\s*([^:]*[\/\w\-:]*|)\s+start\s+(\d+\.\d+)\s+duration\s+(\d+)\s+ns")
+
+
+def dict_cpu_dict(trace_file, workload_name, combine_threads):
+    """
+    The nested dict of tuples as get_cpu_dict built it before the event store, kept as a reference.
+    """
+    with open(benchout_path(trace_file), "r") as lines:
+        for line in lines:
+            if (match := DURATION_RE.match(line)):
+                total_duration = int(match.group(1).replace(".", ""))
+
+    cpu_dict = dict()
+    workload_start_time = -1
+    with open(trace_file, "r") as lines:
+        for line in lines:
+            if (match := TRACE_RE.search(line)):
+                cpu_id = int(match[1])
+                priority = 0 if match[2] == "thread_noise" else -1
+                task = match[3].rsplit(":", 1)[0] or "nmi"
+                start = int(match[4].replace(".", ""))
+                duration = int(match[5])
+                if task == workload_name and (workload_start_time == -1 or workload_start_time > start):
+                    workload_start_time = start
+                if combine_threads:
+                    cpu_id -= cpu_id % 2
+                cpu_dict.setdefault(cpu_id, {}).setdefault(task, []).append((start, duration, priority))
+
+    m_cpu_dict = dict()
+    for cpu, tasks in cpu_dict.items():
+        for task, timings in tasks.items():
+            adjusted_timings = list()
+            for start, duration, priority in timings:
+                if start >= workload_start_time and start <= workload_start_time + total_duration:
+                    adjusted_timings.append((start - workload_start_time, duration, priority))
+                elif start + duration > workload_start_time and start <= workload_start_time + total_duration:
+                    adjusted_timings.append((0, start + duration - workload_start_time, priority))
+            m_cpu_dict.setdefault(cpu, {})[task] = sorted(adjusted_timings, key=lambda x: x[0])
+    return m_cpu_dict
+
+
+@pytest.fixture(scope="module")
+def trace_files(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("traces")
+    return [os.path.join(folder, file)
+            for file in generate_traces(str(folder), cpus=3, smt=True, event_rate=3000, duration=0.2, iterations=4, seed=7)]
+
+
+@pytest.mark.parametrize("combine_threads", [False, True])
+def test_to_cpu_dict_matches_dict_path(trace_files, combine_threads):
+    for trace_file in trace_files:
+        expected = dict_cpu_dict(trace_file, DEFAULT_WORKLOAD_NAME, combine_threads)
+        store = parse_trace(trace_file, benchout_path(trace_file)).to_event_store(DEFAULT_WORKLOAD_NAME, combine_threads)
+        # Compared as JSON so the order of the CPUs, the tasks and the events has to match too
+        assert json.dumps(store.to_cpu_dict()) == json.dumps(expected)
+
+        assert store.cpus() == list(expected)
+        for cpu, tasks in expected.items():
+            assert store.tasks(cpu) == list(tasks)
+            assert [tuple(event) for event in store.cpu_events(cpu)[["start", "duration", "priority"]].tolist()] == \
+                [event for timings in tasks.values() for event in timings]
+        assert store.counts().tolist() == [len(timings) for tasks in expected.values() for timings in tasks.values()]
+        assert store.duration_sums().tolist() == \
+            [sum(duration for _, duration, _ in timings) for tasks in expected.values() for timings in tasks.values()]
+
+
+def test_views_write_through(trace_files):
+    store = parse_trace(trace_files[0], benchout_path(trace_files[0])).to_event_store(DEFAULT_WORKLOAD_NAME)
+    cpu, task, events = next((cpu, task, events) for cpu, task, events in store.items() if len(events) > 1)
+    store.view(cpu, task)["duration"][0] = 0
+    assert store.to_cpu_dict()[cpu][task][0][1] == 0
+    assert store.view(cpu, "unknown") is None and not store.has(cpu, "unknown")
+
+
+def test_remove_task_and_zero_durations(trace_files):
+    expected = dict_cpu_dict(trace_files[0], DEFAULT_WORKLOAD_NAME, False)
+    store = parse_trace(trace_files[0], benchout_path(trace_files[0])).to_event_store(DEFAULT_WORKLOAD_NAME)
+
+    assert store.remove_task(DEFAULT_WORKLOAD_NAME) == sum(DEFAULT_WORKLOAD_NAME in tasks for tasks in expected.values())
+    for tasks in expected.values():
+        tasks.pop(DEFAULT_WORKLOAD_NAME, None)
+    assert store.to_cpu_dict() == expected
+    assert store.remove_task(DEFAULT_WORKLOAD_NAME) == 0
+
+    # Zero every other event of one task, then drop the zero-length events of that task only
+    cpu, task, events = next((cpu, task, events) for cpu, task, events in store.items() if len(events) > 1)
+    events["duration"][::2] = 0
+    expected[cpu][task] = [(start, 0 if i % 2 == 0 else duration, priority)
+                           for i, (start, duration, priority) in enumerate(expected[cpu][task])]
+    store.remove_zero_durations([task])
+    expected[cpu][task] = [event for event in expected[cpu][task] if event[1] != 0]
+    assert store.to_cpu_dict() == expected
+    assert len(store) == sum(len(timings) for tasks in expected.values() for timings in tasks.values())
+    assert np.all(np.diff(store.offsets) >= 0)
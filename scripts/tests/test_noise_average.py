@@ -0,0 +1,102 @@
+import os
+import json
+import shutil
+import numpy as np
+import pytest
+from synthetic_traces import generate_traces, DEFAULT_WORKLOAD_NAME
+from trace_cache import parse_trace
+from trace_storage import benchout_path, file_stamp
+from noise_average import AveragePartial, trace_sums, save_partial, load_partial, open_partial, PARTIAL_FILENAME
+
+
+@pytest.fixture(scope="module")
+def traces(tmp_path_factory):
+    """
+    Synthetic traces as (path, workload duration, trace_sums) in trace order.
+    """
+    folder = str(tmp_path_factory.mktemp("traces"))
+    traces = []
+    for file in generate_traces(folder, cpus=4, event_rate=2000, duration=0.2, iterations=8, seed=5):
+        trace_file = os.path.join(folder, file)
+        trace = parse_trace(trace_file, benchout_path(trace_file))
+        traces.append((trace_file, trace.total_duration, trace_sums(trace.to_event_store(DEFAULT_WORKLOAD_NAME))))
+    return traces
+
+
+def partial_of(traces, stamp=False):
+    partial = AveragePartial(DEFAULT_WORKLOAD_NAME)
+    for trace_file, total_duration, sums in traces:
+        partial.add(trace_file, total_duration, sums, file_stamp(trace_file) if stamp else None)
+    return partial
+
+
+def round_trip(partial, folder):
+    save_partial(partial, folder)
+    return load_partial(folder)
+
+
+def test_single_pass_average(traces):
+    average = partial_of(traces).average()
+    for cpu, tasks in average.items():
+        for task, (frequency, duration) in tasks.items():
+            present = [(total_duration, sums[cpu][task]) for _, total_duration, sums in traces if task in sums.get(cpu, {})]
+            assert frequency == pytest.approx(sum(count / total_duration for total_duration, (count, _) in present) / len(traces))
+            assert duration == sum(task_duration for _, (_, task_duration) in present) // len(traces)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_split_and_merge_equals_single_pass(traces, tmp_path, seed):
+    single = partial_of(traces)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(traces))
+    splits = np.sort(rng.choice(np.arange(1, len(traces)), size=2, replace=False))
+
+    parts = []
+    for i, indices in enumerate(np.split(order, splits)):
+        folder = tmp_path / f"part{i}"
+        folder.mkdir()
+        parts.append(round_trip(partial_of([traces[j] for j in indices]), str(folder)))
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+
+    assert len(merged) == len(traces)
+    assert merged.traces.keys() == single.traces.keys()
+    assert merged.worst == single.worst
+    # Frequencies are summed exactly, so the merged average is exactly the single pass average
+    assert merged.average() == single.average()
+
+
+def test_json_round_trip(traces, tmp_path):
+    partial = partial_of(traces[:5], stamp=True)
+    partial.reject(traces[5][0], 12, file_stamp(traces[5][0]))
+    loaded = round_trip(partial, str(tmp_path))
+    assert loaded.to_json(str(tmp_path)) == json.loads(json.dumps(partial.to_json(str(tmp_path))))
+    assert loaded.average() == partial.average()
+    assert loaded.worst == partial.worst
+    assert loaded.was_rejected(traces[5][0], 0) and not loaded.was_rejected(traces[5][0], 12)
+    assert not loaded.was_rejected(traces[5][0])
+    assert os.path.isfile(tmp_path / PARTIAL_FILENAME)
+
+
+def test_merge_rejects_shared_traces_and_other_workloads(traces):
+    with pytest.raises(ValueError):
+        partial_of(traces[:3]).merge(partial_of(traces[2:4]))
+    with pytest.raises(ValueError):
+        partial_of(traces[:3]).merge(AveragePartial("other"))
+    with pytest.raises(ValueError):
+        partial_of(traces[:1] * 2)
+
+
+def test_open_partial_rebuilds_on_changed_trace(traces, tmp_path):
+    copies = []
+    for trace_file, total_duration, sums in traces[:3]:
+        copies.append((str(tmp_path / os.path.basename(trace_file)), total_duration, sums))
+        shutil.copy(trace_file, copies[-1][0])
+    save_partial(partial_of(copies, stamp=True), str(tmp_path))
+    assert len(open_partial(str(tmp_path), DEFAULT_WORKLOAD_NAME)) == 3
+    assert len(open_partial(str(tmp_path), "other")) == 0
+
+    with open(copies[1][0], "a") as f:
+        f.write("\n")
+    assert len(open_partial(str(tmp_path), DEFAULT_WORKLOAD_NAME)) == 0
@@ -0,0 +1,126 @@
+import sys
+import json
+import itertools
+import numpy as np
+import pytest
+import quantile_sketch
+from quantile_sketch import TDigest, sketch_path, save_sketch, load_sketch
+
+QUANTILES = (0.01, 0.1, 0.5, 0.9, 0.99, 0.999)
+DISTRIBUTIONS = {
+    "lognormal": lambda rng, size: rng.lognormal(0, 0.5, size),
+    "exponential": lambda rng, size: rng.exponential(1, size),
+    "bimodal": lambda rng, size: np.concatenate([rng.normal(10, 1, size // 2), rng.normal(20, 2, size - size // 2)]),
+}
+
+
+def sketch_of(values, one_by_one=False):
+    sketch = TDigest()
+    if one_by_one:
+        for value in values.tolist():
+            sketch.add(value)
+    else:
+        sketch.update(values)
+    return sketch
+
+
+def assert_quantiles_close(sketch, values, tolerance=0.05):
+    """
+    Checks the rank error of the estimated quantiles, which the scale function of the sketch bounds
+    in proportion to q * (1 - q), so the extreme quantiles are the most accurate.
+    """
+    sorted_values = np.sort(values)
+    for q in QUANTILES:
+        rank = np.searchsorted(sorted_values, sketch.quantile(q)) / len(values)
+        assert abs(rank - q) <= tolerance * q * (1 - q) + 1 / len(values), q
+
+
+@pytest.mark.parametrize("distribution", DISTRIBUTIONS)
+@pytest.mark.parametrize("one_by_one", [False, True])
+def test_accuracy(distribution, one_by_one):
+    values = DISTRIBUTIONS[distribution](np.random.default_rng(0), 100000)
+    sketch = sketch_of(values, one_by_one)
+    assert sketch.count == len(values)
+    assert len(sketch.means) <= sketch.compression
+    assert (sketch.min, sketch.max) == (values.min(), values.max())
+    assert sketch.quantile(0) == values.min() and sketch.quantile(1) == values.max()
+    assert_quantiles_close(sketch, values)
+
+
+def test_merge_order_invariance():
+    rng = np.random.default_rng(1)
+    parts = [rng.lognormal(rng.uniform(-1, 1), 0.5, 20000) for _ in range(4)]
+    values = np.concatenate(parts)
+    merged = []
+    for order in itertools.permutations(range(len(parts))):
+        sketch = TDigest()
+        for i in order:
+            sketch.merge(sketch_of(parts[i]))
+        merged.append(sketch)
+
+    for sketch in merged:
+        assert sketch.count == len(values)
+        assert (sketch.min, sketch.max) == (values.min(), values.max())
+        assert sketch.mean() == pytest.approx(np.mean(values), rel=1e-12)
+        assert sketch.std() == pytest.approx(np.std(values), rel=1e-12)
+        assert_quantiles_close(sketch, values)
+
+
+@pytest.mark.parametrize("how", ["update", "add", "merge"])
+def test_std_without_cancellation(how):
+    # Durations of 100 s that vary by 10 µs, where the sum of squares loses every significant digit
+    values = 100 + np.random.default_rng(2).normal(0, 1e-5, 10000)
+    if how == "merge":
+        sketch = sketch_of(values[:3000]).merge(sketch_of(values[3000:], one_by_one=True))
+    else:
+        sketch = sketch_of(values, one_by_one=how == "add")
+    assert sketch.mean() == pytest.approx(np.mean(values), rel=1e-14)
+    assert sketch.std() == pytest.approx(np.std(values), rel=1e-6)
+
+
+def test_empty_and_single_value():
+    empty = TDigest()
+    empty.update([])
+    assert len(empty) == 0
+    assert np.isnan(empty.quantile(0.5)) and np.isnan(empty.mean()) and np.isnan(empty.std())
+    single = TDigest()
+    single.add(3.0)
+    assert [single.quantile(q) for q in (0, 0.3, 1)] == [3.0, 3.0, 3.0]
+    assert single.std() == 0
+
+
+def test_json_round_trip(tmp_path):
+    sketch = sketch_of(np.random.default_rng(3).exponential(1, 10000))
+    sketch.add(50.0)  # Left in the buffer until the sketch is saved
+    path = sketch_path(str(tmp_path), "nbody-omp", "durations")
+    save_sketch(sketch, path)
+    loaded = load_sketch(path)
+    assert loaded.to_json() == sketch.to_json()
+    for q in QUANTILES:
+        assert loaded.quantile(q) == sketch.quantile(q)
+    assert (loaded.count, loaded.mean(), loaded.std(), loaded.max) == (sketch.count, sketch.mean(), sketch.std(), 50.0)
+
+    data = json.loads(json.dumps(sketch.to_json()))
+    data["version"] = 1
+    with pytest.raises(ValueError):
+        TDigest.from_json(data)
+
+
+def test_main_reports_every_kind_separately(tmp_path, monkeypatch, capsys):
+    rng = np.random.default_rng(4)
+    save_sketch(sketch_of(rng.normal(0.05, 0.001, 1000)), sketch_path(str(tmp_path), "nbody-omp", "durations"))
+    save_sketch(sketch_of(rng.lognormal(3, 1, 5000)), sketch_path(str(tmp_path), "nbody-omp-1-sys", "noise"))
+
+    monkeypatch.setattr(sys, "argv", ["quantile_sketch.py", str(tmp_path)])
+    quantile_sketch.main()
+    output = capsys.readouterr().out
+    assert "Merged 1 durations sketches of 1000 values (s)" in output
+    assert "Merged 1 noise sketches of 5000 values (µs)" in output
+
+    monkeypatch.setattr(sys, "argv", ["quantile_sketch.py", str(tmp_path), "-o", str(tmp_path / "merged.json")])
+    with pytest.raises(SystemExit):
+        quantile_sketch.main()
+    output_path = tmp_path / "merged.json"
+    monkeypatch.setattr(sys, "argv", ["quantile_sketch.py", str(tmp_path), "--kind", "noise", "-o", str(output_path)])
+    quantile_sketch.main()
+    assert load_sketch(str(output_path)).count == 5000
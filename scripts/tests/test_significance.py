@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import significance
+from significance import STATISTICS, observed_statistics, bootstrap_statistics, bootstrap_samples, rank_test, \
+    compare_samples, check_budget
+
+
+@pytest.fixture
+def durations():
+    return np.random.default_rng(0).lognormal(np.log(0.05), 0.02, size=200)
+
+
+def test_observed_statistics_match_numpy(durations):
+    observed = observed_statistics(durations)
+    expected = [np.mean(durations) if q is None else np.quantile(durations, q) for q in STATISTICS.values()]
+    assert observed == pytest.approx(expected, rel=1e-12)
+
+
+def test_bootstrap_statistics_do_not_depend_on_chunks(durations, monkeypatch):
+    whole = bootstrap_statistics(durations, 300, np.random.default_rng(1))
+    monkeypatch.setattr(significance, "CHUNK_ELEMENTS", len(durations) * 7)
+    chunked = bootstrap_statistics(durations, 300, np.random.default_rng(1))
+    assert np.array_equal(whole, chunked)
+    assert whole.shape == (300, len(STATISTICS))
+
+
+def test_rank_test_identical_samples(durations):
+    assert rank_test(durations, durations) == (1.0, 0.5)
+    assert rank_test([1.0] * 10, [1.0] * 10) == (1.0, 0.5)
+
+
+def test_rank_test_shifted_samples(durations):
+    p_value, slower = rank_test(durations, durations * 1.05)
+    assert p_value < 1e-6 and slower > 0.9
+    p_value, slower = rank_test(durations * 1.05, durations)
+    assert p_value < 1e-6 and slower < 0.1
+    assert rank_test([1, 2, 3], [4, 5, 6])[1] == 1.0
+
+
+@pytest.mark.parametrize("shift", [1.0, 1.001, 1.05])
+def test_rank_test_matches_scipy(durations, shift):
+    stats = pytest.importorskip("scipy.stats")
+    # Rounded, so the samples share tied durations
+    base = np.round(durations[:80], 3)
+    new = np.round(durations[80:] * shift, 3)
+    expected = stats.mannwhitneyu(new, base, alternative="two-sided", method="asymptotic", use_continuity=True)
+    p_value, slower = rank_test(base, new)
+    assert p_value == pytest.approx(expected.pvalue, rel=1e-9)
+    assert slower == pytest.approx(expected.statistic / (len(base) * len(new)))
+
+
+def test_identical_samples_are_not_significant(durations):
+    base_bootstrap, new_bootstrap = bootstrap_samples([durations, durations], 500)
+    comparison = compare_samples(durations, durations, base_bootstrap, new_bootstrap)
+    for statistic in STATISTICS:
+        assert comparison[statistic]["difference"] == 0
+        assert comparison[statistic]["low"] <= 0 <= comparison[statistic]["high"]
+        assert not comparison[statistic]["significant"]
+    assert not comparison["rank_test"]["significant"]
+    for metric in ("mean", "p99", "normalized_p99"):
+        assert check_budget(base_bootstrap, new_bootstrap, metric, 3)["verdict"] == "pass"
+
+
+def test_shifted_sample_is_significant(durations):
+    new = durations * 1.1
+    base_bootstrap, new_bootstrap = bootstrap_samples([durations, new], 500)
+    comparison = compare_samples(durations, new, base_bootstrap, new_bootstrap)
+    for statistic in ("mean", "median", "p90"):
+        assert comparison[statistic]["significant"]
+        assert 0 < comparison[statistic]["low"] <= comparison[statistic]["difference"] <= comparison[statistic]["high"]
+        assert comparison[statistic]["relative_low"] <= 10 <= comparison[statistic]["relative_high"]
+    assert comparison["rank_test"]["significant"] and comparison["rank_test"]["slower"] > 0.9
+
+    mean = check_budget(base_bootstrap, new_bootstrap, "mean", 3)
+    assert mean["verdict"] == "fail" and 3 < mean["low_pct"] <= 10 <= mean["high_pct"]
+    assert check_budget(base_bootstrap, new_bootstrap, "mean", 20)["verdict"] == "pass"
+    # Scaling every duration leaves the shape of the distribution, and so the normalized tail, unchanged
+    assert check_budget(base_bootstrap, new_bootstrap, "normalized_p99", 3)["verdict"] == "pass"
+
+
+def test_bootstrap_interval_coverage():
+    # Pairs of runs from one distribution, where a 90% interval of the mean difference should miss zero about 10% of the time
+    rng = np.random.default_rng(2)
+    misses = 0
+    for _ in range(100):
+        base, new = rng.lognormal(np.log(0.05), 0.1, size=(2, 50))
+        comparison = compare_samples(base, new, *bootstrap_samples([base, new], 300, seed=int(rng.integers(1 << 31))), 0.9)
+        misses += comparison["mean"]["significant"]
+    assert 2 <= misses <= 25
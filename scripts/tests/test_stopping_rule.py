@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import math
+import subprocess
+import numpy as np
+import pytest
+from synthetic_traces import write_benchout
+from stopping_rule import quantile_interval, decide, EXIT_STOP, EXIT_CONTINUE
+
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def binomial_coverage(n, q, low_rank, high_rank):
+    """
+    Probability that the true q-quantile lies between the order statistics of the two ranks, i.e. that
+    at least low_rank and fewer than high_rank of n durations fall below it.
+    """
+    return sum(math.comb(n, below) * q ** below * (1 - q) ** (n - below) for below in range(low_rank, high_rank))
+
+
+def test_interval_ranks():
+    durations = list(range(1, 101))
+    # 1.96 * sqrt(100 * 0.5 * 0.5) = 9.8 ranks on either side of rank 50, rounded outwards
+    assert quantile_interval(durations, 0.5, 0.95) == (50.5, 40, 60)
+    assert quantile_interval(durations, 0.9, 0.95) == (pytest.approx(90.1), 84, 96)
+    # The upper rank of the p99 interval would be past the largest duration
+    assert quantile_interval(durations, 0.99, 0.95) == (pytest.approx(99.01), None, None)
+    assert quantile_interval([5.0], 0.5, 0.95) == (5.0, None, None)
+
+
+@pytest.mark.parametrize("n", [50, 100, 200, 1000])
+@pytest.mark.parametrize("q", [0.5, 0.9, 0.99])
+def test_interval_coverage(n, q):
+    estimate, low, high = quantile_interval(list(range(1, n + 1)), q, 0.95)
+    assert estimate == pytest.approx(np.quantile(np.arange(1, n + 1), q))
+    if low is not None:
+        assert binomial_coverage(n, q, low, high) >= 0.95
+
+
+def converging_run(iterations, seed=0):
+    return list(np.random.default_rng(seed).normal(1.0, 0.001, iterations))
+
+
+def test_continue_before_min_iterations():
+    result = decide(converging_run(50), 50, 0, (0.5, 0.9), 1.0, 0.95, 100, None, 5)
+    assert result["decision"] == "continue" and result["reason"] == "minimum iterations not reached"
+    # The streak is still counted, so a run that converged early stops once it reaches min_iterations
+    assert result["streak"] == 1
+
+
+def test_stop_after_stable_streak():
+    durations = converging_run(200)
+    streak = 0
+    decisions = []
+    for n in range(100, 104):
+        result = decide(durations[:n], n, streak, (0.5, 0.9), 1.0, 0.95, 100, None, 3)
+        streak = result["streak"]
+        decisions.append((result["decision"], streak))
+    assert decisions == [("continue", 1), ("continue", 2), ("stop", 3), ("stop", 4)]
+    assert all(interval["half_width_pct"] <= 1.0 for interval in result["quantiles"].values())
+
+
+def test_wide_interval_resets_streak():
+    durations = converging_run(200)
+    durations[::2] = [duration * 1.5 for duration in durations[::2]]
+    result = decide(durations, 200, 4, (0.5, 0.9), 1.0, 0.95, 100, None, 5)
+    assert (result["decision"], result["streak"]) == ("continue", 0)
+    assert result["reason"] == "intervals wider than 1%"
+
+
+def test_tail_quantile_without_interval_never_converges():
+    result = decide(converging_run(100), 100, 10, (0.5, 0.99), 1.0, 0.95, 100, None, 5)
+    assert result["quantiles"]["p99"]["low"] is None and result["quantiles"]["p99"]["half_width_pct"] is None
+    assert (result["decision"], result["streak"]) == ("continue", 0)
+
+
+def test_max_iterations_stops_regardless():
+    # Iterations without a duration count towards the maximum, but not towards the minimum
+    result = decide([], 10, 0, (0.5,), 1.0, 0.95, 100, 10, 5)
+    assert (result["decision"], result["reason"]) == ("stop", "maximum iterations reached")
+    assert result["quantiles"] == dict() and result["streak"] == 0
+    assert decide(converging_run(5), 9, 0, (0.5,), 1.0, 0.95, 100, 10, 5)["decision"] == "continue"
+
+
+def test_main_logs_every_iteration(tmp_path):
+    log = str(tmp_path / "nbody-omp.stopping.jsonl")
+    durations = converging_run(100, seed=1)
+    codes = []
+    start = 1000 * 1000000000
+    for iteration, duration in enumerate(durations, 1):
+        benchout = str(tmp_path / f"nbody-omp-{iteration}-synthetic.benchout")
+        write_benchout(benchout, start, start + int(duration * 1e9))
+        start += 2 * 1000000000
+        codes.append(subprocess.run([sys.executable, os.path.join(SCRIPTS, "stopping_rule.py"), benchout, log,
+                                     "--min_iterations", "20", "--stable", "3", "--quantiles", "0.5"],
+                                    capture_output=True, cwd=SCRIPTS).returncode)
+        if codes[-1] == EXIT_STOP:
+            break
+
+    with open(log, "r") as f:
+        entries = [json.loads(line) for line in f]
+    assert codes == [EXIT_CONTINUE] * (len(codes) - 1) + [EXIT_STOP]
+    assert [entry["iteration"] for entry in entries] == list(range(1, len(codes) + 1))
+    assert len(codes) >= 20 and entries[-1]["streak"] >= 3
+    assert entries[0]["duration"] == pytest.approx(durations[0], abs=1e-9)
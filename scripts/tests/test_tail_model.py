@@ -0,0 +1,115 @@
+import math
+import numpy as np
+import pytest
+from tail_model import MODELS, MIN_FIT_SAMPLES, quantile_name, fit_model, model_quantile, model_cdf, estimate_tail, \
+    iterations_needed, tail_statistics
+
+# Location, scale and shape k (k = -xi) of the known distributions, both with a heavy tail
+GEV_PARAMS = (0.05, 0.002, -0.1)
+GPD_PARAMS = (0.0, 0.001, -0.2)
+
+
+def sample_of(model, params, size, seed):
+    return np.sort(model_quantile(model, tuple(np.float64(param) for param in params),
+                                  np.random.default_rng(seed).random(size)))
+
+
+def test_quantile_name():
+    assert [quantile_name(q) for q in (0.9, 0.99, 0.999, 0.9999)] == ["p90", "p99", "p99.9", "p99.99"]
+
+
+@pytest.mark.parametrize("model, params", [("gev", GEV_PARAMS), ("gpd", GPD_PARAMS), ("gev", (0.05, 0.002, 0.2)),
+                                           ("gumbel", (0.05, 0.002, 0.0))])
+def test_cdf_inverts_quantile(model, params):
+    f = np.linspace(0.001, 0.999, 50)
+    x = model_quantile(model, tuple(np.float64(param) for param in params), f)
+    assert np.all(np.diff(x) > 0)
+    assert model_cdf(model, tuple(np.array([param]) for param in params), x)[0] == pytest.approx(f, abs=1e-9)
+
+
+def test_distributions_match_scipy():
+    stats = pytest.importorskip("scipy.stats")
+    x = np.linspace(0.045, 0.08, 20)
+    loc, scale, k = GEV_PARAMS
+    # scipy uses the same sign for the GEV shape and the opposite sign, xi, for the GPD
+    expected = stats.genextreme.cdf(x, k, loc, scale)
+    assert model_cdf("gev", (np.array([loc]), np.array([scale]), np.array([k])), x)[0] == pytest.approx(expected, abs=1e-12)
+    loc, scale, k = GPD_PARAMS
+    expected = stats.genpareto.ppf([0.5, 0.9, 0.999], -k, loc, scale)
+    assert model_quantile("gpd", (np.float64(loc), np.float64(scale), np.float64(k)), np.array([0.5, 0.9, 0.999])) == \
+        pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("model, params", [("gev", GEV_PARAMS), ("gpd", GPD_PARAMS)])
+def test_fit_recovers_parameters(model, params):
+    fitted = fit_model(model, sample_of(model, params, 20000, seed=0))
+    loc, scale, k = (float(param) for param in fitted)
+    assert loc == pytest.approx(params[0], abs=0.02 * params[1])
+    assert scale == pytest.approx(params[1], rel=0.03)
+    assert k == pytest.approx(params[2], abs=0.03)
+
+
+def test_fit_rows_independently():
+    rows = np.stack([sample_of("gev", GEV_PARAMS, 500, seed) for seed in range(3)])
+    fitted = fit_model("gev", rows)
+    for i, row in enumerate(rows):
+        assert [float(param[i]) for param in fitted] == pytest.approx([float(param) for param in fit_model("gev", row)])
+
+
+def test_block_maxima_estimates_of_gumbel_iterations():
+    # Iterations following a Gumbel distribution have Gumbel block maxima, the limit the block maxima models assume
+    loc, scale = 0.05, 0.001
+    durations = np.random.default_rng(1).gumbel(loc, scale, 10000)
+    for model in ("gumbel", "gev"):
+        estimate = estimate_tail(durations, model, quantiles=(0.999,), resamples=300, gof_resamples=100,
+                                 rng=np.random.default_rng(2))
+        expected = loc - scale * math.log(-math.log(0.999))
+        assert estimate["samples"] == 1000
+        assert estimate["p99.9_low"] <= expected <= estimate["p99.9_high"]
+        assert estimate["p99.9"] == pytest.approx(expected, rel=0.01)
+        assert abs(estimate["shape"]) < 0.1
+        assert estimate["ks_p_value"] > 0.01
+
+
+def test_peaks_over_threshold_estimates_of_gpd_iterations():
+    # Iterations above their 90% quantile follow the GPD, so the estimate only has to extrapolate the fitted tail
+    loc, scale, k = GPD_PARAMS
+    durations = 0.05 + model_quantile("gpd", (np.float64(loc), np.float64(scale), np.float64(k)),
+                                      np.random.default_rng(0).random(20000))
+    estimate = estimate_tail(durations, "gpd", quantiles=(0.999, 0.9999), resamples=300, gof_resamples=100,
+                             rng=np.random.default_rng(4))
+    assert estimate["samples"] == 2000
+    assert estimate["threshold"] == pytest.approx(np.quantile(durations, 0.9), rel=1e-3)
+    assert estimate["shape"] == pytest.approx(-k, abs=0.1)
+    for q in (0.999, 0.9999):
+        expected = 0.05 + float(model_quantile("gpd", (np.float64(loc), np.float64(scale), np.float64(k)), np.float64(q)))
+        name = quantile_name(q)
+        assert estimate[f"{name}_low"] <= expected <= estimate[f"{name}_high"]
+        assert estimate[name] == pytest.approx(expected, rel=0.02)
+    assert estimate["ks_p_value"] > 0.01
+
+
+def test_too_few_iterations():
+    durations = np.random.default_rng(5).gumbel(0.05, 0.001, 10 * MIN_FIT_SAMPLES - 1)
+    assert estimate_tail(durations, "gev") is None
+    assert estimate_tail(durations, "gpd") is None
+    assert tail_statistics(durations[:50]) == dict()
+
+
+def test_iterations_needed_stops_at_target():
+    durations = np.random.default_rng(6).gumbel(0.05, 0.001, 3000)
+    iterations, widths = iterations_needed(durations, "gumbel", target_width=1.0, step=500, resamples=200,
+                                           rng=np.random.default_rng(7))
+    assert list(widths)[0] == 500
+    assert iterations == list(widths)[-1] and widths[iterations] <= 1.0
+    assert all(width > 1.0 for n, width in widths.items() if n < iterations)
+    assert iterations_needed(durations, "gumbel", target_width=0.01, step=500, resamples=200)[0] is None
+
+
+def test_tail_statistics_sections():
+    durations = np.random.default_rng(8).gumbel(0.05, 0.001, 2000)
+    statistics = tail_statistics(durations, resamples=100)
+    estimates = statistics["Tail Estimates (seconds)"]
+    for label in MODELS.values():
+        assert estimates[f"{label} p99.9 95% CI low"] <= estimates[f"{label} p99.9"] <= estimates[f"{label} p99.9 95% CI high"]
+    assert set(statistics["Iterations Needed for p99.9 within 2%"]) == set(MODELS.values())
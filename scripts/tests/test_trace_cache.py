@@ -0,0 +1,217 @@
+import os
+import re
+from functools import partial
+import numpy as np
+import pytest
+import trace_cache
+from synthetic_traces import generate_traces, DEFAULT_WORKLOAD_NAME
+from trace_cache import parse_trace, parse_trace_window, WINDOW_MARGIN, COLUMNS, CACHE_VERSION, cache_path, \
+    read_cache_header, load_trace, share_trace, open_shared_trace
+from trace_storage import benchout_path
+from traces_to_noise_config import TraceWorkers, get_trace_summary
+
+LINE_RE = re.compile(r"^(.*\] \S+ +)(\d+\.\d+)(: (\w+):.* start (\d+)\.(\d+) duration (\d+) ns)$")
+
+
+def delay_thread_noise(trace_file, fraction, delay, seed):
+    """
+    Rewrites a synthetic trace as if a fraction of the thread noise had been preempted by delay (ns) of
+    interference, so it is written that long after its noise ends and out of order with the other lines.
+    """
+    rng = np.random.default_rng(seed)
+    with open(trace_file, "r") as f:
+        lines = f.readlines()
+    header = [line for line in lines if line.startswith("#")]
+    written = []
+    for line in lines[len(header):]:
+        match = LINE_RE.match(line.rstrip("\n"))
+        end = int(match[5] + match[6]) + int(match[7])
+        if match[4] == "thread_noise" and rng.random() < fraction:
+            end += delay
+        written.append((end, f"{match[1]}{end // 1000 / 1e6:.6f}{match[3]}\n"))
+    written.sort(key=lambda line: line[0])
+    with open(trace_file, "w") as f:
+        f.writelines(header + [line for _, line in written])
+
+
+def assert_same_events(trace_file):
+    benchout_file = benchout_path(trace_file)
+    full = parse_trace(trace_file, benchout_file)
+    window = parse_trace_window(trace_file, benchout_file, DEFAULT_WORKLOAD_NAME)
+    assert window.window == DEFAULT_WORKLOAD_NAME
+    assert window.task_names == full.task_names
+    for combine_threads in (False, True):
+        assert window.to_cpu_dict(DEFAULT_WORKLOAD_NAME, combine_threads) == \
+            full.to_cpu_dict(DEFAULT_WORKLOAD_NAME, combine_threads)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_window_matches_full_parse(tmp_path, seed):
+    for file in generate_traces(str(tmp_path), cpus=4, event_rate=3000, duration=0.2, iterations=2, seed=seed):
+        assert_same_events(os.path.join(tmp_path, file))
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("delay", [WINDOW_MARGIN // 2, 3 * WINDOW_MARGIN, 100 * WINDOW_MARGIN])
+def test_window_with_long_interference(tmp_path, seed, delay):
+    task_mix = {"irq_noise": 1, "softirq_noise": 1, "thread_noise": 4, "nmi_noise": 0}
+    for file in generate_traces(str(tmp_path), cpus=4, event_rate=3000, duration=0.2, iterations=2,
+                                task_mix=task_mix, seed=seed):
+        trace_file = os.path.join(tmp_path, file)
+        delay_thread_noise(trace_file, 0.2, delay, seed)
+        assert_same_events(trace_file)
+
+
+def assert_same_trace(trace, expected):
+    assert len(trace) == len(expected)
+    for name, _ in COLUMNS:
+        assert np.array_equal(getattr(trace, name), getattr(expected, name)), name
+    assert (trace.task_names, trace.task_first_start, trace.total_duration, trace.window, trace.lost_events) == \
+        (expected.task_names, expected.task_first_start, expected.total_duration, expected.window, expected.lost_events)
+    assert np.array_equal(trace.pair_cpu, expected.pair_cpu) and np.array_equal(trace.pair_task, expected.pair_task)
+
+
+def rewrite_same_size(path, pattern, replace):
+    """
+    Changes the first match of pattern in a file without changing its size, so only the content hash tells the versions apart.
+    """
+    with open(path, "r") as f:
+        text = f.read()
+    changed = re.sub(pattern, replace, text, count=1)
+    assert changed != text and len(changed) == len(text)
+    with open(path, "w") as f:
+        f.write(changed)
+
+
+@pytest.fixture
+def cached_trace(tmp_path, monkeypatch):
+    """
+    A synthetic trace file and a list recording every trace load_trace had to parse.
+    """
+    file, = generate_traces(str(tmp_path), cpus=4, event_rate=3000, duration=0.2, iterations=1, seed=0)
+    parsed = []
+    def parse_and_record(trace_file, benchout_file):
+        parsed.append(trace_file)
+        return parse_trace(trace_file, benchout_file)
+    monkeypatch.setattr(trace_cache, "parse_trace", parse_and_record)
+    return file, str(tmp_path), parsed
+
+
+def test_cache_round_trip(cached_trace):
+    file, folder, parsed = cached_trace
+    trace_file = os.path.join(folder, file)
+    first = load_trace(file, folder)
+    assert parsed == [trace_file] and first.source == cache_path(trace_file)
+    header = read_cache_header(cache_path(trace_file))
+    assert header["version"] == CACHE_VERSION and header["events"] == len(first)
+    assert all(column["offset"] % trace_cache.CACHE_ALIGNMENT == 0 for column in header["columns"])
+
+    cached = load_trace(file, folder)
+    assert len(parsed) == 1
+    assert isinstance(cached.start, np.memmap)
+    assert_same_trace(cached, first)
+    assert cached.to_cpu_dict(DEFAULT_WORKLOAD_NAME, True) == first.to_cpu_dict(DEFAULT_WORKLOAD_NAME, True)
+
+    # Disabling the cache neither reads nor rewrites it
+    assert load_trace(file, folder, use_cache=False).source is None
+    assert len(parsed) == 2
+
+
+def test_cache_survives_touch(cached_trace):
+    file, folder, parsed = cached_trace
+    trace_file = os.path.join(folder, file)
+    load_trace(file, folder)
+    stat = os.stat(trace_file)
+    os.utime(trace_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    load_trace(file, folder)
+    assert len(parsed) == 1
+    # The matching content hash refreshed the stored modification time
+    assert read_cache_header(cache_path(trace_file))["key"]["trace"]["mtime_ns"] == os.stat(trace_file).st_mtime_ns
+
+
+@pytest.mark.parametrize("changed", ["trace", "benchout"])
+def test_cache_invalidated_on_changed_stamp(cached_trace, changed):
+    file, folder, parsed = cached_trace
+    trace_file = os.path.join(folder, file)
+    load_trace(file, folder)
+    if changed == "trace":
+        rewrite_same_size(trace_file, r"duration (\d)", lambda match: f"duration {(int(match[1]) + 1) % 10}")
+    else:
+        rewrite_same_size(benchout_path(trace_file), r"End time: (\d+)\.(\d)",
+                          lambda match: f"End time: {match[1]}.{(int(match[2]) + 1) % 10}")
+
+    trace = load_trace(file, folder)
+    assert len(parsed) == 2
+    assert_same_trace(trace, parse_trace(trace_file, benchout_path(trace_file)))
+    # The rewritten cache holds the new version
+    assert_same_trace(load_trace(file, folder), trace)
+    assert len(parsed) == 2
+
+
+def test_windowed_cache(cached_trace):
+    file, folder, parsed = cached_trace
+    trace_file = os.path.join(folder, file)
+    window = load_trace(file, folder, workload_name=DEFAULT_WORKLOAD_NAME)
+    assert parsed == [] and window.window == DEFAULT_WORKLOAD_NAME
+    assert_same_trace(load_trace(file, folder, workload_name=DEFAULT_WORKLOAD_NAME), window)
+    # A windowed cache is only used for its own workload, a full cache for any workload
+    load_trace(file, folder)
+    assert len(parsed) == 1
+    assert load_trace(file, folder, workload_name=DEFAULT_WORKLOAD_NAME).window is None
+    assert len(parsed) == 1
+
+
+def test_invalid_cache_header(cached_trace):
+    file, folder, _ = cached_trace
+    path = cache_path(os.path.join(folder, file))
+    load_trace(file, folder)
+    with open(path, "r+b") as f:
+        data = f.read()
+    stale = data.replace(f'"version": {CACHE_VERSION}'.encode(), f'"version": {CACHE_VERSION - 1}'.encode(), 1)
+    assert stale != data
+    for contents in (stale, b"not a trace cache", data[:len(trace_cache.CACHE_MAGIC) + 12]):
+        with open(path, "wb") as f:
+            f.write(contents)
+        assert read_cache_header(path) is None
+        with pytest.raises(ValueError):
+            open_shared_trace(path)
+    assert load_trace(file, folder).source == path
+    assert read_cache_header(path) is not None
+
+
+def test_share_trace(tmp_path, cached_trace):
+    file, folder, _ = cached_trace
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    cached = load_trace(file, folder)
+    assert share_trace(cached, str(scratch)) == cached.source
+    assert os.listdir(scratch) == []
+
+    uncached = load_trace(file, folder, use_cache=False)
+    path = share_trace(uncached, str(scratch))
+    assert os.path.dirname(path) == str(scratch)
+    shared = open_shared_trace(path)
+    assert_same_trace(shared, uncached)
+    assert shared.to_cpu_dict(DEFAULT_WORKLOAD_NAME, False) == uncached.to_cpu_dict(DEFAULT_WORKLOAD_NAME, False)
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_trace_workers_receive(tmp_path, use_cache):
+    files = generate_traces(str(tmp_path), cpus=4, event_rate=3000, duration=0.2, iterations=4, seed=1)
+    with TraceWorkers(2) as workers:
+        summaries = workers.pool.map(partial(get_trace_summary, trace_path=str(tmp_path), workload_name=DEFAULT_WORKLOAD_NAME,
+                                             use_cache=use_cache), files)
+        shared = [(file, shared_trace) for file, _, _, shared_trace, _ in summaries if shared_trace is not None]
+        assert shared
+        for i, (file, shared_trace) in enumerate(shared):
+            trace_file = os.path.join(tmp_path, file)
+            assert (os.path.dirname(shared_trace) == workers.scratch.name) != use_cache
+            trace = workers.receive(shared_trace, keep=i == 0)
+            # Scratch files are removed once received, cache files are kept
+            assert os.path.exists(shared_trace) == use_cache
+            if i == 0:
+                assert_same_trace(trace, parse_trace_window(trace_file, benchout_path(trace_file), DEFAULT_WORKLOAD_NAME))
+            else:
+                assert trace is None
+        scratch = workers.scratch.name
+    assert not os.path.exists(scratch)
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import threading
+import pytest
+import trace_capture
+from trace_storage import open_trace
+
+LINES = [
+    b"# tracer: osnoise\n",
+    b"  nbody-1234  [002] d.h..  100.000010: irq_noise: local_timer:236 start 100.000005 duration 5012 ns\n",
+    b"CPU:2 [LOST 17 EVENTS]\n",
+    b"  nbody-1234  [003] d.h..  100.000020: irq_noise: local_timer:236 start 100.000015 duration 4021 ns\n",
+    b"CPU:1 [LOST EVENTS]\n",
+    b"  nbody-1235  [001] .....  100.000030: thread_noise: kworker/1:1:87 start 100.000025 duration 3000 ns\n",
+]
+
+
+def make_tracefs(tmp_path):
+    tracefs = tmp_path / "tracing"
+    tracefs.mkdir()
+    os.mkfifo(tracefs / "trace_pipe")
+    (tracefs / "current_tracer").write_text("osnoise\n")
+    (tracefs / "trace_clock").write_text("[local] global\n")
+    return str(tracefs)
+
+
+def run_capture(tracefs, output, writes):
+    """
+    Runs a capture in a thread while the writes are written to the trace_pipe FIFO, then stops it.
+    """
+    result = dict()
+    thread = threading.Thread(target=lambda: result.update(trace_capture.capture(tracefs, output)))
+    thread.start()
+    # Opening the FIFO for writing blocks until the capture opened it for reading
+    with open(os.path.join(tracefs, "trace_pipe"), "wb", buffering=0) as pipe:
+        for data in writes:
+            pipe.write(data)
+            # Give the capture time to read every write separately
+            time.sleep(0.05)
+    trace_capture.stop_requested = True
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    return result
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz", ".zst"])
+def test_capture_round_trip(tmp_path, monkeypatch, suffix):
+    monkeypatch.setattr(trace_capture, "stop_requested", False)
+    tracefs = make_tracefs(tmp_path)
+    output = str(tmp_path / f"nbody-omp-1-sys.trace{suffix}")
+
+    data = b"".join(LINES) * 20
+    marker = data.index(b"[LOST 17 EVENTS]") + 6
+    # The first marker is split across two writes
+    writes = [data[:marker], data[marker:]]
+    summary = run_capture(tracefs, output, writes)
+
+    with open_trace(output, "rb") as f:
+        assert f.read() == data
+    with open(output + trace_capture.CAPTURE_SUFFIX, "r") as f:
+        written = json.load(f)
+    assert written == summary
+    assert summary["bytes"] == len(data)
+    assert summary["compression"] == (suffix or None)
+    assert summary["lost_event_markers"] == 40
+    assert summary["lost_events"] == 20 * (17 + trace_capture.UNKNOWN_LOST_EVENTS)
+    assert summary["settings"]["current_tracer"] == "osnoise"
+    assert summary["settings"]["buffer_size_kb"] is None
+
+
+def test_lost_event_counter_split_marker():
+    counter = trace_capture.LostEventCounter()
+    for data in (b"a\nCPU:0 [LO", b"ST 5 EV", b"ENTS]\nb\nCPU:1 [LOST EVENTS]"):
+        counter.feed(data)
+    counter.close()
+    assert counter.markers == 2
+    assert counter.events == 5 + trace_capture.UNKNOWN_LOST_EVENTS
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz", ".zst"])
+def test_chunk_writer_frames(tmp_path, monkeypatch, suffix):
+    # Small chunks, so compressed traces are written as several frames or members
+    monkeypatch.setattr(trace_capture, "CHUNK_SIZE", 128)
+    output = str(tmp_path / f"nbody-omp-1-sys.trace{suffix}")
+    writer = trace_capture.ChunkWriter(output)
+    for line in LINES * 10:
+        writer.write(line)
+    writer.close()
+
+    assert writer.chunks > 1
+    assert writer.bytes_in == len(b"".join(LINES)) * 10
+    with open_trace(output, "rb") as f:
+        assert f.read() == b"".join(LINES) * 10
@@ -0,0 +1,599 @@
+import os
+import sys
+import re
+import json
+import tempfile
+import argparse
+import itertools
+import numpy as np
+from operator import itemgetter
+from event_store import EventStore
+from benchout_reader import read_total_duration
+from trace_storage import open_trace, map_trace, benchout_path, list_trace_files, LOST_EVENTS_RE, UNKNOWN_LOST_EVENTS, \
+    file_stamp, stamp_matches, refresh_stamp
+
+# Constants
+CACHE_SUFFIX = ".tracecache"
+CACHE_MAGIC = b"PVTRACE\x01"
+CACHE_VERSION = 4  # Windowed caches before version 4 may miss thread noise written late
+CACHE_ALIGNMENT = 64
+WINDOW_MARGIN = 10000000  # Time (ns) lines are parsed before the workload window
+
+# Column layout of the cache file, one array per column in file order
+COLUMNS = (
+    ("cpu", np.uint16),
+    ("task", np.uint32),
+    ("start", np.int64),
+    ("duration", np.int64),
+    ("priority", np.int8),
+)
+
+# Define Regex for matching traces
+TRACE_RE = re.compile(
+    r"\[(\d{3})\]"                      # Capture CPU ID (three digits inside square brackets)
+    r".*?:\s(.*noise):\s*"              # Lazily match everything up to 'noise:'
+    r"([^:]*[\/\w\-:]*|)"               # Capture the task name
+    r"\s+start\s+"                      # Match 'start' keyword with spaces
+    r"(\d+\.\d+)"                       # Capture the start time (floating-point number)
+    r"\s+duration\s+"                   # Match 'duration' keyword with spaces
+    r"(\d+)\s+ns"                       # Capture the duration (integer followed by 'ns')
+)
+
+# Bytes version of the trace regex for memory-mapped traces. Whitespace never crosses a line, the start
+# time is captured as seconds and fraction and the rest of the line is consumed, so findall over a whole
+# file finds the same single event per line as searching line by line
+TRACE_BYTES_RE = re.compile(
+    rb"\[(\d{3})\]"
+    rb"[^\n]*?:[^\S\n]([^\n]*noise):[^\S\n]*"
+    rb"([^:\n]*[\/\w\-:]*|)"
+    rb"[^\S\n]+start[^\S\n]+"
+    rb"(\d+)\.(\d+)"
+    rb"[^\S\n]+duration[^\S\n]+"
+    rb"(\d+)[^\S\n]+ns[^\n]*"
+)
+
+# Cheaper variant without the noise type, for the lines before the workload window, which are only
+# needed for their (cpu, task) pairs and to check that none of them ends inside the window
+PAIR_BYTES_RE = re.compile(
+    rb"\[(\d{3})\]"
+    rb"[^\n]*?:[^\S\n][^\n]*noise:[^\S\n]*"
+    rb"([^:\n]*[\/\w\-:]*|)"
+    rb"[^\S\n]+start[^\S\n]+"
+    rb"(\d+)\.(\d+)"
+    rb"[^\S\n]+duration[^\S\n]+"
+    rb"(\d+)[^\S\n]+ns[^\n]*"
+)
+
+# Header line of the trace file, the difference is the number of events overwritten in the ring buffer
+ENTRIES_RE = re.compile(rb"^# entries-in-buffer/entries-written: (\d+)/(\d+)", re.MULTILINE)
+HEADER_SIZE = 4096
+
+# Bytes the str regex treats differently from the bytes regex, or that end lines in text mode
+UNSUPPORTED_BYTES = (b"\r", b"\x1c", b"\x1d", b"\x1e", b"\x1f")
+
+
+class ParsedTrace:
+    """
+    Columnar representation of every noise event found in a single osnoise trace.
+
+    Attributes:
+        cpu, task, start, duration, priority (np.ndarray): One entry per noise event, in trace order.
+            Start times are absolute (ns) and task holds an index into task_names.
+        task_names [str]: Intern table mapping task ids to task names.
+        task_first_start [int]: Earliest start time (ns) of each task, indexed by task id.
+        total_duration (int): Workload duration (ns) read from the matching .benchout file.
+        source (str): Path of a cache file holding the same events, or None.
+        window (str): Name of the workload the events were limited to by parse_trace_window, or None
+            when the trace holds every event.
+        pair_cpu, pair_task (np.ndarray): CPU ID and task id of every (cpu, task) pair in the trace file in order
+            of first appearance, or None when they are those of the events.
+        lost_events (int): Number of events the tracer lost or overwrote, see count_lost_events.
+    """
+
+    def __init__(self, columns, task_names, task_first_start, total_duration, source=None,
+                 window=None, pair_cpu=None, pair_task=None, lost_events=0):
+        self.cpu = columns["cpu"]
+        self.task = columns["task"]
+        self.start = columns["start"]
+        self.duration = columns["duration"]
+        self.priority = columns["priority"]
+        self.task_names = task_names
+        self.task_first_start = task_first_start
+        self.total_duration = total_duration
+        self.source = source
+        self.window = window
+        self.pair_cpu = pair_cpu
+        self.pair_task = pair_task
+        self.lost_events = lost_events
+
+    def __len__(self):
+        return len(self.start)
+
+    def workload_start(self, workload_name):
+        """
+        Returns the start time (ns) of the first event of the workload task, or -1 if it never ran.
+        """
+        if workload_name not in self.task_names:
+            return -1
+        return self.task_first_start[self.task_names.index(workload_name)]
+
+    def to_event_store(self, workload_name, combine_threads=False):
+        """
+        Builds an event store of the noise inside the workload window, with time instant 0 set to the workload start.
+        Every (cpu, task) pair seen in the trace is kept, even without noise inside the window.
+
+        Args:
+            workload_name (str): The name of the task representing the workload.
+            combine_threads (bool): Controls whether or not two consecutive threads should be merged into one thread.
+
+        Returns:
+            EventStore: The noise events sorted on start time per CPU and task.
+        """
+        if len(self) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return EventStore.from_arrays(empty, empty, empty, empty, empty, self.task_names, empty, empty)
+
+        workload_start = self.workload_start(workload_name)
+        if workload_start < 0:
+            print("No workload found in trace")
+            sys.exit(1)
+        workload_end = workload_start + self.total_duration
+
+        cpu = self.cpu.astype(np.int64)
+        if combine_threads:
+            cpu -= cpu % 2
+        task = np.asarray(self.task, dtype=np.int64)
+        start = np.asarray(self.start)
+        end = start + self.duration
+
+        # Noise started after workload and before end
+        inside = (start >= workload_start) & (start <= workload_end)
+        # Noise started before workload but stretches past workload start
+        stretching = ~inside & (end > workload_start) & (start <= workload_end)
+        adjusted_start = np.where(inside, start - workload_start, 0)
+        adjusted_duration = np.where(inside, self.duration, end - workload_start)
+
+        # Every (cpu, task) pair seen in the trace, in order of first appearance
+        if self.pair_cpu is None:
+            pair_cpu, pair_task = cpu, task
+        else:
+            pair_cpu = self.pair_cpu.astype(np.int64)
+            if combine_threads:
+                pair_cpu -= pair_cpu % 2
+            pair_task = np.asarray(self.pair_task, dtype=np.int64)
+        task_amount = len(self.task_names)
+        pairs, first_idx = np.unique(pair_cpu * task_amount + pair_task, return_index=True)
+        pairs = pairs[np.argsort(first_idx)]
+
+        kept = np.flatnonzero(inside | stretching)
+        return EventStore.from_arrays(cpu[kept], task[kept], adjusted_start[kept], adjusted_duration[kept],
+                                      self.priority[kept], self.task_names, pairs // task_amount, pairs % task_amount)
+
+    def to_cpu_dict(self, workload_name, combine_threads=False):
+        """
+        Builds the "dict(cpu, dict(task, list((start, duration, priority))))" of the noise inside the workload window.
+        Time instant 0 is set to the workload start.
+
+        Args:
+            workload_name (str): The name of the task representing the workload.
+            combine_threads (bool): Controls whether or not two consecutive threads should be merged into one thread.
+
+        Returns:
+            dict: Dictionary of CPU traces with tasks and timings, sorted on start time.
+        """
+        return self.to_event_store(workload_name, combine_threads).to_cpu_dict()
+
+
+def parse_trace(trace_file, benchout_file):
+    """
+    Parses an osnoise trace file with the trace regex. Compressed traces are decompressed while reading.
+
+    Args:
+        trace_file (str): Path to the .trace file, optionally zstd or gzip compressed.
+        benchout_file (str): Path to the matching .benchout file.
+
+    Returns:
+        ParsedTrace: All noise events of the trace.
+    """
+    task_ids = dict()
+    cpus, tasks, starts, durations, priorities = [], [], [], [], []
+
+    with open_trace(trace_file, "r") as lines:
+        for line in lines:
+            if (match := TRACE_RE.search(line)):
+                cpus.append(int(match[1]))                                  # CPU ID
+                priorities.append(0 if match[2] == "thread_noise" else -1)  # Task priority
+                task = match[3].rsplit(":", 1)[0] or "nmi"                  # Task name
+                tasks.append(task_ids.setdefault(task, len(task_ids)))
+                starts.append(int(match[4].replace(".", "")))              # Start Time (ns)
+                durations.append(int(match[5]))                             # Duration (ns)
+
+    columns = dict()
+    for (name, dtype), values in zip(COLUMNS, (cpus, tasks, starts, durations, priorities)):
+        columns[name] = np.array(values, dtype=dtype)
+
+    task_first_start = np.full(len(task_ids), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(task_first_start, columns["task"], columns["start"])
+
+    return ParsedTrace(columns, list(task_ids.keys()), task_first_start.tolist(), read_total_duration(benchout_file),
+                       lost_events=read_lost_events(trace_file))
+
+
+def count_lost_events(trace):
+    """
+    Counts the events missing from a trace: the events of every "[LOST N EVENTS]" marker the kernel writes
+    when reading a CPU buffer that overflowed (UNKNOWN_LOST_EVENTS for a "[LOST EVENTS]" marker without
+    a number), and the events overwritten before the buffer was copied, as reported in the header of the trace file.
+
+    Args:
+        trace (bytes): The contents of a trace file, e.g. memory-mapped.
+
+    Returns:
+        int: The number of lost events.
+    """
+    lost = sum(int(count) if count else UNKNOWN_LOST_EVENTS for count in LOST_EVENTS_RE.findall(trace))
+    if (match := ENTRIES_RE.search(trace, 0, HEADER_SIZE)):
+        lost += max(int(match[2]) - int(match[1]), 0)
+    return lost
+
+
+def read_lost_events(trace_file):
+    """
+    Counts the events missing from a trace file, see count_lost_events.
+    """
+    with map_trace(trace_file) as trace:
+        return count_lost_events(trace)
+
+
+def _parse_integers(values):
+    """
+    Converts a list of ASCII integers to an int64 array.
+    """
+    return np.fromstring(b" ".join(values), dtype=np.int64, sep=" ")
+
+
+def _parse_times(seconds, fractions):
+    """
+    Converts the start times captured as ASCII seconds and fractions to an int64 array of ns.
+    """
+    if len(set(map(len, fractions))) == 1:
+        return _parse_integers(seconds) * 10 ** len(fractions[0]) + _parse_integers(fractions)
+    return np.array([int(second + fraction) for second, fraction in zip(seconds, fractions)], dtype=np.int64)
+
+
+def _task_name(raw_task):
+    """
+    Returns the task name of a task captured by the bytes trace regex, as in parse_trace.
+    """
+    return raw_task.rsplit(b":", 1)[0].decode() or "nmi"
+
+
+def _line_bounds(trace, offset, end):
+    """
+    Returns the start and end offsets of the line containing offset.
+    """
+    line_start = trace.rfind(b"\n", 0, offset) + 1
+    line_end = trace.find(b"\n", offset, end)
+    return line_start, end if line_end < 0 else line_end
+
+
+def _find_workload_start(trace, workload_name):
+    """
+    Returns the earliest start time (ns) of the workload task in a memory-mapped trace, or -1 if it never ran.
+    Lines mentioning the workload are found with a literal search and then checked with the trace regex.
+    """
+    candidate_re = re.compile(re.escape(workload_name.encode()) + rb"(?::[\/\w\-]*)?[^\S\n]+start")
+    workload_start = -1
+    line_end = 0
+    for candidate in candidate_re.finditer(trace):
+        if candidate.start() < line_end:
+            continue
+        line_start, line_end = _line_bounds(trace, candidate.start(), len(trace))
+        match = TRACE_BYTES_RE.search(trace, line_start, line_end)
+        if match and _task_name(match[3]) == workload_name:
+            start = int(match[4] + match[5])
+            if workload_start < 0 or start < workload_start:
+                workload_start = start
+    return workload_start
+
+
+def _find_window_offset(trace, threshold):
+    """
+    Binary-searches a memory-mapped trace for the first line whose noise ends at or after threshold (ns).
+
+    Events are written when their noise ends, so start + duration mostly grows with the position in the file.
+    The search uses it instead of the line timestamp, which may come from a different clock than the start times.
+    Thread noise excludes the interference preempting it and is written later than it ends, so lines before the
+    returned offset may still end after threshold, see _find_late_line.
+    """
+    low, high = 0, len(trace)
+    while low < high:
+        middle = (low + high) // 2
+        position = trace.rfind(b"\n", 0, middle) + 1
+        end_time = None
+        while position < high:
+            line_start, line_end = _line_bounds(trace, position, len(trace))
+            if (match := TRACE_BYTES_RE.search(trace, line_start, line_end)):
+                end_time = int(match[4] + match[5]) + int(match[6])
+                break
+            position = line_end + 1
+        if end_time is None or end_time >= threshold:
+            high = middle
+        else:
+            low = line_end + 1
+    return trace.rfind(b"\n", 0, low) + 1
+
+
+def _find_late_line(trace, rows, window_offset, threshold):
+    """
+    Finds the first of the lines before window_offset whose noise still ends at or after threshold (ns).
+
+    Args:
+        trace (bytes): The memory-mapped trace.
+        rows (list): The matches of the pair regex before window_offset, in file order.
+
+    Returns:
+        tuple: The offset of the line and the number of rows before it, or None if every row ends before threshold.
+    """
+    if not rows:
+        return None
+    ends = _parse_times(list(map(itemgetter(2), rows)), list(map(itemgetter(3), rows))) + \
+        _parse_integers(list(map(itemgetter(4), rows)))
+    late = np.flatnonzero(ends >= threshold)
+    if len(late) == 0:
+        return None
+    match = next(itertools.islice(PAIR_BYTES_RE.finditer(trace, 0, window_offset), int(late[0]), None))
+    return _line_bounds(trace, match.start(), window_offset)[0], int(late[0])
+
+
+def parse_trace_window(trace_file, benchout_file, workload_name):
+    """
+    Parses the events of an osnoise trace file that can fall inside the workload window.
+
+    The trace is memory-mapped, or decompressed into memory, the workload start is located with a literal search and the first line
+    that may hold noise of the window, including noise that starts before the workload and stretches into it,
+    is found with a binary search. Only the lines from there on, widened by WINDOW_MARGIN, are parsed,
+    with the bytes trace regex and NumPy conversions instead of a Python loop per line. The lines before
+    are only scanned for the (cpu, task) pairs they contain and for their end times, and the window is
+    widened back to the first of them that ends inside it, e.g. thread noise preempted for longer than
+    WINDOW_MARGIN, so the trace builds the same event store as one from parse_trace. Traces the bytes
+    regex can not handle exactly are parsed with parse_trace.
+
+    Args:
+        trace_file (str): Path to the .trace file, optionally zstd or gzip compressed.
+        benchout_file (str): Path to the matching .benchout file.
+        workload_name (str): The name of the task representing the workload.
+
+    Returns:
+        ParsedTrace: The noise events of the trace from the start of the workload window on.
+    """
+    total_duration = read_total_duration(benchout_file)
+    if total_duration < 0 or workload_name == "nmi":
+        return parse_trace(trace_file, benchout_file)
+
+    with map_trace(trace_file) as trace:
+        if len(trace) == 0 or np.frombuffer(trace, dtype=np.uint8).max() >= 0x80 or any(trace.find(b) >= 0 for b in UNSUPPORTED_BYTES):
+            return parse_trace(trace_file, benchout_file)
+        workload_start = _find_workload_start(trace, workload_name)
+        if workload_start < 0:
+            return parse_trace(trace_file, benchout_file)
+
+        threshold = workload_start - WINDOW_MARGIN
+        window_offset = _find_window_offset(trace, threshold)
+        outside_rows = PAIR_BYTES_RE.findall(trace, 0, window_offset)
+        if (late_line := _find_late_line(trace, outside_rows, window_offset, threshold)):
+            window_offset, late_rows = late_line
+            outside_rows = outside_rows[:late_rows]
+        outside_pairs = dict.fromkeys(map(itemgetter(0, 1), outside_rows))
+        rows = TRACE_BYTES_RE.findall(trace, window_offset)
+        lost_events = count_lost_events(trace)
+    if not rows:
+        return parse_trace(trace_file, benchout_file)
+
+    cpu_column, type_column, task_column, seconds, fractions, durations = \
+        (list(map(itemgetter(group), rows)) for group in range(6))
+
+    # Intern the tasks in order of first appearance in the whole file
+    task_ids = dict()
+    raw_task_ids = dict()
+    for raw_task in list(dict.fromkeys(raw for _, raw in outside_pairs)) + list(dict.fromkeys(task_column)):
+        if raw_task not in raw_task_ids:
+            raw_task_ids[raw_task] = task_ids.setdefault(_task_name(raw_task), len(task_ids))
+    noise_priorities = {noise: 0 if noise == b"thread_noise" else -1 for noise in dict.fromkeys(type_column)}
+
+    columns = dict()
+    columns["cpu"] = _parse_integers(cpu_column).astype(np.uint16)
+    columns["task"] = np.fromiter(map(raw_task_ids.__getitem__, task_column), dtype=np.uint32, count=len(rows))
+    columns["start"] = _parse_times(seconds, fractions)
+    columns["duration"] = _parse_integers(durations)
+    columns["priority"] = np.fromiter(map(noise_priorities.__getitem__, type_column), dtype=np.int8, count=len(rows))
+
+    task_first_start = np.full(len(task_ids), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(task_first_start, columns["task"], columns["start"])
+
+    # Pairs before the window come first, followed by those first seen inside it
+    task_amount = len(task_ids)
+    window_pairs, first_idx = np.unique(columns["cpu"].astype(np.int64) * task_amount + columns["task"], return_index=True)
+    pairs = dict.fromkeys((int(cpu), raw_task_ids[raw_task]) for cpu, raw_task in outside_pairs)
+    pairs.update(dict.fromkeys(divmod(pair, task_amount) for pair in window_pairs[np.argsort(first_idx)].tolist()))
+    pair_cpu = np.array([cpu for cpu, _ in pairs], dtype=np.uint16)
+    pair_task = np.array([task for _, task in pairs], dtype=np.uint32)
+
+    return ParsedTrace(columns, list(task_ids.keys()), task_first_start.tolist(), total_duration,
+                       window=workload_name, pair_cpu=pair_cpu, pair_task=pair_task, lost_events=lost_events)
+
+
+def cache_path(trace_file):
+    """
+    Returns the path of the cache file stored next to a trace file.
+    """
+    return trace_file + CACHE_SUFFIX
+
+
+def _align(offset):
+    return (offset + CACHE_ALIGNMENT - 1) // CACHE_ALIGNMENT * CACHE_ALIGNMENT
+
+
+def write_cache(path, trace, key):
+    """
+    Writes a parsed trace to a cache file.
+
+    Layout: magic, little-endian uint64 header length, JSON header, followed by one
+    contiguous array per column. Every array starts at a 64 byte aligned offset.
+    """
+    header = {
+        "version": CACHE_VERSION,
+        "key": key,
+        "events": len(trace),
+        "task_names": trace.task_names,
+        "task_first_start": trace.task_first_start,
+        "total_duration": trace.total_duration,
+        "window": trace.window,
+        "pairs": None if trace.pair_cpu is None else [trace.pair_cpu.tolist(), trace.pair_task.tolist()],
+        "lost_events": trace.lost_events,
+        "columns": [],
+    }
+    # Column offsets depend on the header size, so grow the reserved space until it fits
+    reserved = CACHE_ALIGNMENT
+    while True:
+        offset = _align(len(CACHE_MAGIC) + 8 + reserved)
+        header["columns"] = []
+        for name, dtype in COLUMNS:
+            header["columns"].append({"name": name, "dtype": np.dtype(dtype).str, "offset": offset})
+            offset = _align(offset + len(trace) * np.dtype(dtype).itemsize)
+        header_bytes = json.dumps(header).encode()
+        if len(header_bytes) <= reserved:
+            break
+        reserved = _align(len(header_bytes))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CACHE_MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for column, (name, dtype) in zip(header["columns"], COLUMNS):
+            f.seek(column["offset"])
+            f.write(np.ascontiguousarray(getattr(trace, name), dtype=dtype).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_cache_header(path):
+    """
+    Reads the JSON header of a cache file. Returns None if the file is not a valid cache.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            header_len = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_len))
+    except (OSError, ValueError):
+        return None
+    if header.get("version") != CACHE_VERSION:
+        return None
+    return header
+
+
+def read_cache(path, header):
+    """
+    Memory-maps the columns of a cache file.
+    """
+    columns = dict()
+    for column in header["columns"]:
+        if header["events"] == 0:
+            columns[column["name"]] = np.empty(0, dtype=column["dtype"])
+        else:
+            columns[column["name"]] = np.memmap(path, dtype=column["dtype"], mode="r",
+                                                offset=column["offset"], shape=(header["events"],))
+    pair_cpu, pair_task = (None, None) if header["pairs"] is None else \
+        (np.array(header["pairs"][0], dtype=np.uint16), np.array(header["pairs"][1], dtype=np.uint32))
+    return ParsedTrace(columns, header["task_names"], header["task_first_start"], header["total_duration"], path,
+                       header["window"], pair_cpu, pair_task, header["lost_events"])
+
+
+def load_trace(file, trace_path, use_cache=True, workload_name=None):
+    """
+    Loads a trace, memory-mapping its cache when it is still valid and
+    otherwise parsing the trace and (re)writing the cache.
+
+    Args:
+        file (str): The trace file name, optionally of a zstd or gzip compressed trace.
+        trace_path (str): The path to the directory containing the trace files.
+        use_cache (bool): Controls whether the cache is read and written.
+        workload_name (str): If set, only the events that can fall inside the window of this workload are
+            parsed, see parse_trace_window. A cache holding every event is used for any workload.
+
+    Returns:
+        ParsedTrace: The noise events of the trace.
+    """
+    trace_file = os.path.join(trace_path, file)
+    benchout_file = os.path.join(trace_path, benchout_path(file))
+    parse = parse_trace if workload_name is None else \
+        lambda trace_file, benchout_file: parse_trace_window(trace_file, benchout_file, workload_name)
+    if not use_cache:
+        return parse(trace_file, benchout_file)
+
+    path = cache_path(trace_file)
+    header = read_cache_header(path)
+    if header is not None and header["window"] in (None, workload_name) and \
+            stamp_matches(trace_file, header["key"]["trace"]) and \
+            stamp_matches(benchout_file, header["key"]["benchout"]):
+        trace = read_cache(path, header)
+        # Refresh the stored modification times so the content hash is only recomputed once
+        key = {"trace": refresh_stamp(trace_file, header["key"]["trace"]),
+               "benchout": refresh_stamp(benchout_file, header["key"]["benchout"])}
+        if key != header["key"]:
+            try:
+                write_cache(path, trace, key)
+            except OSError:
+                pass
+        return trace
+
+    trace = parse(trace_file, benchout_file)
+    try:
+        write_cache(path, trace, {"trace": file_stamp(trace_file), "benchout": file_stamp(benchout_file)})
+        trace.source = path
+    except OSError as e:
+        print(f"Warning: Unable to write trace cache {path}: {e}")
+    return trace
+
+
+def share_trace(trace, scratch_folder):
+    """
+    Returns the path of a cache file holding a trace, so another process can memory-map it instead of
+    receiving a pickled copy. Traces without a cache file are written to the scratch folder.
+    """
+    if trace.source is not None:
+        return trace.source
+    fd, path = tempfile.mkstemp(suffix=CACHE_SUFFIX, dir=scratch_folder)
+    os.close(fd)
+    write_cache(path, trace, None)
+    return path
+
+
+def open_shared_trace(path):
+    """
+    Memory-maps a trace shared by share_trace.
+    """
+    header = read_cache_header(path)
+    if header is None:
+        raise ValueError(f"{path} is not a valid trace cache")
+    return read_cache(path, header)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the parsed trace cache for all traces in a folder.")
+    parser.add_argument("trace_folder_path", type=str, help="Path to the folder containing trace files.")
+    parser.add_argument("-w", "--workload_name", type=str, default=None,
+                        help="Only parse the events inside the window of this workload (default: parse every event).")
+    args = parser.parse_args()
+
+    trace_path = os.path.normpath(args.trace_folder_path)
+    raw_trace_files = list_trace_files(trace_path)
+    for file in raw_trace_files:
+        trace = load_trace(file, trace_path, workload_name=args.workload_name)
+        print(f"{file}: {len(trace)} events, {trace.lost_events} lost")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import errno
+import select
+import signal
+import argparse
+from trace_storage import compression_suffix, compress_chunk, LOST_EVENTS_RE, UNKNOWN_LOST_EVENTS
+
+# Constants
+DEFAULT_TRACEFS = "/sys/kernel/tracing"
+READ_SIZE = 1 << 16
+CHUNK_SIZE = 1 << 20  # Bytes collected before they are written to the output file
+POLL_TIMEOUT = 100  # Time (ms) to wait for new events before checking for a stop request
+CAPTURE_SUFFIX = ".capture.json"
+CHUNK_LEVELS = {".zst": 1, ".gz": 1}  # Fast compression levels, so the capture keeps up with the tracer
+# Tracer settings recorded next to the captured trace
+SETTINGS = ("current_tracer", "trace_clock", "buffer_size_kb", "buffer_total_size_kb", "tracing_on")
+
+# Set by SIGTERM and SIGINT, the capture stops once trace_pipe is drained
+stop_requested = False
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(
+        description="Stream the trace_pipe of the tracer into a trace file until stopped with SIGTERM or SIGINT."
+    )
+    parser.add_argument("output", type=str,
+                        help="Path to the trace file to write. Traces ending in .trace.zst or .trace.gz are written compressed.")
+    parser.add_argument("--tracefs", type=str, default=DEFAULT_TRACEFS,
+                        help="Path to tracefs, or to a folder holding a trace_pipe FIFO for testing (default: /sys/kernel/tracing).")
+    parser.add_argument("--cpus", type=str, default=None,
+                        help="CPUs to run on as a list like '6-7' or '0,7', normally the housekeeping CPUs (default: all CPUs).")
+    return parser.parse_args()
+
+
+def parse_cpu_list(cpu_list):
+    """
+    Parses a CPU list in the format of /sys/devices/system/cpu/online, e.g. "0-3,6".
+    """
+    cpus = set()
+    for part in cpu_list.split(","):
+        first, _, last = part.strip().partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def request_stop(signum, frame):
+    global stop_requested
+    stop_requested = True
+
+
+def read_settings(tracefs):
+    """
+    Reads the tracer settings, None for the ones that do not exist.
+    """
+    settings = dict()
+    for name in SETTINGS:
+        try:
+            with open(os.path.join(tracefs, name), "r") as f:
+                settings[name] = f.read().strip()
+        except OSError:
+            settings[name] = None
+    return settings
+
+
+def read_cpu_stats(tracefs):
+    """
+    Reads the ring buffer statistics of every CPU, e.g. the "overrun" and "dropped events" counts.
+
+    Returns:
+        dict: The integer statistics by name for each CPU.
+    """
+    stats = dict()
+    per_cpu = os.path.join(tracefs, "per_cpu")
+    if not os.path.isdir(per_cpu):
+        return stats
+    for entry in os.scandir(per_cpu):
+        if not entry.name.startswith("cpu"):
+            continue
+        try:
+            with open(os.path.join(entry.path, "stats"), "r") as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        cpu_stats = dict()
+        for line in lines:
+            name, _, value = line.partition(":")
+            if value.strip().isdigit():
+                cpu_stats[name.strip()] = int(value)
+        stats[int(entry.name[3:])] = cpu_stats
+    return dict(sorted(stats.items()))
+
+
+def stats_delta(before, after):
+    """
+    Returns how much every ring buffer statistic of every CPU grew during the capture.
+    """
+    return {cpu: {name: value - before.get(cpu, {}).get(name, 0) for name, value in cpu_stats.items()}
+            for cpu, cpu_stats in after.items()}
+
+
+class ChunkWriter:
+    """
+    Writes a stream to a file in chunks of at least CHUNK_SIZE bytes. Traces with a compression suffix
+    get every chunk as a separate zstd frame or gzip member, which together form a valid compressed file.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.suffix = compression_suffix(path)
+        self.pending = []
+        self.pending_size = 0
+        self.chunks = 0
+        self.bytes_in = 0
+
+    def write(self, data):
+        self.pending.append(data)
+        self.pending_size += len(data)
+        self.bytes_in += len(data)
+        if self.pending_size >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        chunk = b"".join(self.pending)
+        self.file.write(compress_chunk(chunk, self.suffix, CHUNK_LEVELS[self.suffix]) if self.suffix else chunk)
+        self.file.flush()
+        self.pending = []
+        self.pending_size = 0
+        self.chunks += 1
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class LostEventCounter:
+    """
+    Counts the "[LOST N EVENTS]" and "[LOST EVENTS]" markers of a stream of trace lines, including markers
+    split across reads. A marker without a number counts as UNKNOWN_LOST_EVENTS events.
+    """
+
+    def __init__(self):
+        self.remainder = b""
+        self.markers = 0
+        self.events = 0
+
+    def feed(self, data):
+        lines_end = data.rfind(b"\n") + 1
+        if lines_end == 0:
+            self.remainder += data
+            return
+        self.count(self.remainder + data[:lines_end])
+        self.remainder = data[lines_end:]
+
+    def count(self, lines):
+        for count in LOST_EVENTS_RE.findall(lines):
+            self.markers += 1
+            self.events += int(count) if count else UNKNOWN_LOST_EVENTS
+
+    def close(self):
+        self.count(self.remainder)
+        self.remainder = b""
+
+
+def read_available(fd):
+    """
+    Reads what is available from a non-blocking file descriptor.
+
+    Returns:
+        bytes: The data read, b"" at the end of a FIFO without a writer, or None if nothing is available yet.
+    """
+    try:
+        return os.read(fd, READ_SIZE)
+    except BlockingIOError:
+        return None
+    except OSError as e:
+        if e.errno == errno.EINTR:
+            return None
+        raise
+
+
+def capture(tracefs, output):
+    """
+    Streams the trace_pipe of tracefs into a trace file until a stop is requested, then drains the events
+    still buffered. Reading trace_pipe consumes the events, so the ring buffer does not overflow as long
+    as the capture keeps up. Events the tracer lost anyway are reported by the kernel as "[LOST N EVENTS]" lines.
+
+    The tracer settings, the captured bytes, the lost event markers and the growth of the ring buffer statistics
+    of every CPU are written next to the trace file, see CAPTURE_SUFFIX.
+
+    Args:
+        tracefs (str): Path to tracefs.
+        output (str): Path to the trace file to write, compressed if it ends in .trace.zst or .trace.gz.
+
+    Returns:
+        dict: The capture summary written next to the trace file.
+    """
+    settings = read_settings(tracefs)
+    stats_before = read_cpu_stats(tracefs)
+    writer = ChunkWriter(output)
+    lost = LostEventCounter()
+    started = time.time()
+
+    fd = os.open(os.path.join(tracefs, "trace_pipe"), os.O_RDONLY | os.O_NONBLOCK)
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    try:
+        while True:
+            data = read_available(fd)
+            if data:
+                writer.write(data)
+                lost.feed(data)
+            elif stop_requested:
+                break
+            elif data is None:
+                poller.poll(POLL_TIMEOUT)
+            else:
+                # A FIFO without a writer is always readable, wait instead of spinning
+                time.sleep(POLL_TIMEOUT / 1000)
+    finally:
+        os.close(fd)
+        writer.close()
+        lost.close()
+
+    cpu_stats = stats_delta(stats_before, read_cpu_stats(tracefs))
+    summary = {
+        "tracefs": tracefs,
+        "settings": settings,
+        "compression": compression_suffix(output) or None,
+        "started": started,
+        "stopped": time.time(),
+        "bytes": writer.bytes_in,
+        "chunks": writer.chunks,
+        "lost_event_markers": lost.markers,
+        "lost_events": lost.events,
+        "overrun": sum(stats.get("overrun", 0) for stats in cpu_stats.values()),
+        "dropped_events": sum(stats.get("dropped events", 0) for stats in cpu_stats.values()),
+        "cpu_stats": cpu_stats,
+    }
+    with open(output + CAPTURE_SUFFIX, "w") as f:
+        f.write(json.dumps(summary, indent=4))
+    return summary
+
+
+def main():
+    args = parse_arguments()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    if args.cpus:
+        os.sched_setaffinity(0, parse_cpu_list(args.cpus))
+
+    summary = capture(args.tracefs, args.output)
+    print(f"Captured {summary['bytes']} bytes in {summary['chunks']} chunks, {summary['lost_events']} events lost")
+    if summary["lost_events"] or summary["overrun"] or summary["dropped_events"]:
+        print(f"Warning: {args.output} is incomplete, {summary['lost_event_markers']} lost event markers, "
+              f"{summary['overrun']} overrun and {summary['dropped_events']} dropped events", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import os
+import io
+import sys
+import gzip
+import hashlib
+import mmap
+import re
+import argparse
+import contextlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Constants
+TRACE_SUFFIX = ".trace"
+COMPRESSION_SUFFIXES = (".zst", ".gz")
+STORAGE_SUFFIXES = ("",) + COMPRESSION_SUFFIXES
+READ_SIZE = 1 << 20
+DEFAULT_LEVELS = {".zst": 3, ".gz": 6}
+HASH_CHUNK_SIZE = 1 << 20
+
+# The kernel writes this marker into the trace when the ring buffer of a CPU overflowed,
+# "[LOST EVENTS]" without a number when it does not know how many events were lost
+LOST_EVENTS_RE = re.compile(rb"\[LOST(?: (\d+))? EVENTS\]")
+UNKNOWN_LOST_EVENTS = 1  # Counted for a marker without a number, so the trace is never taken as complete
+
+
+def compression_suffix(path):
+    """
+    Returns the compression suffix of a trace file, or "" for uncompressed traces.
+    """
+    for suffix in COMPRESSION_SUFFIXES:
+        if path.endswith(TRACE_SUFFIX + suffix):
+            return suffix
+    return ""
+
+
+def is_trace_file(path):
+    """
+    Checks whether a file name is that of a trace, compressed or not.
+    """
+    return path.endswith(TRACE_SUFFIX) or compression_suffix(path) != ""
+
+
+def strip_compression(path):
+    """
+    Returns the path of a trace without its compression suffix, e.g. "nbody-omp-1-sys.trace".
+    """
+    suffix = compression_suffix(path)
+    return path[:-len(suffix)] if suffix else path
+
+
+def benchout_path(trace_file):
+    """
+    Returns the path of the .benchout file belonging to a trace file.
+    """
+    return strip_compression(trace_file).replace(".trace", ".benchout")
+
+
+def find_trace(trace_file):
+    """
+    Returns the path of a trace as it is stored, i.e. "<name>.trace" or one of its compressed variants, or None.
+    """
+    for suffix in STORAGE_SUFFIXES:
+        if os.path.isfile(trace_file + suffix):
+            return trace_file + suffix
+    return None
+
+
+def list_trace_files(trace_path):
+    """
+    Returns the trace file names of a folder. When a trace is stored both uncompressed and compressed,
+    e.g. while a folder is being converted, only the uncompressed file is returned.
+    """
+    stored = dict()
+    for file in sorted(os.listdir(trace_path), key=lambda file: STORAGE_SUFFIXES.index(compression_suffix(file))):
+        if is_trace_file(file):
+            stored.setdefault(strip_compression(file), file)
+    return list(stored.values())
+
+
+def hash_file(path):
+    """
+    Returns the blake2b content hash of a file.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while (chunk := f.read(HASH_CHUNK_SIZE)):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def file_stamp(path):
+    """
+    Returns the size, modification time and content hash identifying the current version of a file.
+    """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": hash_file(path)}
+
+
+def stamp_matches(path, stamp):
+    """
+    Checks whether a file still matches a stamp. The content hash is only computed
+    when the size matches but the modification time does not, e.g. after copying a folder.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    if stat.st_size != stamp["size"]:
+        return False
+    if stat.st_mtime_ns == stamp["mtime_ns"]:
+        return True
+    return hash_file(path) == stamp["hash"]
+
+
+def refresh_stamp(path, stamp):
+    """
+    Returns a copy of a matching stamp with the current modification time of the file.
+    """
+    return dict(stamp, mtime_ns=os.stat(path).st_mtime_ns)
+
+
+def _require_zstandard(path):
+    if zstandard is None:
+        raise RuntimeError(f"Reading or writing {path} requires the zstandard package (pip install zstandard)")
+
+
+def open_trace(path, mode="r"):
+    """
+    Opens a trace file for reading, decompressing zstd and gzip compressed traces while reading.
+
+    Args:
+        path (str): Path to the trace file.
+        mode (str): "r" for text or "rb" for bytes.
+
+    Returns:
+        file object: The uncompressed contents of the trace.
+    """
+    return _open_decompressed(path, compression_suffix(path), mode)
+
+
+def _open_decompressed(path, suffix, mode="r"):
+    if suffix == ".gz":
+        return gzip.open(path, "rb" if "b" in mode else "rt")
+    if suffix == ".zst":
+        _require_zstandard(path)
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_size=READ_SIZE,
+                                                             read_across_frames=True, closefd=True)
+        reader = io.BufferedReader(reader, READ_SIZE)
+        return reader if "b" in mode else io.TextIOWrapper(reader)
+    return open(path, mode)
+
+
+@contextlib.contextmanager
+def map_trace(path):
+    """
+    Provides the uncompressed contents of a trace as a bytes-like object. Uncompressed traces are memory-mapped,
+    compressed traces are decompressed into memory.
+    """
+    if compression_suffix(path):
+        with open_trace(path, "rb") as f:
+            yield f.read()
+    elif os.path.getsize(path) == 0:
+        yield b""
+    else:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as trace:
+            yield trace
+
+
+def compress_chunk(data, suffix, level=None):
+    """
+    Compresses data as a self-contained zstd frame or gzip member, so chunks can be appended to one file.
+    """
+    level = DEFAULT_LEVELS[suffix] if level is None else level
+    if suffix == ".gz":
+        return gzip.compress(data, compresslevel=level)
+    _require_zstandard(suffix)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def compress_trace(trace_file, suffix, level=None, keep=False):
+    """
+    Compresses an uncompressed trace next to it, verifying the result before the original is removed.
+    A valid parsed trace cache of the original is moved to the compressed trace, see trace_cache.py,
+    or copied when the original is kept.
+
+    Args:
+        trace_file (str): Path to the uncompressed trace.
+        suffix (str): ".zst" or ".gz".
+        level (int): Compression level, DEFAULT_LEVELS if not given.
+        keep (bool): Controls whether the uncompressed trace is kept.
+
+    Returns:
+        str: The path of the compressed trace.
+    """
+    # trace_cache reads traces through this module
+    from trace_cache import cache_path, read_cache_header, read_cache, write_cache
+
+    level = DEFAULT_LEVELS[suffix] if level is None else level
+    output = trace_file + suffix
+    temp_output = output + ".tmp"
+    with open(trace_file, "rb") as f, open(temp_output, "wb") as out:
+        if suffix == ".gz":
+            with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=level) as writer:
+                while (chunk := f.read(READ_SIZE)):
+                    writer.write(chunk)
+        else:
+            _require_zstandard(output)
+            zstandard.ZstdCompressor(level=level).copy_stream(f, out, read_size=READ_SIZE, write_size=READ_SIZE)
+
+    with open(trace_file, "rb") as original, _open_decompressed(temp_output, suffix, "rb") as compressed:
+        while (chunk := original.read(READ_SIZE)):
+            if compressed.read(len(chunk)) != chunk:
+                os.remove(temp_output)
+                raise ValueError(f"Verifying {output} failed")
+        if compressed.read(1):
+            os.remove(temp_output)
+            raise ValueError(f"Verifying {output} failed")
+    os.replace(temp_output, output)
+
+    header = read_cache_header(cache_path(trace_file))
+    if header is not None and header["key"] is not None and stamp_matches(trace_file, header["key"]["trace"]):
+        key = dict(header["key"], trace=file_stamp(output))
+        write_cache(cache_path(output), read_cache(cache_path(trace_file), header), key)
+        if not keep:
+            os.remove(cache_path(trace_file))
+
+    if not keep:
+        os.remove(trace_file)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress the uncompressed traces of trace folders.")
+    parser.add_argument("trace_folders", type=str, nargs="+", help="Folders containing trace files, searched recursively.")
+    parser.add_argument("-f", "--format", type=str, choices=("zst", "gz"), default="zst" if zstandard else "gz",
+                        help="Compression format (default: zst if the zstandard package is installed, otherwise gz).")
+    parser.add_argument("-l", "--level", type=int, default=None, help="Compression level (default: 3 for zst, 6 for gz).")
+    parser.add_argument("--keep", action="store_true", help="Keep the uncompressed traces.")
+    args = parser.parse_args()
+
+    suffix = "." + args.format
+    if suffix == ".zst" and zstandard is None:
+        print("The zstandard package is not installed, use -f gz or pip install zstandard")
+        sys.exit(1)
+
+    bytes_in = bytes_out = 0
+    for folder in args.trace_folders:
+        for root, _, files in os.walk(folder):
+            for file in sorted(files):
+                if not file.endswith(TRACE_SUFFIX):
+                    continue
+                trace_file = os.path.join(root, file)
+                size = os.path.getsize(trace_file)
+                output = compress_trace(trace_file, suffix, args.level, args.keep)
+                bytes_in += size
+                bytes_out += os.path.getsize(output)
+                print(f"{output}: {size / 1e6:.1f} MB -> {os.path.getsize(output) / 1e6:.1f} MB")
+    if bytes_in:
+        print(f"Compressed {bytes_in / 1e6:.1f} MB to {bytes_out / 1e6:.1f} MB ({bytes_in / max(bytes_out, 1):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
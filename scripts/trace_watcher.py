@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import signal
+import argparse
+from trace_cache import load_trace
+from trace_storage import list_trace_files, benchout_path, file_stamp
+from trace_capture import parse_cpu_list
+from noise_average import trace_sums, open_partial, save_partial
+
+# Constants
+DEFAULT_WORKLOAD_NAME = "main"
+DEFAULT_INTERVAL = 1.0  # Time (s) between scans of the trace folder
+# Benchmark.sh appends this line to the .benchout file once the trace of the iteration is saved
+ITERATION_DONE_MARKER = b"Noise injector was enabled?"
+MARKER_TAIL_SIZE = 4096
+
+# Set by SIGTERM and SIGINT, the watcher stops after the trace it is parsing
+stop_requested = False
+
+
+def parse_arguments():
+    """
+    Parse and handle command-line arguments using argparse.
+
+    Returns:
+        Namespace: Parsed arguments as an object.
+    """
+    parser = argparse.ArgumentParser(
+        description="Parse the traces of a running benchmark into the trace cache and the average noise partial as they are saved."
+    )
+    parser.add_argument("trace_folder_path", type=str, help="Path to the folder the traces are saved to.")
+    parser.add_argument("-w", "--workload_name", type=str, default=DEFAULT_WORKLOAD_NAME,
+                        help="Name of the workload task (default: 'main').")
+    parser.add_argument("--cpus", type=str, default=None,
+                        help="CPUs to run on as a list like '6-7' or '0,7', normally the housekeeping CPUs (default: all CPUs).")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help="Time in seconds between scans of the trace folder (default: 1.0).")
+    parser.add_argument("--max_lost_events", type=int, default=None,
+                        help="Do not add traces in which the tracer lost more events (default: add every trace).")
+    parser.add_argument("--once", action="store_true",
+                        help="Add the traces that are done and exit instead of watching the folder.")
+    return parser.parse_args()
+
+
+def enter_background(cpus=None):
+    """
+    Moves the watcher to the idle scheduling class, so it only runs on CPUs that have nothing else to run,
+    and pins it to the given CPUs.
+    """
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+
+
+def request_stop(signum, frame):
+    global stop_requested
+    stop_requested = True
+
+
+def is_trace_done(trace_file):
+    """
+    Checks whether Benchmark.sh finished the iteration of a trace, i.e. the trace is completely written.
+    """
+    benchout_file = benchout_path(trace_file)
+    try:
+        with open(benchout_file, "rb") as f:
+            f.seek(max(os.fstat(f.fileno()).st_size - MARKER_TAIL_SIZE, 0))
+            return ITERATION_DONE_MARKER in f.read()
+    except OSError:
+        return False
+
+
+def find_done_traces(trace_path, average, max_lost_events=None):
+    """
+    Returns the traces of a folder that are done but neither in the average nor rejected yet, sorted by trace number.
+    """
+    files = [file for file in list_trace_files(trace_path) if not average.was_rejected(os.path.join(trace_path, file), max_lost_events)
+             and os.path.join(trace_path, file) not in average and is_trace_done(os.path.join(trace_path, file))]
+    files.sort(key=lambda file: int(file.split("-")[2]))  # Sort by trace number
+    return files
+
+
+def add_trace(average, file, trace_path, workload_name, max_lost_events=None):
+    """
+    Parses a trace into the trace cache and adds it to the average, unless the tracer lost more than
+    max_lost_events events, in which case it is recorded as rejected.
+
+    Returns:
+        tuple: The number of parsed and lost events.
+    """
+    trace = load_trace(file, trace_path, True, workload_name)
+    trace_file = os.path.join(trace_path, file)
+    if max_lost_events is None or trace.lost_events <= max_lost_events:
+        average.add(trace_file, trace.total_duration, trace_sums(trace.to_event_store(workload_name)), file_stamp(trace_file))
+    else:
+        average.reject(trace_file, trace.lost_events, file_stamp(trace_file))
+    return len(trace), trace.lost_events
+
+
+def watch(trace_path, workload_name, interval=DEFAULT_INTERVAL, once=False, max_lost_events=None):
+    """
+    Adds every trace to the average partial of the trace folder once its iteration is done, until
+    a stop is requested. The partial is saved after every trace, including rejected ones, so
+    traces_to_noise_config.py --partial only has to parse the traces the watcher did not get to.
+
+    Args:
+        trace_path (str): The path to the directory containing the trace files.
+        workload_name (str): The name of the task representing the workload.
+        interval (float): Time (s) between scans of the trace folder.
+        once (bool): Controls whether to return after adding the traces that are currently done.
+        max_lost_events (int): Traces in which the tracer lost more events are not added.
+    """
+    average = open_partial(trace_path, workload_name)
+    while not stop_requested:
+        for file in find_done_traces(trace_path, average, max_lost_events):
+            start = time.perf_counter()
+            events, lost_events = add_trace(average, file, trace_path, workload_name, max_lost_events)
+            save_partial(average, trace_path)
+            if os.path.join(trace_path, file) not in average:
+                print(f"Rejected {file}: {lost_events} events lost", flush=True)
+                continue
+            print(f"{file}: {events} events, {lost_events} lost in {time.perf_counter() - start:.3f} s, "
+                  f"worst trace {os.path.basename(average.worst)}", flush=True)
+            if stop_requested:
+                break
+        if once:
+            break
+        time.sleep(interval)
+
+
+def main():
+    args = parse_arguments()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    try:
+        enter_background(parse_cpu_list(args.cpus) if args.cpus else None)
+    except (OSError, ValueError) as e:
+        print(f"Unable to move the trace watcher to the background: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    watch(os.path.normpath(args.trace_folder_path), args.workload_name, args.interval, args.once, args.max_lost_events)
+
+
+if __name__ == "__main__":
+    main()
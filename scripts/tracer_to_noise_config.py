@@ -8,10 +8,11 @@ import locale
 import re
 from multiprocessing import Pool
 import json
+from trace_storage import open_trace, find_trace
 
 #Usage: Arg 1 contains the path to the trace file. Arg 2 contains workload name eg "main"
 def main():
-    if not os.path.isfile(sys.argv[1]+".trace") & os.path.isfile(sys.argv[1]+".benchout"):
+    if find_trace(sys.argv[1]+".trace") is None or not os.path.isfile(sys.argv[1]+".benchout"):
         print('Arg not a path to file')
         return
     
@@ -49,7 +50,7 @@ def main():
     taskre = re.compile("noise: .*:")
 
     #Fill cpu dictionary
-    with open(tracepath+".trace", "r") as lines:
+    with open_trace(find_trace(tracepath+".trace"), "r") as lines:
         for line in lines:
             if commentre.match(line) != None:
                 continue
@@ -85,9 +86,9 @@ def main():
                 cpudict[cpu] = dict({task: [(start,duration)]})
     
     #Sort all tasks based on start time
-    pool = Pool()
-    for cpu, tasks in cpudict.items():
-        cpudict[cpu] = pool.map(sort_task_start, tasks.items())
+    with Pool() as pool:
+        for cpu, tasks in cpudict.items():
+            cpudict[cpu] = pool.map(sort_task_start, tasks.items())
 
     #Seperate workload from noise and remove unnecessary noise information (taskname)
     noisedict = dict()
@@ -1,12 +1,18 @@
 import os
 import sys
-import re
 import argparse
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import cm
 import numpy as np
-from multiprocessing import Pool
+from multiprocessing import Pool, Value
+from functools import partial
 import json
+import heapq
+import tempfile
+from trace_cache import load_trace, share_trace, open_shared_trace
+from trace_storage import list_trace_files, is_trace_file, benchout_path, file_stamp
+from noise_average import AveragePartial, trace_sums, open_partial, load_partial, save_partial
+from benchout_reader import read_total_duration
+from noise_schedule import write_binary_schedule
+from stage_profiler import StageProfiler
 
 # Constants
 DEFAULT_WORKLOAD_NAME = "main"
@@ -14,6 +20,7 @@ DEFAULT_OUTPUT_FILENAME = "noise_config.json"
 DEFAULT_MERGE_THRESHOLD = 0
 DEFAULT_COMBINE_SMT = False
 DEBUG = False
+PROFILE_STAGES = ("worst_case_and_average", "clean", "convert", "merge", "write")
 
 def parse_arguments():
     """
@@ -65,8 +72,96 @@ def parse_arguments():
         help="Sets if two consecutive threads from traces should be combined into one, thereby merging simultaneous multithreading (default: False)."
     )
 
+    # Optional list of merge thresholds to report the resulting number of noise events for
+    parser.add_argument(
+        "--sweep_thresholds", 
+        type=int, 
+        nargs="+", 
+        default=None, 
+        help="Merge thresholds in nanoseconds for which the number of merged noise events is printed."
+    )
+
+    # Optional flag to write the noise configuration as a binary noise schedule (defaults to JSON)
+    parser.add_argument(
+        "--binary", 
+        action="store_true", 
+        help="Write the noise configuration as a binary noise schedule instead of JSON, see noise_schedule.py."
+    )
+
+    # Optional flag to keep the average noise in a mergeable partial next to the traces (defaults to recomputing it)
+    parser.add_argument(
+        "--partial", 
+        action="store_true", 
+        help="Keep the average noise of the trace folder in a mergeable partial, see noise_average.py, and only parse traces that are not in it yet."
+    )
+
+    # Optional list of average partials of other trace folders to merge into the average
+    parser.add_argument(
+        "--merge_partials", 
+        type=str, 
+        nargs="+", 
+        default=None, 
+        help="Average partials, or trace folders containing one, to merge into the average before cleaning the worst trace. Implies --partial."
+    )
+
+    # Optional maximum number of lost events of a usable trace (defaults to using every trace)
+    parser.add_argument(
+        "--max_lost_events", 
+        type=int, 
+        default=None, 
+        help="Reject traces in which the tracer lost more events, e.g. 0 to only use complete traces (default: use every trace)."
+    )
+
+    # Optional flag to disable the parsed trace cache (defaults to using the cache)
+    parser.add_argument(
+        "--no_cache", 
+        action="store_true", 
+        help="Always re-parse trace files instead of reading and writing the parsed trace cache."
+    )
+
+    # Optional number of worker processes (defaults to one per CPU)
+    parser.add_argument(
+        "-j", "--jobs", 
+        type=int, 
+        default=None, 
+        help="Number of worker processes parsing traces (default: one per CPU)."
+    )
+
+    # Optional flag to profile every stage (defaults to no profiling)
+    parser.add_argument(
+        "--profile", 
+        action="store_true", 
+        help="Record wall time, CPU time, peak RSS and event and byte counts of every stage to a .profile.json report next to the output file."
+    )
+
+    # Optional stage to run under cProfile when profiling
+    parser.add_argument(
+        "--profile_stage", 
+        type=str, 
+        default=None, 
+        choices=PROFILE_STAGES, 
+        help="Stage to additionally run under cProfile, written next to the report. Only the work done in this process is profiled."
+    )
+
     return parser.parse_args()
 
+def plot_event_store(event_store):
+    """
+    Shows the events of every CPU as a timeline, one color per task. Only used when DEBUG is enabled,
+    so matplotlib is imported here instead of at startup.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.pyplot import cm
+
+    fig, ax = plt.subplots()
+    for cpu, task_dict in event_store.to_cpu_dict().items():
+        color = iter(cm.rainbow(np.linspace(0, 1, len(task_dict.keys()))))
+        for task, timings in task_dict.items():
+            c = next(color)
+            for timing in timings:
+                ax.barh(cpu, width=timing[1], left=timing[0], color=c)
+    plt.show()
+
 def main():
     # Parse command-line arguments
     args = parse_arguments()
@@ -75,25 +170,34 @@ def main():
     trace_path = os.path.normpath(args.trace_folder_path)
 
     # Gather all raw trace files in the specified directory
-    raw_trace_files = [file for file in os.listdir(trace_path) if file.endswith(".trace")]
+    raw_trace_files = list_trace_files(trace_path)
     raw_trace_files.sort(key=lambda file: int(file.split("-")[2]))  # Sort by trace number
 
     print(f"Number of traces: {len(raw_trace_files)}")
 
-    # Find the worst trace (one with the maximum duration)
-    worst_trace = get_worst_case_dict(raw_trace_files, trace_path, args.workload_name, args.combine_threads)
-    print(f"Worst trace duration: {worst_trace[1]}")
+    profiler = StageProfiler(args.profile or args.profile_stage is not None, args.profile_stage)
 
-    # Compute average trace to filter out inherent noise
-    average_dict = compute_average_trace(raw_trace_files, trace_path, args.workload_name, args.combine_threads)
+    # Find the worst trace (one with the maximum duration) and compute the average trace
+    # to filter out inherent noise, parsing every trace once
+    with profiler.stage("worst_case_and_average") as counters, TraceWorkers(args.jobs) as workers:
+        if args.partial or args.merge_partials:
+            worst_trace, average_dict = process_traces_incrementally(raw_trace_files, trace_path, args.workload_name, args.combine_threads, not args.no_cache, args.merge_partials, counters, workers, args.max_lost_events)
+        else:
+            worst_trace, average_dict = process_traces(raw_trace_files, trace_path, args.workload_name, args.combine_threads, not args.no_cache, counters, workers, args.max_lost_events)
+    print(f"Worst trace duration: {worst_trace[1]}")
     print(f"Average dict created")
 
     # Clean the worst trace by removing average noise
-    worst_trace = clean_worst_trace(worst_trace, average_dict)
+    with profiler.stage("clean") as counters:
+        counters["events_in"] = len(worst_trace[0])
+        worst_trace = clean_worst_trace(worst_trace, average_dict)
+        counters["events_kept"] = len(worst_trace[0])
     print(f"Cleaned worst case")
 
     # Convert worst_trace dict to noise dict
-    noise_dict = cpu_to_noise_dict(worst_trace[0],  worst_trace[1])
+    with profiler.stage("convert") as counters:
+        noise_dict = cpu_to_noise_dict(worst_trace[0],  worst_trace[1])
+        counters["events_kept"] = count_noise_dict_events(noise_dict)
     print(f"Converted to Noise dict")
 
     if DEBUG == True:
@@ -101,14 +205,32 @@ def main():
         with open("Temp_Task_dict.json", "w") as f:
             f.write(json_string)
 
+    # Report the number of injected noise events for each merge threshold in the sweep
+    if args.sweep_thresholds:
+        for merge_threshold, events in count_merged_noises(noise_dict, args.sweep_thresholds).items():
+            print(f"Merge threshold {merge_threshold}: {events} noise events")
+
     # Merge consecutive noise events into one continuous event using the provided merge threshold
-    combine_consecutive_noises(noise_dict, merge_threshold=args.merge_threshold)
+    with profiler.stage("merge") as counters:
+        counters["events_in"] = count_noise_dict_events(noise_dict)
+        combine_consecutive_noises(noise_dict, merge_threshold=args.merge_threshold)
+        counters["events_kept"] = count_noise_dict_events(noise_dict)
     print(f"Combined overlapping noise")
 
-    # Write the processed noise data to the specified output JSON file
-    json_string = json.dumps(noise_dict, indent=4) 
-    with open(args.output_filename, "w") as f:
-        f.write(json_string)
+    # Write the processed noise data to the specified output file
+    with profiler.stage("write") as counters:
+        if args.binary:
+            write_binary_schedule(noise_dict, args.output_filename)
+        else:
+            json_string = json.dumps(noise_dict, indent=4) 
+            with open(args.output_filename, "w") as f:
+                f.write(json_string)
+        counters["bytes_written"] = os.path.getsize(args.output_filename)
+
+    if profiler.enabled:
+        profile_filename = os.path.splitext(args.output_filename)[0] + ".profile.json"
+        profiler.write_report(profile_filename)
+        print(f"Profile written to {profile_filename}")
 
 def combine_consecutive_noises(noise_dict, merge_threshold=0):
     """
@@ -123,79 +245,217 @@ def combine_consecutive_noises(noise_dict, merge_threshold=0):
         dict: Updated noise_dict with merged noise events.
     """
     for cpu, noises in noise_dict.items():
-        combined_noises = []
-        next_start = -1
-        next_duration = -1
-        max_prio = 99
-
-        for (start, duration, priority) in noises:
-            # If no previous noise to combine, start a new combined event
-            if next_start == -1:
-                next_start = start
-                next_duration = duration
-                max_prio = priority
-            else:
-                # If the current noise is close to the previous one, combine them
-                if next_start + next_duration + merge_threshold >= start:
-                    next_duration += duration + max(start - (next_start + next_duration), 0)
-                    max_prio = priority if priority<max_prio else max_prio
-                else:
-                    # No overlap, add the previous noise event and reset
-                    # Only include if above merge threshold in duration
-                    if next_duration > merge_threshold:
-                        combined_noises.append((next_start, next_duration, max_prio))
+        combined_noises = merge_noise_arrays(*noise_list_to_arrays(noises), merge_threshold=merge_threshold)
+        noise_dict[cpu] = list(zip(*(column.tolist() for column in combined_noises)))
 
-                    next_start = start
-                    next_duration = duration
-                    max_prio = priority
+    return noise_dict
+
+def noise_list_to_arrays(noises):
+    """
+    Splits a list of (start, duration, priority) noise events into start, duration and priority arrays.
+    """
+    columns = np.array(noises, dtype=np.int64).reshape(-1, 3)
+    return columns[:, 0], columns[:, 1], columns[:, 2]
 
+def merge_noise_arrays(start, duration, priority, merge_threshold=0):
+    """
+    Merges consecutive or closely spaced noise occurrences on one CPU into single continuous events.
+    A noise that starts before the previous one has ended continues after it, so merged noises
+    last for the sum of their durations plus the gaps between them.
 
-        # Add the last combined noise event
-        combined_noises.append((next_start, next_duration, max_prio))
-        noise_dict[cpu] = combined_noises
+    Args:
+        start (np.ndarray): Start times (ns) of the noises, sorted in ascending order.
+        duration (np.ndarray): Durations (ns) of the noises.
+        priority (np.ndarray): Priorities of the noises.
+        merge_threshold (int): Time gap (in nanoseconds) within which two noises are considered close enough to merge.
 
-    return noise_dict
+    Returns:
+        tuple: Start, duration and priority arrays of the merged noises. 
+            Merged noises that are not longer than merge_threshold are dropped, except for the last one.
+    """
+    if len(start) == 0:
+        return np.array([-1]), np.array([-1]), np.array([99])
+
+    # End of each noise when it runs after all earlier noises of its merged event:
+    # end[k] = max over j <= k of (start[j] + duration[j] + ... + duration[k])
+    cum_duration = np.cumsum(duration)
+    end = cum_duration + np.maximum.accumulate(start - (cum_duration - duration))
+
+    # A new event starts when a noise is further than merge_threshold from the end of the previous one
+    new_event = np.ones(len(start), dtype=bool)
+    new_event[1:] = start[1:] > end[:-1] + merge_threshold
+    first = np.flatnonzero(new_event)
+    last = np.append(first[1:] - 1, len(start) - 1)
+
+    merged_start = start[first]
+    merged_duration = end[last] - merged_start
+    merged_priority = np.minimum.reduceat(priority, first)
+
+    # Only include events above merge threshold in duration, the last event is always kept
+    keep = merged_duration > merge_threshold
+    keep[-1] = True
+    return merged_start[keep], merged_duration[keep], merged_priority[keep]
+
+def count_merged_noises(noise_dict, merge_thresholds):
+    """
+    Counts the noise events that remain after merging with each of the given merge thresholds.
+
+    Args:
+        noise_dict (dict): Dictionary mapping CPU IDs to lists of noise events (start time, duration, priority).
+        merge_thresholds [int]: Merge thresholds (ns) to evaluate.
+
+    Returns:
+        dict: Total number of noise events over all CPUs for each merge threshold.
+    """
+    noise_arrays = [noise_list_to_arrays(noises) for noises in noise_dict.values()]
+    return {
+        merge_threshold: sum(len(merge_noise_arrays(*arrays, merge_threshold=merge_threshold)[0]) for arrays in noise_arrays)
+        for merge_threshold in merge_thresholds
+    }
+
+def count_noise_dict_events(noise_dict):
+    """
+    Counts the noise events of all CPUs in a noise dict.
+    """
+    return sum(len(noises) for noises in noise_dict.values())
 
 
-# Converts a cpu dict "dict(dict(list(tuple)))" to a noise dict dict(list(tuple)).
-def cpu_to_noise_dict(cpu_dict, workload_end):
+# Converts an event store to a noise dict dict(list(tuple)).
+def cpu_to_noise_dict(event_store, workload_end):
     """
-    Converts a cpu dict "dict(dict(list(tuple)))" to a noise dict "dict(list(tuple))".
+    Converts an event store to a noise dict "dict(list(tuple))".
 
     Args:
-        cpu_dict (dict): Dictionary of CPU traces with tasks and timings.
+        event_store (EventStore): The noise events of each CPU and task.
         workload_end (int): Time when workload is finished.
 
     Returns:
         noise_dict (dict): A dictionary of noise traces for each CPU.
     """
     noise_dict = dict()
-    workload_exec = []
-
-    for cpu, tasks in cpu_dict.items():
-        noise = []
-        for task, timing_list in tasks.items():
-                noise.extend(timing_list) # Collect noise timings
 
-        # Sort noise timings for this CPU
-        noise_dict[cpu] = sorted(noise, key=lambda tup: tup[0])
+    for cpu in event_store.cpus():
+        # Sort noise timings of all tasks for this CPU, ties keep the task order
+        events = event_store.cpu_events(cpu)
+        order = np.argsort(events["start"], kind="stable")
+        noise_dict[cpu] = list(zip(events["start"][order].tolist(), events["duration"][order].tolist(), events["priority"][order].tolist()))
         # Append end noise when workload finished. Used to sync looping during noise injection
         noise_dict[cpu].append((workload_end, 0, 0))
 
-    workload_exec.sort(key=lambda tup: tup[0])
     return noise_dict
 
+class NoiseRemovalOrder:
+    """
+    Removal order of the noises of one task on one CPU.
+
+    Noises are kept in a linked list sorted on their absolute difference to the average duration.
+    Reduced noises stay at their position in the list, so the noise offered for removal is the
+    last entry of the strictly decreasing run at the front of the list. Durations are updated in a
+    list and written back to the event store view by write_back.
+    """
+
+    def __init__(self, durations, avg_duration):
+        self.durations = durations
+        self.values = durations.tolist()
+        self.avg_duration = avg_duration
+        abs_diff = np.abs(durations - avg_duration)
+        self.order = np.argsort(abs_diff, kind="stable").tolist()
+        self.abs_diff = abs_diff[self.order].tolist()
+        self.next = list(range(1, len(self.order))) + [-1]
+        self.prev = list(range(-1, len(self.order) - 1))
+        self.head = 0
+        self.closest = self.follow_run(self.head)
+
+    def follow_run(self, pos):
+        """
+        Follows the strictly decreasing run starting at pos and returns the position of its last entry.
+        """
+        while self.next[pos] != -1 and self.abs_diff[self.next[pos]] < self.abs_diff[pos]:
+            pos = self.next[pos]
+        return pos
+
+    def remove_closest(self):
+        """
+        Subtracts the average duration from the closest noise, removing it if it is shorter than the average.
+
+        Returns:
+            bool: False once no noise is left.
+        """
+        pos = self.closest
+        idx = self.order[pos]
+        duration = self.values[idx]
+        prev_pos = self.prev[pos]
+
+        if duration - self.avg_duration < 0:
+            self.values[idx] = 0
+            # Unlink and continue the run from the previous entry
+            next_pos = self.next[pos]
+            if next_pos != -1:
+                self.prev[next_pos] = prev_pos
+            if prev_pos != -1:
+                self.next[prev_pos] = next_pos
+                self.closest = self.follow_run(prev_pos)
+            elif next_pos != -1:
+                self.head = next_pos
+                self.closest = self.follow_run(next_pos)
+            else:
+                return False
+        else:
+            self.values[idx] = duration - self.avg_duration
+            self.abs_diff[pos] = abs(duration - 2 * self.avg_duration)
+            # The run ends before this noise if it grew past its predecessor
+            if prev_pos != -1 and self.abs_diff[pos] >= self.abs_diff[prev_pos]:
+                self.closest = prev_pos
+            else:
+                self.closest = self.follow_run(pos)
+        return True
+
+    def write_back(self):
+        self.durations[:] = self.values
+
+def subtract_average_noise(task_durations, occurences, avg_duration):
+    """
+    Subtracts the average duration of a task from its noises, occurences times, across all CPUs.
+    Each time the globally closest noise is reduced, ties are broken on the lowest CPU ID.
+    Removed noises are left with a duration of 0.
+
+    Args:
+        task_durations (dict): Maps CPU IDs to a view of the durations of the task. Updated in place.
+        occurences (int): Number of average noises to remove.
+        avg_duration (int): Average duration of a single noise of the task.
+    """
+    # Subtracting a zero average never changes a noise
+    if avg_duration == 0:
+        return
+
+    removal_orders = {cpu: NoiseRemovalOrder(durations, avg_duration) for cpu, durations in task_durations.items() if len(durations)}
+    heap = [(order.abs_diff[order.closest], cpu) for cpu, order in removal_orders.items()]
+    heapq.heapify(heap)
+
+    for x in range(occurences):
+        if not heap:
+            break
+        cpu = heap[0][1]
+        order = removal_orders[cpu]
+        if order.remove_closest():
+            heapq.heapreplace(heap, (order.abs_diff[order.closest], cpu))
+        else:
+            heapq.heappop(heap)
+
+    for order in removal_orders.values():
+        order.write_back()
+
 def clean_worst_trace(worst_trace, average_dict):
     """
     Removes the inherent average noise from the worst trace.
 
     Args:
-        worst_trace (dict, duration): The trace data for the worst trace (with CPU task timings).
+        worst_trace (EventStore, duration): The trace data for the worst trace (with CPU task timings).
         average_dict (dict): The average trace data to filter out from the worst trace.
     """
 
     #cpu_amount = len(worst_trace[0])
-    cpus = sorted(list(worst_trace[0].keys()))
+    cpus = sorted(worst_trace[0].cpus())
     cpu_amount = len(cpus)
 
     # Calculate global average frequency and duration
@@ -210,102 +470,23 @@ def clean_worst_trace(worst_trace, average_dict):
 
     # Remove average noise from worst_trace
     for task, (occurences, avg_duration) in global_avg.items():
-        # Create list of average noise removal order
-        abs_timings = [() for x in range(cpus[len(cpus)-1]+1)]
-        for cpu in cpus:
-            if task in worst_trace[0][cpu]:
-                abs_timings[cpu] = sorted(enumerate(worst_trace[0][cpu][task]), key=lambda x: abs(x[1][1]-avg_duration))
-
-        rem_dur = 0
         # Remove (avg freq * worst case trace timeframe) instances from trace
-        for x in range(occurences):
-            global_closest_idx = -1
-            global_closest_cpu = -1
-            global_closest_abs = -1
-            global_closest_local_idx = -1
-            
-            # Find closest matching noise globally
-            for cpu in cpus:
-                closest_idx = -1
-                closest_abs = -1
-                closest_local_idx = -1
-                # Iterate over abs_timing until absolute difference increases, signaling closest entry has been reached
-                for (local_idx, (idx, (_, dur, _))) in enumerate(abs_timings[cpu]):
-                    if closest_idx == -1 or abs(dur - avg_duration) < closest_abs:
-                        closest_abs = abs(dur - avg_duration)
-                        closest_idx = idx
-                        closest_local_idx = local_idx
-                    else:
-                        break
-                
-                # If found noise is closer then set it as global closest noise
-                if closest_idx > -1 and (global_closest_cpu == -1 or (
-                    global_closest_abs > closest_abs
-                    )):
-                    global_closest_idx = closest_idx
-                    global_closest_cpu = cpu
-                    global_closest_abs = closest_abs
-                    global_closest_local_idx = closest_local_idx
-            
-            # Adjust or remove the closest matching entry
-            if global_closest_cpu != -1:
-                start, duration, priority = worst_trace[0][global_closest_cpu][task][global_closest_idx]
-                if duration - avg_duration < 0:
-                    worst_trace[0][global_closest_cpu][task][global_closest_idx] = (start, 0, priority)
-                    abs_timings[global_closest_cpu] = (
-                        abs_timings[global_closest_cpu][:global_closest_local_idx] + 
-                        abs_timings[global_closest_cpu][global_closest_local_idx + 1:]
-                    )
-                    # Increase amount of excess duration accumualted
-                    rem_dur += avg_duration - duration
-                else:
-                    worst_trace[0][global_closest_cpu][task][global_closest_idx] = (start, duration - avg_duration, priority)
-                    abs_timings[global_closest_cpu][global_closest_local_idx] = (abs_timings[global_closest_cpu][global_closest_local_idx][0], (start, duration - avg_duration, priority))
-
-        ## Remove smallest noises with the excess gathered when removing noises smaller than avg_duration
-        #sorted_timings = [] #[(cpu, (idx, (start, dur)))]
-        #for cpu in range(cpu_amount):
-        #    sorted_timings.extend([(cpu, x) for x in abs_timings[cpu]])
-#
-        #sorted_timings = sorted(sorted_timings, key=lambda x: x[1][1][1])
-        #i = 0
-        ## Remove/ reduce smallest noises of this task with the acummulated excess duration
-        #while rem_dur>0 and i<len(sorted_timings):
-        #    cpu = sorted_timings[i][0]
-        #    idx = sorted_timings[i][1][0]
-        #    # Consume excess duration
-        #    if worst_trace[0][cpu][task][idx][1] - rem_dur >= 0:
-        #        worst_trace[0][cpu][task][idx] = (worst_trace[0][cpu][task][idx][0], worst_trace[0][cpu][task][idx][1] - rem_dur)
-        #        rem_dur = 0
-        #    else: #Reduce excess duration
-        #        worst_trace[0][cpu][task][idx] = (worst_trace[0][cpu][task][idx][0], 0)
-        #        rem_dur = rem_dur - worst_trace[0][cpu][task][idx][1]
-        #    i+=1
-
-        # Filter out noise with duration of 0
-        for cpu in cpus:
-            if task in worst_trace[0][cpu]:
-                worst_trace[0][cpu][task] = [x for x in worst_trace[0][cpu][task] if x[1] != 0]
+        task_durations = {cpu: worst_trace[0].view(cpu, task)["duration"] for cpu in cpus if worst_trace[0].has(cpu, task)}
+        subtract_average_noise(task_durations, occurences, avg_duration)
+
+    # Filter out noise with duration of 0
+    worst_trace[0].remove_zero_durations(global_avg.keys())
 
     if DEBUG == True:
         task_duration_dict = dict()
-        for cpu, task_dict in worst_trace[0].items():
-            for task, timings in task_dict.items():
-                for timing in timings:
-                    task_duration_dict[task][cpu] = task_duration_dict.setdefault(task, dict()).setdefault(cpu, 0) + timing[1]
+        for cpu, task, events in worst_trace[0].items():
+            task_duration_dict.setdefault(task, dict())[cpu] = int(events["duration"].sum())
 
         json_string = json.dumps(task_duration_dict, indent=4) 
         with open("temp_task_duration_dict.json", "w") as f:
             f.write(json_string)
 
-        fig, ax = plt.subplots()    
-        for cpu, task_dict in worst_trace[0].items():
-            color = iter(cm.rainbow(np.linspace(0, 1, len(task_dict.keys()))))
-            for task, timings in task_dict.items():
-                c = next(color)
-                for timing in timings:
-                    ax.barh(cpu, width=timing[1], left=timing[0], color=c)
-        plt.show()
+        plot_event_store(worst_trace[0])
 
     return worst_trace        
 
@@ -338,40 +519,78 @@ def clean_worst_trace(worst_trace, average_dict):
     #                worst_trace[0][cpu][task][closest_idx] = (closest_timing, closest_duration - avg_duration)
 
 #Used for multiprocessed map call
-def get_frequency_duration_dict(file, trace_path, workload_name, combine_threads=False):
+def get_trace_sums(file, trace_path, workload_name, use_cache=True, stamp=False, max_lost_events=None):
     """
-    Produces a dictionary consisting of the frequency of a 
-    task and the total duration on each present CPUs
-        
+    Produces the number of events and the total duration of every task
+    on each present CPU of a trace
+
     Args:
         file (str): The trace file name.
         trace_path (str): The path to the directory containing the trace files.
         workload_name (str): The name of the task representing the workload.
-        combine_threads (bool): Controls whether or not two consecutive threads should be merged into one thread. 
-            Use when traces were gathered on machine with SMT enabled
+        use_cache (bool): Controls whether the parsed trace cache is used.
+        stamp (bool): Controls whether the file stamp of the trace is computed, see AveragePartial.
+        max_lost_events (int): Traces that lost more events are rejected, see is_rejected.
 
     Returns:
-        dict: A dictionary containing the frequency and duration for each CPU and task.
+        tuple: The trace file name, the workload duration, the count and duration
+            dictionary of the trace as returned by trace_sums or None if the trace is rejected,
+            the file stamp of the trace or None and the number of lost events.
     """
-    trace  = get_cpu_dict(file, trace_path, workload_name)
-    #f_d_dict: dict[int, dict[str, (int, int)]]
-    f_d_dict = dict()
-    for cpu, tasks in trace[0].items():
-        for task, timings in tasks.items():
-            for timing in timings:
-                duration = timing[1]
-                old_val = f_d_dict.setdefault(cpu, {}).setdefault(task, (0, 0))
-                #Increment occurence amount and add to total duration of this task
-                f_d_dict[cpu][task] = (old_val[0]+1, old_val[1]+duration)
+    trace = load_trace(file, trace_path, use_cache, workload_name)
+    trace_stamp = file_stamp(os.path.join(trace_path, file)) if stamp else None
+    if is_rejected(trace.lost_events, max_lost_events):
+        return (file, trace.total_duration, None, trace_stamp, trace.lost_events)
+    sums = trace_sums(trace.to_event_store(workload_name))
+    return (file, trace.total_duration, sums, trace_stamp, trace.lost_events)
+
+def is_rejected(lost_events, max_lost_events=None):
+    """
+    Checks whether a trace lost too many events to be used. Traces are never rejected without a maximum.
+    """
+    return max_lost_events is not None and lost_events > max_lost_events
 
-            #Convert task occurences to frequency of task
-            if cpu in f_d_dict:
-                if task in f_d_dict[cpu]:
-                    f_d_dict[cpu][task] = (f_d_dict[cpu][task][0] / trace[1], f_d_dict[cpu][task][1])
+def report_lost_events(file, lost_events, max_lost_events=None):
+    """
+    Prints a warning for a trace that lost events, and whether it is rejected for it.
+    """
+    if is_rejected(lost_events, max_lost_events):
+        print(f"Rejected {file}: {lost_events} events lost")
+    elif lost_events > 0:
+        print(f"Warning: {file} lost {lost_events} events")
 
-    return f_d_dict
+def update_average_partial(average, raw_trace_files, trace_path, workload_name, use_cache=True, stamp=False, workers=None, max_lost_events=None):
+    """
+    Adds traces to a mergeable average, parsing only the given traces.
 
-def compute_average_trace(raw_trace_files, trace_path, workload_name, combine_threads=False):
+    Args:
+        average (AveragePartial): The average to add the traces to.
+        raw_trace_files [str]: List of trace files to be added.
+        trace_path (str): The path to the directory containing the trace files.
+        workload_name (str): The name of the task representing the workload.
+        use_cache (bool): Controls whether the parsed trace cache is used.
+        stamp (bool): Controls whether the file stamps of the traces are recorded, needed when the average is saved.
+        workers (TraceWorkers): Worker pool to use. A pool is created for this call if not given.
+        max_lost_events (int): Traces that lost more events are not added, see is_rejected.
+
+    Returns:
+        AveragePartial: The updated average.
+    """
+    if workers is None:
+        with TraceWorkers() as workers:
+            return update_average_partial(average, raw_trace_files, trace_path, workload_name, use_cache, stamp, workers, max_lost_events)
+
+    summaries = workers.pool.imap(partial(get_trace_sums, trace_path=trace_path, workload_name=workload_name, use_cache=use_cache,
+                                          stamp=stamp, max_lost_events=max_lost_events), raw_trace_files)
+    for file, total_duration, sums, trace_stamp, lost_events in summaries:
+        report_lost_events(file, lost_events, max_lost_events)
+        if sums is not None:
+            average.add(os.path.join(trace_path, file), total_duration, sums, trace_stamp)
+        else:
+            average.reject(os.path.join(trace_path, file), lost_events, trace_stamp)
+    return average
+
+def compute_average_trace(raw_trace_files, trace_path, workload_name, combine_threads=False, use_cache=True, workers=None, max_lost_events=None):
     """
     Produces a dictionary consisting of the average frequency of a 
     task and the average duration on each present thread
@@ -382,34 +601,214 @@ def compute_average_trace(raw_trace_files, trace_path, workload_name, combine_th
         workload_name (str): The name of the task representing the workload.
         combine_threads (bool): Controls whether or not two consecutive threads should be merged into one thread. 
             Use when traces were gathered on machine with SMT enabled
+        use_cache (bool): Controls whether the parsed trace cache is used.
+        workers (TraceWorkers): Worker pool to use. A pool is created for this call if not given.
+        max_lost_events (int): Traces that lost more events are left out, see is_rejected.
 
     Returns:
         dict: A dictionary containing the average frequency and durations for each CPU and task.
     """
+    average = update_average_partial(AveragePartial(workload_name), raw_trace_files, trace_path, workload_name, use_cache,
+                                     workers=workers, max_lost_events=max_lost_events)
+    return average.average()
 
-    #Get frequency and duration of tasks on all cpus on all traces
-    pool = Pool()
-    f_d_list = pool.starmap(get_frequency_duration_dict, [(file, trace_path, workload_name, combine_threads) for file in raw_trace_files])
-    
-    average_dict: dict[int, dict[str, (int, int)]]
-    average_dict = dict()
+# Longest workload duration seen by any worker of the single pass pipeline
+worst_duration = None
+# Folder workers write parsed traces without a cache file to
+scratch_folder = None
+
+def init_trace_worker(shared_worst_duration, shared_scratch_folder):
+    global worst_duration, scratch_folder
+    worst_duration = shared_worst_duration
+    scratch_folder = shared_scratch_folder
+
+class TraceWorkers:
+    """
+    One bounded pool of worker processes shared by the parallel stages.
+
+    Workers hand parsed traces back as the path of a memory-mapped cache file, see share_trace,
+    instead of pickling their events. Traces without a cache file are written to a scratch
+    folder that is removed together with the pool.
+    """
+
+    def __init__(self, jobs=None):
+        self.scratch = tempfile.TemporaryDirectory(prefix="traces_to_noise_config-")
+        self.worst_duration = Value("q", -1)
+        self.pool = Pool(jobs, initializer=init_trace_worker, initargs=(self.worst_duration, self.scratch.name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.scratch.cleanup()
+
+    def receive(self, shared_trace, keep=True):
+        """
+        Memory-maps a trace shared by a worker if keep is set. Scratch files are removed right away,
+        the mapping stays valid until the trace is released.
+        """
+        trace = open_shared_trace(shared_trace) if keep else None
+        if os.path.dirname(shared_trace) == self.scratch.name:
+            os.remove(shared_trace)
+        return trace
+
+#Used for multiprocessed map call
+def get_trace_summary(file, trace_path, workload_name, use_cache=True, max_lost_events=None):
+    """
+    Parses a trace once and summarises it for the single pass pipeline.
+    The parsed events are only shared when the trace is at least as long as the
+    worst trace seen so far, so the parent never maps more than a few candidate traces.
+
+    Args:
+        file (str): The trace file name.
+        trace_path (str): The path to the directory containing the trace files.
+        workload_name (str): The name of the task representing the workload.
+        use_cache (bool): Controls whether the parsed trace cache is used.
+        max_lost_events (int): Traces that lost more events are rejected, see is_rejected.
+
+    Returns:
+        tuple: The trace file name, the workload duration, the count and duration
+            dictionary of the trace as returned by trace_sums or None if the trace is rejected,
+            the shared trace path if it is a worst case candidate, otherwise None,
+            and the number of events parsed, kept and lost and input bytes of the trace.
+    """
+    trace = load_trace(file, trace_path, use_cache, workload_name)
+    counts = {
+        "events_parsed": len(trace),
+        "events_kept": 0,
+        "events_lost": trace.lost_events,
+        "input_bytes": os.path.getsize(os.path.join(trace_path, file)) +
+            os.path.getsize(os.path.join(trace_path, benchout_path(file))),
+    }
+    if is_rejected(trace.lost_events, max_lost_events):
+        return (file, trace.total_duration, None, None, counts)
+
+    event_store = trace.to_event_store(workload_name)
+    counts["events_kept"] = len(event_store)
+    sums = trace_sums(event_store)
+
+    with worst_duration.get_lock():
+        is_candidate = trace.total_duration >= worst_duration.value
+        if is_candidate:
+            worst_duration.value = trace.total_duration
+
+    return (file, trace.total_duration, sums, share_trace(trace, scratch_folder) if is_candidate else None, counts)
+
+def process_traces(raw_trace_files, trace_path, workload_name, combine_threads=False, use_cache=True, counters=None, workers=None, max_lost_events=None):
+    """
+    Finds the worst-case trace and computes the average trace in a single pass over the trace files.
+    Every trace is parsed once and the results are streamed back in trace order.
 
-    # Accumulate frequency and duration of all tasks in traces
-    for f_d_dict in f_d_list:
-        for cpu, tasks in f_d_dict.items():
-            for task, (frequency, duration) in tasks.items():
-                old_val = average_dict.setdefault(cpu, {}).setdefault(task, (0, 0))
-                average_dict[cpu][task] = (old_val[0]+frequency, old_val[1]+duration)
+    Args:
+        raw_trace_files [str]: List of trace files to be evaluated.
+        trace_path (str): The path to the directory containing the trace files.
+        workload_name (str): The name of the task representing the workload.
+        combine_threads (bool): Controls whether or not two consecutive threads should be merged into one thread. 
+            Use when traces were gathered on machine with SMT enabled
+        use_cache (bool): Controls whether the parsed trace cache is used.
+        counters (dict): If given, the number of events parsed, kept within the workload
+            windows and lost and the input bytes of all traces are added to it.
+        workers (TraceWorkers): Worker pool to use. A pool is created for this call if not given.
+        max_lost_events (int): Traces that lost more events are left out of both the worst case and
+            the average, see is_rejected.
 
-    # Calculate the average frequency and duration for each task on each CPU
-    for cpu, tasks in average_dict.items():
-        for task, (frequency, duration) in tasks.items():
-            average_dict[cpu][task] = (float(frequency/len(raw_trace_files)), int(duration//len(raw_trace_files)))
-    return average_dict
+    Returns:
+        tuple: The worst trace as returned by get_worst_case_dict and the average dictionary
+            as returned by compute_average_trace.
+    """
+    if workers is None:
+        with TraceWorkers() as workers:
+            return process_traces(raw_trace_files, trace_path, workload_name, combine_threads, use_cache, counters, workers, max_lost_events)
+
+    average = AveragePartial(workload_name)
+    worst_case_file = None
+    worst_case_trace = None
+
+    workers.worst_duration.value = -1
+    summaries = workers.pool.imap(partial(get_trace_summary, trace_path=trace_path, workload_name=workload_name, use_cache=use_cache,
+                                          max_lost_events=max_lost_events), raw_trace_files)
+    for file, total_duration, sums, shared_trace, counts in summaries:
+        if counters is not None:
+            for counter, count in counts.items():
+                counters[counter] = counters.get(counter, 0) + count
+        report_lost_events(file, counts["events_lost"], max_lost_events)
+        if sums is None:
+            continue
+        average.add(os.path.join(trace_path, file), total_duration, sums)
+        # Keep the first trace with the longest duration, matching max()
+        if shared_trace is not None:
+            is_worst = worst_case_trace is None or total_duration > worst_case_trace.total_duration
+            trace = workers.receive(shared_trace, keep=is_worst)
+            if is_worst:
+                worst_case_file = file
+                worst_case_trace = trace
+    print(worst_case_file)
+    if worst_case_trace is None:
+        print("Every trace was rejected")
+        sys.exit(1)
+
+    worst_trace = (worst_case_trace.to_event_store(workload_name, combine_threads), worst_case_trace.total_duration)
+    remove_workload(worst_trace, workload_name)
+
+    return worst_trace, average.average()
+
+def process_traces_incrementally(raw_trace_files, trace_path, workload_name, combine_threads=False, use_cache=True, merge_partials=None, counters=None, workers=None, max_lost_events=None):
+    """
+    Finds the worst-case trace and computes the average trace from the average partial saved in the trace folder.
+    Only traces that are not in the partial yet are parsed and added, after which the partial is saved again.
+    The partial is rebuilt if an averaged trace was changed or removed.
+
+    Args:
+        raw_trace_files [str]: List of trace files to be evaluated.
+        trace_path (str): The path to the directory containing the trace files.
+        workload_name (str): The name of the task representing the workload.
+        combine_threads (bool): Controls whether or not two consecutive threads should be merged into one thread. 
+            Use when traces were gathered on machine with SMT enabled
+        use_cache (bool): Controls whether the parsed trace cache is used.
+        merge_partials [str]: Average partials of other trace folders, or folders containing one, merged
+            into the average. The worst trace is the worst trace of all merged partials.
+        counters (dict): If given, the number of traces added to the partial is added to it.
+        workers (TraceWorkers): Worker pool to use. A pool is created for this call if not given.
+        max_lost_events (int): New traces that lost more events are not added, see is_rejected.
 
-def get_cpu_dict(file, trace_path, workload_name, combine_threads=False):
+    Returns:
+        tuple: The worst trace as returned by get_worst_case_dict and the average dictionary
+            as returned by compute_average_trace.
+    """
+    if workers is None:
+        with TraceWorkers() as workers:
+            return process_traces_incrementally(raw_trace_files, trace_path, workload_name, combine_threads, use_cache, merge_partials, counters, workers, max_lost_events)
+
+    average = open_partial(trace_path, workload_name)
+    averaged = len(average)
+    # Traces rejected before, e.g. by the trace watcher, are not parsed again unless they changed
+    rejected = [file for file in raw_trace_files if average.was_rejected(os.path.join(trace_path, file), max_lost_events)]
+    new_files = [file for file in raw_trace_files if os.path.join(trace_path, file) not in average and file not in rejected]
+    print(f"Adding {len(new_files)} traces to the average partial of {averaged} traces, {len(rejected)} traces were rejected before")
+    update_average_partial(average, new_files, trace_path, workload_name, use_cache, True, workers, max_lost_events)
+    save_partial(average, trace_path)
+    if counters is not None:
+        counters["traces_added"] = counters.get("traces_added", 0) + len(average) - averaged
+
+    for other in merge_partials or []:
+        average.merge(load_partial(other))
+    print(average.worst)
+    if average.worst is None:
+        print("Every trace was rejected")
+        sys.exit(1)
+
+    worst_trace = get_event_store(os.path.basename(average.worst), os.path.dirname(average.worst), workload_name, combine_threads, use_cache)
+    return remove_workload(worst_trace, workload_name), average.average()
+
+def get_event_store(file, trace_path, workload_name, combine_threads=False, use_cache=True):
     """
     Parses a trace file and extracts relevant information for CPU traces.
+    Parsed traces are cached next to the trace file, see trace_cache.py.
 
     Args:
         file (str): The trace file name.
@@ -417,86 +816,18 @@ def get_cpu_dict(file, trace_path, workload_name, combine_threads=False):
         workload_name (str): The name of the task representing the workload.
         combine_threads (bool): Controls whether or not two consecutive threads should be merged into one thread. 
             Use when traces were gathered on machine with SMT enabled
+        use_cache (bool): Controls whether the parsed trace cache is used.
 
     Returns:
-        tuple: A tuple containing a dictionary of CPU traces and the total duration.
-    """
-    # Define regular expressions for matching the total duration and the second start time
-    duration_re = re.compile(r"Total Duration: (\d+\.\d+) seconds")
-
-    # Define Regex for matching traces
-    trace_regex = re.compile(
-        r"\[(\d{3})\]"                      # Capture CPU ID (three digits inside square brackets)
-        r".*?:\s(.*noise):\s*"                     # Lazily match everything up to 'noise:'
-        r"([^:]*[\/\w\-:]*|)"               # Capture the task name
-        r"\s+start\s+"                      # Match 'start' keyword with spaces
-        r"(\d+\.\d+)"                       # Capture the start time (floating-point number)
-        r"\s+duration\s+"                   # Match 'duration' keyword with spaces
-        r"(\d+)\s+ns"                       # Capture the duration (integer followed by 'ns')
-    )
+        tuple: A tuple containing the event store of the CPU traces and the total duration.
+    """
+    if is_trace_file(file):
+        trace = load_trace(file, trace_path, use_cache, workload_name)
 
-    # Initialize variables to store the extracted values from benchout
-    total_duration = -1
+        #Events of every CPU and task, sorted on start time with unneccessary noise removed
+        event_store = trace.to_event_store(workload_name, combine_threads)
 
-    if file.endswith(".trace"):
-        # Read total duration from .benchout file
-        with open(os.path.join(trace_path, file.replace(".trace", ".benchout")), "r") as lines:
-            for line in lines:
-                if (match := duration_re.match(line)):
-                    total_duration = int(match.group(1).replace(".", ""))
-    
-        #Dict(CPU,Dict(task,[(start,duration)]))
-        cpu_dict: dict[int, dict[str, list[(int, int)]]]#= dict({'NULL': dict({'NULL': []})})
-        cpu_dict = dict()
-        # Parse trace file
-        workload_start_time = -1
-        with open(os.path.join(trace_path, file), "r") as lines:
-            for line in lines:
-                if (match := trace_regex.search(line)):
-                    cpu_id = int(match[1])                      # CPU ID
-                    #TODO: Alter priority selection to be process name dependent instead. 
-                    #      Example: Check against JSON file and set priority from matching process name 
-                    if match[2] == "thread_noise":              # Set task priority
-                        priority = 0
-                    else:
-                        priority = -1
-                    task = match[3].rsplit(":",1)[0] or "nmi"   # Task name
-                    start = int(match[4].replace(".", ""))          # Start Time (ns)
-                    duration = int(match[5])                    # Duration (ns)
-                    if (task == workload_name and (workload_start_time == -1 or workload_start_time > start) ):
-                        workload_start_time = start
-                    #Store to cpu_dict and combine threads if this is enabled to remove SMT threads
-                    if combine_threads:
-                        cpu_dict.setdefault(cpu_id-(cpu_id%2), {}).setdefault(task, []).append((start, duration, priority))
-                    else:
-                        cpu_dict.setdefault(cpu_id, {}).setdefault(task, []).append((start, duration, priority))
-
-        m_cpu_dict: dict[int, dict[str, list[(int, int, int)]]]#= dict({'NULL': dict({'NULL': list(tuple(start,dur,prio))})})
-        m_cpu_dict = dict()
-
-        #Sort all tasks based on start time and remove unneccesary noise
-        for cpu, tasks in cpu_dict.items():
-            for task, timings in tasks.items():
-                #Remove unneccessary noise before workload window and set time instant 0 to workload start time
-                if workload_start_time >= 0:
-                    adjusted_timings = list()
-                    for timing in timings:
-                        start = timing[0]
-                        duration = timing[1]
-                        priority = timing[2]
-                        # Noise started after workload and before end
-                        if start >= workload_start_time and start<=workload_start_time+total_duration:
-                            adjusted_timings.append((start-workload_start_time, duration, priority))
-                        # Noise started before workload but stretches past workload start
-                        elif (start+duration) > workload_start_time and start<=workload_start_time+total_duration:
-                            adjusted_timings.append((0, (start+duration)-workload_start_time, priority))
-                else:
-                    print("No workload found in trace")
-                    exit(1)
-                m_cpu_dict.setdefault(cpu, {}).setdefault(task, [])
-                m_cpu_dict[cpu][task] = sorted(adjusted_timings, key=lambda x: x[0])
-
-        return (m_cpu_dict, total_duration)
+        return (event_store, trace.total_duration)
 
 #Used for multiprocessed map call
 def get_file_duration_tuple(file, trace_path):
@@ -510,15 +841,9 @@ def get_file_duration_tuple(file, trace_path):
     Returns:
         tuple: A tuple containing the trace file name and the associated workload duration.
     """
-    # Define regular expressions for matching the total duration and the second start time
-    duration_re = re.compile(r"Total Duration: (\d+\.\d+) seconds")
-    with open(os.path.join(trace_path, file.replace(".trace", ".benchout")), "r") as lines:
-                    for line in lines:
-                        if (match := duration_re.match(line)):
-                            total_duration = int(match.group(1).replace(".", ""))
-                    return (file, total_duration)
+    return (file, read_total_duration(os.path.join(trace_path, benchout_path(file))))
     
-def get_worst_case_dict(raw_trace_files, trace_path, workload_name, combine_threads=False):
+def get_worst_case_dict(raw_trace_files, trace_path, workload_name, combine_threads=False, use_cache=True, workers=None):
     """
     Finds and fetches the dictionary of the trace with worst-case duration
     
@@ -528,44 +853,46 @@ def get_worst_case_dict(raw_trace_files, trace_path, workload_name, combine_thre
         workload_name (str): The name of the task representing the workload.
         combine_threads (bool): Controls whether or not two consecutive threads should be merged into one thread. 
             Use when traces were gathered on machine with SMT enabled
+        use_cache (bool): Controls whether the parsed trace cache is used.
+        workers (TraceWorkers): Worker pool to use. A pool is created for this call if not given.
             
     Returns:
-        tuple: A tuple containing a dictionary of CPU traces and the total duration.
+        tuple: A tuple containing the event store of the CPU traces and the total duration.
     """
+    if workers is None:
+        with TraceWorkers() as workers:
+            return get_worst_case_dict(raw_trace_files, trace_path, workload_name, combine_threads, use_cache, workers)
+
+    duration_list = workers.pool.starmap(get_file_duration_tuple, [(file, trace_path) for file in raw_trace_files])
 
-    pool = Pool()
-    duration_list = pool.starmap(get_file_duration_tuple, [(file, trace_path) for file in raw_trace_files])
-        
     worst_case_file, _ = max(duration_list, key=lambda x: x[1])
     print(worst_case_file)
 
 
-    worst_trace = get_cpu_dict(worst_case_file, trace_path, workload_name, combine_threads)
+    worst_trace = get_event_store(worst_case_file, trace_path, workload_name, combine_threads, use_cache)
+    return remove_workload(worst_trace, workload_name)
+
+def remove_workload(worst_trace, workload_name):
+    """
+    Removes the workload task from the worst trace so only noise remains.
 
+    Args:
+        worst_trace (EventStore, duration): The trace data for the worst trace (with CPU task timings).
+        workload_name (str): The name of the task representing the workload.
+
+    Returns:
+        tuple: A tuple containing the event store and the total duration.
+    """
     if DEBUG == True:
-        fig, ax = plt.subplots()
-        for cpu, task_dict in worst_trace[0].items():
-            color = iter(cm.rainbow(np.linspace(0, 1, len(task_dict.keys()))))
-            for task, timings in task_dict.items():
-                c = next(color)
-                for timing in timings:
-                    ax.barh(cpu, width=timing[1], left=timing[0], color=c)
-        plt.show()
-
-    for cpu in worst_trace[0].keys():
-        if worst_trace[0][cpu].pop(workload_name, None) != None:
+        plot_event_store(worst_trace[0])
+
+    for cpu in worst_trace[0].cpus():
+        if worst_trace[0].has(cpu, workload_name):
             print("Workload removed")
-            #del worst_trace[0][cpu][workload_name]
+    worst_trace[0].remove_task(workload_name)
 
     if DEBUG == True:
-        fig, ax = plt.subplots()
-        for cpu, task_dict in worst_trace[0].items():
-            color = iter(cm.rainbow(np.linspace(0, 1, len(task_dict.keys()))))
-            for task, timings in task_dict.items():
-                c = next(color)
-                for timing in timings:
-                    ax.barh(cpu, width=timing[1], left=timing[0], color=c)
-        plt.show()
+        plot_event_store(worst_trace[0])
 
     return worst_trace
 